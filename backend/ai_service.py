@@ -5,13 +5,19 @@ Breaks down assignments into micro-tasks with stakes and bounties
 
 import google.generativeai as genai
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 import os
 from dotenv import load_dotenv
 import json
 
+from log import get_logger
+from metrics import track, llm_calls
+from optimizer import HOURS_PER_DAY, TIERS, complexity_tier, optimize
+
 load_dotenv()
 
+logger = get_logger("ai")
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 if not GEMINI_API_KEY:
@@ -35,6 +41,65 @@ class QuestLog(BaseModel):
     tasks: List[MicroTask]
 
 
+# === Response parsing & scheduling helpers (pure, benchmarked in benchmarks/bench_ai.py) ===
+
+def strip_code_fences(text: str) -> str:
+    """Remove the markdown code fences Gemini sometimes wraps JSON in"""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def parse_quest_log(response_text: str) -> QuestLog:
+    """Validate a (possibly fenced) breakdown response; raises ValueError"""
+    return QuestLog.model_validate_json(strip_code_fences(response_text))
+
+
+def build_slots_by_day(available_hours: List[dict]) -> Dict[int, List[int]]:
+    """
+    Free hours per dayIndex; days whose slots are all blocked map to []
+    
+    Slots with a day or hour that isn't a whole number in range are dropped.
+    """
+    slots_by_day: Dict[int, List[int]] = {}
+    for slot in available_hours:
+        day, hour = slot.get("dayIndex"), slot.get("hour")
+        if not all(isinstance(v, int) and not isinstance(v, bool) for v in (day, hour)) \
+                or day < 0 or not 0 <= hour < HOURS_PER_DAY:
+            continue
+        hours = slots_by_day.setdefault(day, [])
+        if not slot.get("isBlocked", False) and hour not in hours:
+            hours.append(hour)
+    return slots_by_day
+
+
+def describe_tasks(tasks: List[dict]) -> str:
+    """One prompt line per task with its length and complexity tier"""
+    lines = []
+    for task in tasks:
+        complexity = TIERS[complexity_tier(task.get("stake", 10))]
+        lines.append(f"- {task['title']}: {task.get('estimatedMinutes', 60)} minutes, Complexity: {complexity}")
+    return "\n".join(lines)
+
+
+def describe_availability(slots_by_day: Dict[int, List[int]]) -> str:
+    """One prompt line per day that has free hours"""
+    return "\n".join(
+        f"Day {day}: {len(hours)} free hours ({min(hours)}-{max(hours)} available)"
+        for day, hours in sorted(slots_by_day.items()) if hours
+    )
+
+
+def fallback_schedule(tasks: List[dict], slots_by_day: Dict[int, List[int]]) -> dict:
+    """Schedule without Gemini using the rule-scoring optimizer"""
+    return {**optimize(tasks, slots_by_day), "source": "optimizer"}
+
+
 class OddsMaker:
     """AI-powered task breakdown and valuation engine"""
     
@@ -75,11 +140,24 @@ Output ONLY valid JSON in this EXACT format:
 
 IMPORTANT: Return ONLY the JSON, no other text or markdown."""
 
+    MODEL_NAME = "gemini-2.5-flash"
+    
     def __init__(self):
         """Initialize Gemini model"""
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
-        print("✓ Gemini Odds Maker initialized (gemini-2.5-flash)")
+        self.model = genai.GenerativeModel(self.MODEL_NAME)
+        logger.info("odds_maker_ready", extra={"model": self.MODEL_NAME})
+    
+    @track("llm", "warmup")
+    def warmup(self) -> None:
+        """
+        Verify the API key and reach Gemini without spending tokens
+        
+        Fetching the model's metadata also opens the client's connection,
+        so the first real breakdown doesn't pay for the handshake.
+        """
+        genai.get_model(f"models/{self.MODEL_NAME}")
     
+    @track("llm", "breakdown_assignment")
     def breakdown_assignment(self, assignment_text: str) -> QuestLog:
         """
         Break down a large assignment into micro-tasks with stakes and bounties
@@ -94,7 +172,7 @@ IMPORTANT: Return ONLY the JSON, no other text or markdown."""
             # Construct the full prompt
             full_prompt = f"{self.SYSTEM_PROMPT}\n\n**Assignment to break down:**\n{assignment_text}"
             
-            print(f"📝 Sending assignment to Gemini AI...")
+            logger.debug("breakdown_request", extra={"prompt_chars": len(full_prompt)})
             
             # Generate response
             response = self.model.generate_content(full_prompt)
@@ -102,40 +180,30 @@ IMPORTANT: Return ONLY the JSON, no other text or markdown."""
             # Get text response
             response_text = response.text.strip()
             
-            print(f"📥 Received response from Gemini ({len(response_text)} chars)")
-            
-            # Clean up response (remove markdown code blocks if present)
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
+            logger.debug("breakdown_response", extra={"response_chars": len(response_text)})
             
-            # Parse JSON
+            # Parse JSON (markdown code fences are stripped first)
             try:
-                quest_log = QuestLog.model_validate_json(response_text)
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON Parse Error: {e}")
-                print(f"Response preview: {response_text[:200]}...")
+                quest_log = parse_quest_log(response_text)
+            except ValueError as e:
+                logger.warning("breakdown_parse_error", extra={"error": str(e), "preview": response_text[:200]})
                 raise
             
-            print(f"✓ Generated {len(quest_log.tasks)} micro-tasks from assignment")
+            logger.info("breakdown_generated", extra={"tasks": len(quest_log.tasks)})
+            llm_calls.inc("breakdown_assignment", "ok")
             
             # Validate task count
             if len(quest_log.tasks) < 3:
-                print(f"⚠️ Warning: Only {len(quest_log.tasks)} tasks generated. Assignment might be too simple.")
+                logger.warning("breakdown_few_tasks", extra={"tasks": len(quest_log.tasks)})
             
             return quest_log
             
         except Exception as e:
-            print(f"❌ Error in AI breakdown: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("breakdown_failed", extra={"error_type": type(e).__name__, "fallback": True})
+            llm_calls.inc("breakdown_assignment", "error")
+            llm_calls.inc("breakdown_assignment", "fallback")
             
             # Return a MORE detailed fallback with multiple tasks
-            print("⚠️ Using fallback task list")
             return QuestLog(tasks=[
                 MicroTask(
                     id="task_1",
@@ -163,6 +231,7 @@ IMPORTANT: Return ONLY the JSON, no other text or markdown."""
                 )
             ])
     
+    @track("llm", "schedule_tasks")
     def schedule_tasks(self, tasks: List[dict], available_hours: List[dict]) -> dict:
         """
         Use AI to intelligently schedule tasks into available time slots
@@ -174,27 +243,13 @@ IMPORTANT: Return ONLY the JSON, no other text or markdown."""
         Returns:
             dict with scheduled tasks and reasoning
         """
+        # Count available slots per day (also needed by the fallback)
+        slots_by_day = build_slots_by_day(available_hours)
+        
         try:
             # Build prompt for AI scheduler
-            tasks_description = "\n".join([
-                f"- {task['title']}: {task.get('estimatedMinutes', 60)} minutes, "
-                f"Complexity: {'simple' if task.get('stake', 10) < 15 else 'moderate' if task.get('stake', 10) < 25 else 'complex'}"
-                for task in tasks
-            ])
-            
-            # Count available slots per day
-            slots_by_day = {}
-            for slot in available_hours:
-                day = slot['dayIndex']
-                if day not in slots_by_day:
-                    slots_by_day[day] = []
-                if not slot.get('isBlocked', False):
-                    slots_by_day[day].append(slot['hour'])
-            
-            available_description = "\n".join([
-                f"Day {day}: {len(hours)} free hours ({min(hours)}-{max(hours)} available)"
-                for day, hours in sorted(slots_by_day.items()) if hours
-            ])
+            tasks_description = describe_tasks(tasks)
+            available_description = describe_availability(slots_by_day)
             
             prompt = f"""You are a productivity AI scheduling assistant. Schedule these tasks optimally:
 
@@ -224,36 +279,14 @@ Return ONLY valid JSON in this format:
 }}"""
             
             response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean up response
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.startswith("```"):
-                response_text = response_text[3:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            result = json.loads(response_text)
-            print(f"✓ AI scheduled {len(result.get('schedule', []))} tasks")
+            result = json.loads(strip_code_fences(response.text))
+            result["source"] = "llm"
+            logger.info("schedule_generated", extra={"tasks": len(result.get("schedule", []))})
+            llm_calls.inc("schedule_tasks", "ok")
             return result
             
         except Exception as e:
-            print(f"❌ Error in AI scheduling: {e}")
-            # Fallback: simple sequential scheduling
-            schedule = []
-            task_idx = 0
-            for day, hours in sorted(slots_by_day.items()):
-                if task_idx >= len(tasks):
-                    break
-                if hours:
-                    schedule.append({
-                        "taskIndex": task_idx,
-                        "dayIndex": day,
-                        "startHour": min(hours),
-                        "reasoning": "Auto-scheduled to next available slot"
-                    })
-                    task_idx += 1
-            
-            return {"schedule": schedule}
+            logger.warning("schedule_failed", extra={"error_type": type(e).__name__, "error": str(e), "fallback": True})
+            llm_calls.inc("schedule_tasks", "error")
+            llm_calls.inc("schedule_tasks", "fallback")
+            return fallback_schedule(tasks, slots_by_day)
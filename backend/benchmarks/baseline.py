@@ -0,0 +1,59 @@
+"""
+ChronoCharm - Benchmark Baselines
+Save benchmark results as JSON and flag regressions against a saved run
+
+Results are {case: {metric: value}}. Baselines live in
+benchmarks/baselines/<name>.json and are meant to be committed alongside
+changes that intentionally move the numbers.
+"""
+
+import json
+import os
+import platform
+import time
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def path_for(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save(name: str, results: dict, config: dict) -> str:
+    """Write results plus the run configuration; returns the file path"""
+    path = path_for(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "config": config,
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
+
+
+def load(name: str) -> dict:
+    with open(path_for(name)) as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict, higher_is_better: set, tolerance: float) -> list[str]:
+    """
+    Regressions beyond tolerance (0.2 = 20%) of every metric both runs share
+
+    Metrics in higher_is_better (throughput) regress when they drop; all
+    others (latencies, allocations) regress when they grow.
+    """
+    regressions = []
+    for case, metrics in current.items():
+        for metric, value in metrics.items():
+            before = baseline.get(case, {}).get(metric)
+            if not isinstance(before, (int, float)) or not before:
+                continue
+            change = (value - before) / before
+            worse = -change if metric in higher_is_better else change
+            if worse > tolerance:
+                regressions.append(f"{case} {metric}: {before:g} -> {value:g} ({change:+.0%})")
+    return regressions
@@ -0,0 +1,169 @@
+"""
+ChronoCharm - AI Parsing & Scheduling Microbenchmarks
+Ops/sec and allocations for the CPU-bound helpers in ai_service
+
+Covers fence stripping and QuestLog validation on synthetic Gemini
+responses (10 to 1,000 tasks), slots_by_day construction and the
+optimizer's greedy pass (1 to 12 weeks of hourly availability). Its local
+search runs for a fixed time budget, so it is left out of the timings.
+Nothing here calls Gemini.
+
+Timing is the best of --repeat runs of an auto-sized loop (timeit), with
+GC disabled. Allocation columns come from one traced call: peak KiB is
+the high-water mark of memory allocated during the call, blocks is the
+number of allocations still alive afterwards (i.e. held by the result).
+
+Usage (from backend/):
+    python benchmarks/bench_ai.py [--filter parse] [--repeat 5]
+    python benchmarks/bench_ai.py --save-baseline main
+    python benchmarks/bench_ai.py --compare main [--tolerance 0.15]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import baseline
+from ai_service import (
+    build_slots_by_day,
+    describe_availability,
+    parse_quest_log,
+    strip_code_fences,
+)
+from optimizer import optimize
+
+TASK_COUNTS = (10, 100, 1000)
+WEEK_COUNTS = (1, 4, 12)
+HIGHER_IS_BETTER = {"ops_per_sec"}
+
+
+# === Synthetic inputs ===
+
+def quest_response(tasks: int) -> str:
+    """A fenced breakdown response shaped like Gemini's"""
+    body = json.dumps({"tasks": [
+        {
+            "id": f"task_{i}",
+            "title": f"Draft paragraph {i} of the essay using two sources",
+            "duration_minutes": 5,
+            "required_stake": 5 + i % 40,
+            "reward_bounty": 15 + i % 40 * 2,
+            "encouragement_quote": "The scroll awaits your first mark..."
+        }
+        for i in range(1, tasks + 1)
+    ]}, indent=2)
+    return f"```json\n{body}\n```"
+
+
+def schedule_tasks(tasks: int) -> list[dict]:
+    return [
+        {"title": f"Task {i}", "estimatedMinutes": 30 + i % 4 * 15, "stake": 5 + i % 45}
+        for i in range(tasks)
+    ]
+
+
+def available_hours(weeks: int) -> list[dict]:
+    """Hourly 6:00-22:00 slots per day with a fixed pseudo-random third blocked"""
+    rng = random.Random(weeks)
+    return [
+        {"dayIndex": day, "hour": hour, "isBlocked": rng.random() < 0.33}
+        for day in range(weeks * 7)
+        for hour in range(6, 23)
+    ]
+
+
+def cases() -> dict:
+    """name -> zero-argument callable; inputs are built once, outside the timing"""
+    suite = {}
+    for n in TASK_COUNTS:
+        text = quest_response(n)
+        suite[f"strip_code_fences/{n}"] = lambda text=text: strip_code_fences(text)
+        suite[f"parse_quest_log/{n}"] = lambda text=text: parse_quest_log(text)
+    for weeks in WEEK_COUNTS:
+        hours = available_hours(weeks)
+        slots = build_slots_by_day(hours)
+        suite[f"build_slots_by_day/{weeks}w"] = lambda hours=hours: build_slots_by_day(hours)
+        suite[f"describe_availability/{weeks}w"] = lambda slots=slots: describe_availability(slots)
+        for n in TASK_COUNTS:
+            tasks = schedule_tasks(n)
+            suite[f"optimize_greedy/{n}x{weeks}w"] = (
+                lambda tasks=tasks, slots=slots: optimize(tasks, slots, time_budget_ms=0)
+            )
+    return suite
+
+
+# === Measurement ===
+
+def measure(func, repeat: int) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+    del result
+
+    return {
+        "ops_per_sec": round(1 / best, 1),
+        "us_per_op": round(best * 1e6, 2),
+        "peak_kib": round(peak / 1024, 1),
+        "blocks": retained,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--filter", default="", help="only run cases containing this substring")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="baseline to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    previous = baseline.load(args.compare)["results"] if args.compare else {}
+    results = {}
+    print(f"{'case':<34} {'ops/sec':>12} {'us/op':>10} {'peak KiB':>10} {'blocks':>8} {'vs base':>8}")
+    for name, func in cases().items():
+        if args.filter not in name:
+            continue
+        row = results[name] = measure(func, args.repeat)
+        before = previous.get(name, {}).get("ops_per_sec")
+        delta = f"{row['ops_per_sec'] / before - 1:+.0%}" if before else ""
+        print(f"{name:<34} {row['ops_per_sec']:>12,.0f} {row['us_per_op']:>10.2f} "
+              f"{row['peak_kib']:>10.1f} {row['blocks']:>8} {delta:>8}")
+
+    if args.save_baseline:
+        path = baseline.save(args.save_baseline, results, {"repeat": args.repeat, "filter": args.filter})
+        print(f"\nBaseline saved to {path}")
+    if args.compare:
+        # us_per_op mirrors ops_per_sec, and blocks is small and discrete enough
+        # that one extra object would trip any percentage tolerance
+        current = {name: {k: row[k] for k in ("ops_per_sec", "peak_kib")} for name, row in results.items()}
+        regressions = baseline.compare(current, previous, HIGHER_IS_BETTER, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against '{args.compare}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+ChronoCharm - Response Path Microbenchmark
+Requests/second on /api/balance and /api/stats, legacy vs fast path
+
+Runs the real ASGI app in-process (httpx ASGITransport) with the ledger
+reads replaced by constant in-memory documents, so the numbers isolate
+routing, validation and serialization cost rather than Mongo latency.
+The "before" routes are the pre-fast-path handlers, mounted on the same
+app so both go through identical middleware.
+
+Usage (from backend/):
+    python benchmarks/bench_responses.py [--seconds 3] [--concurrency 16]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+
+import main
+from database import DEFAULT_STATS, ManaLedger
+
+USER = {
+    "user_id": "bench",
+    "balance": 1234,
+    "total_earned": 560,
+    "total_lost": 40,
+    "quests_completed": 17,
+}
+STATS = dict(DEFAULT_STATS, xp=2500, level=6, badges=["Level 5", "7-Day Streak"], version=42)
+
+
+async def fake_get_or_create_user(user_id: str = "default", projection=None) -> dict:
+    return dict(USER)
+
+
+async def fake_get_stats(user_id: str = "default") -> dict:
+    return dict(STATS)
+
+
+@main.app.get("/bench/before/balance", response_model=main.BalanceResponse)
+async def balance_before(user_id: str = "default"):
+    user = await ManaLedger.get_or_create_user(user_id)
+    return main.BalanceResponse(
+        user_id=user["user_id"],
+        balance=user["balance"],
+        total_earned=user["total_earned"],
+        total_lost=user["total_lost"],
+        quests_completed=user["quests_completed"]
+    )
+
+
+@main.app.get("/bench/before/stats")
+async def stats_before(user_id: str = "default"):
+    stats = await ManaLedger.get_stats(user_id)
+    return main.RPGStats(**{k: v for k, v in stats.items() if k != "_id" and k != "user_id"})
+
+
+async def measure(client: httpx.AsyncClient, path: str, seconds: float, concurrency: int) -> float:
+    """Requests per second sustained by `concurrency` looping clients"""
+    deadline = time.perf_counter() + seconds
+    done = 0
+
+    async def worker():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            response = await client.get(path, params={"user_id": "bench"})
+            response.raise_for_status()
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done / (time.perf_counter() - start)
+
+
+async def run(seconds: float, concurrency: int) -> None:
+    ManaLedger.get_or_create_user = staticmethod(fake_get_or_create_user)
+    ManaLedger.get_stats = staticmethod(fake_get_stats)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'endpoint':<10} {'before rps':>12} {'after rps':>12} {'speedup':>9}")
+        for name in ("balance", "stats"):
+            await measure(client, f"/api/{name}", 0.3, concurrency)  # warm up
+            before = await measure(client, f"/bench/before/{name}", seconds, concurrency)
+            after = await measure(client, f"/api/{name}", seconds, concurrency)
+            print(f"{name:<10} {before:>12.0f} {after:>12.0f} {after / before:>8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.concurrency))
@@ -0,0 +1,334 @@
+"""
+ChronoCharm - Load Test
+Concurrent user scenarios with per-endpoint throughput and p50/p95/p99
+
+Each virtual user loops through the core flow: breakdown an assignment,
+then for every task start a wager and complete it (won or lost). By
+default the ASGI app runs in-process with a stubbed Gemini (fixed,
+configurable latency) and an in-memory ledger, so runs are repeatable and
+free; --store mongo exercises the real ledger against MONGO_URI (use a
+throwaway local mongod), and --url drives an already running server.
+
+Usage (from backend/):
+    python benchmarks/loadtest.py [--users 50] [--seconds 10]
+    python benchmarks/loadtest.py --save-baseline main
+    python benchmarks/loadtest.py --compare main [--tolerance 0.2]
+
+--compare exits non-zero when any endpoint's throughput drops, or its
+latency percentiles grow, by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Admission control would otherwise shed most of a load test; override to measure it
+for _limit in ("LLM_USER_RATE", "LLM_USER_BURST", "LLM_GLOBAL_RATE", "LLM_GLOBAL_BURST", "LLM_QUEUE"):
+    os.environ.setdefault(_limit, "1000000")
+os.environ.setdefault("LLM_CONCURRENCY", "64")
+
+import httpx
+
+import baseline
+
+ASSIGNMENT = (
+    "Write a 5-paragraph persuasive essay on renewable energy. Include an "
+    "introduction, three body paragraphs with evidence, and a conclusion."
+)
+HIGHER_IS_BETTER = {"rps"}
+
+
+class LatencyRecorder:
+    """Client-side latencies and status codes per endpoint"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+
+    def add(self, endpoint: str, seconds: float, status: int) -> None:
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    @staticmethod
+    def percentile(ordered: list[float], pct: float) -> float:
+        """Nearest-rank percentile of an already sorted list"""
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+    def summary(self, elapsed: float) -> dict:
+        results = {}
+        everything = []
+        for endpoint in sorted(self.latencies):
+            ordered = sorted(self.latencies[endpoint])
+            everything.extend(ordered)
+            results[endpoint] = self._row(ordered, self.statuses[endpoint], elapsed)
+        if everything:
+            total = sum(self.statuses.values(), Counter())
+            results["all"] = self._row(sorted(everything), total, elapsed)
+        return results
+
+    def _row(self, ordered: list[float], statuses: Counter, elapsed: float) -> dict:
+        return {
+            "requests": len(ordered),
+            "errors": sum(count for status, count in statuses.items() if status >= 400),
+            "rps": round(len(ordered) / elapsed, 1),
+            "p50_ms": round(self.percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(self.percentile(ordered, 95) * 1000, 2),
+            "p99_ms": round(self.percentile(ordered, 99) * 1000, 2),
+        }
+
+
+# === Stubs ===
+
+def stub_llm(odds_maker, latency: float) -> None:
+    """Replace Gemini calls with canned responses after a fixed blocking delay"""
+    from ai_service import MicroTask, QuestLog
+
+    def breakdown_assignment(assignment_text: str) -> QuestLog:
+        time.sleep(latency)
+        count = 3
+        if "Generate exactly " in assignment_text:
+            count = int(assignment_text.split("Generate exactly ")[1].split()[0])
+        return QuestLog(tasks=[
+            MicroTask(
+                id=f"task_{i}", title=f"Step {i}", duration_minutes=5,
+                required_stake=5, reward_bounty=15, encouragement_quote="Onward."
+            )
+            for i in range(1, count + 1)
+        ])
+
+    def schedule_tasks(tasks: list, available_hours: list) -> dict:
+        time.sleep(latency)
+        return {"scheduled_tasks": [], "reasoning": "stub"}
+
+    odds_maker.breakdown_assignment = breakdown_assignment
+    odds_maker.schedule_tasks = schedule_tasks
+    odds_maker.warmup = lambda: None
+
+
+class MemoryLedger:
+    """
+    In-memory stand-in for the ManaLedger methods the scenario reaches
+
+    Applies the real progression rules and feeds the same in-memory read
+    models (leaderboards, version map, event bus) as the Mongo ledger; an
+    optional per-operation delay approximates a datastore round trip.
+    Daily rollups and quest log saves only pay that delay.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.users: dict[str, dict] = {}
+
+    def install(self) -> None:
+        from database import DailyRollups, ManaLedger
+        from quest_logs import QuestLogStore
+
+        for name in ("get_or_create_user", "deduct_stake", "award_bounty", "lose_stake"):
+            setattr(ManaLedger, name, staticmethod(getattr(self, name)))
+
+        async def record_rollup(*args, **kwargs) -> None:
+            await self._round_trip()
+
+        DailyRollups.record = staticmethod(record_rollup)
+
+        quest_ids = itertools.count(1)
+
+        async def create_quest_log(*args, **kwargs) -> str:
+            await self._round_trip()
+            return f"{next(quest_ids):024x}"
+
+        QuestLogStore.create = staticmethod(create_quest_log)
+
+    async def _round_trip(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    def _user(self, user_id: str) -> dict:
+        from database import ManaLedger
+
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = ManaLedger.new_user(user_id)
+        return user
+
+    async def get_or_create_user(self, user_id: str = "default", projection=None) -> dict:
+        from database import ManaLedger
+
+        await self._round_trip()
+        user = copy.deepcopy(self._user(user_id))
+        return ManaLedger._apply_projection(user, projection) if projection else user
+
+    async def deduct_stake(self, user_id: str, stake: int) -> dict:
+        from database import ManaLedger
+
+        await self._round_trip()
+        user = self._user(user_id)
+        if user["balance"] < stake:
+            raise ValueError(f"Insufficient Mana. Balance: {user['balance']}, Required: {stake}")
+        user["balance"] -= stake
+        user["balance_version"] += 1
+        ManaLedger._after_write(copy.deepcopy(user))
+        return copy.deepcopy(user)
+
+    async def award_bounty(self, user_id: str, bounty: int, stake: int, minutes_focused: int = 0,
+                           duration_minutes=None, day=None) -> dict:
+        import progression
+        from database import DEFAULT_STATS, ManaLedger
+
+        await self._round_trip()
+        user = self._user(user_id)
+        user["stats"] = progression.apply_quest_won(
+            dict(DEFAULT_STATS, **user["stats"]), bounty,
+            minutes_focused=minutes_focused, duration_minutes=duration_minutes,
+            today=progression.local_day(day)
+        )
+        user["balance"] += bounty + stake
+        user["total_earned"] += bounty
+        user["quests_completed"] += 1
+        user["balance_version"] += 1
+        user["stats_version"] += 1
+        ManaLedger._after_write(copy.deepcopy(user))
+        return copy.deepcopy(user)
+
+    async def lose_stake(self, user_id: str, stake: int, minutes_focused: int = 0) -> dict:
+        from database import ManaLedger
+
+        await self._round_trip()
+        user = self._user(user_id)
+        user["total_lost"] += stake
+        user["balance_version"] += 1
+        ManaLedger._after_write(copy.deepcopy(user))
+        return copy.deepcopy(user)
+
+
+# === Scenario ===
+
+async def timed(client: httpx.AsyncClient, recorder: LatencyRecorder, method: str, path: str,
+                **kwargs) -> httpx.Response:
+    start = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    recorder.add(f"{method} {path}", time.perf_counter() - start, response.status_code)
+    return response
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: LatencyRecorder, index: int,
+                       deadline: float, args: argparse.Namespace) -> None:
+    """breakdown -> (wager start -> wager complete) per task, until the deadline"""
+    user_id = f"load-{index}"
+    rng = random.Random(index)
+    while time.perf_counter() < deadline:
+        breakdown = await timed(client, recorder, "POST", "/api/breakdown", json={
+            "assignment": ASSIGNMENT, "taskCount": args.tasks, "user_id": user_id
+        })
+        if breakdown.status_code != 200:
+            await asyncio.sleep(args.think)
+            continue
+        for task in breakdown.json()["tasks"]:
+            if time.perf_counter() >= deadline:
+                return
+            minutes = int(task["estimatedTime"].split()[0])
+            start = await timed(client, recorder, "POST", "/api/wager/start", json={
+                "user_id": user_id, "task_id": task["id"], "stake": args.stake
+            })
+            if start.status_code != 200:
+                break
+            await asyncio.sleep(args.think)
+            won = rng.random() < args.win_rate
+            await timed(client, recorder, "POST", "/api/wager/complete", json={
+                "user_id": user_id, "task_id": task["id"], "stake": args.stake,
+                "bounty": args.stake * 3, "won": won,
+                "minutes_focused": minutes, "duration_minutes": minutes
+            })
+            await timed(client, recorder, "GET", "/api/balance", params={"user_id": user_id})
+
+
+async def drive(client: httpx.AsyncClient, args: argparse.Namespace) -> tuple[LatencyRecorder, float]:
+    if args.warmup:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(
+            virtual_user(client, LatencyRecorder(), i, deadline, args) for i in range(args.users)
+        ))
+    recorder = LatencyRecorder()
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    await asyncio.gather(*(virtual_user(client, recorder, i, deadline, args) for i in range(args.users)))
+    return recorder, time.perf_counter() - start
+
+
+async def run(args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+            recorder, elapsed = await drive(client, args)
+        return recorder.summary(elapsed)
+
+    import main
+
+    stub_llm(main.odds_maker, args.llm_latency_ms / 1000)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        if args.store == "memory":
+            MemoryLedger(args.store_latency_ms / 1000).install()
+            recorder, elapsed = await drive(client, args)
+        else:
+            async with main.app.router.lifespan_context(main.app):
+                recorder, elapsed = await drive(client, args)
+    return recorder.summary(elapsed)
+
+
+def print_report(results: dict) -> None:
+    print(f"{'endpoint':<26} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in results.items():
+        print(f"{endpoint:<26} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9.1f} "
+              f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--seconds", type=float, default=10.0, help="measured duration")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured warmup duration")
+    parser.add_argument("--tasks", type=int, default=3, help="tasks per breakdown")
+    parser.add_argument("--stake", type=int, default=5)
+    parser.add_argument("--win-rate", type=float, default=0.8)
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between wager start and complete")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="stubbed Gemini latency")
+    parser.add_argument("--store", choices=("memory", "mongo"), default="memory")
+    parser.add_argument("--store-latency-ms", type=float, default=1.0, help="simulated round trip (memory store)")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME", help="baseline to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare", "tolerance")}
+    if args.save_baseline:
+        print(f"\nBaseline saved to {baseline.save(args.save_baseline, results, config)}")
+    if args.compare:
+        previous = baseline.load(args.compare)
+        if previous["config"] != config:
+            print(f"\nNote: baseline was recorded with a different configuration: {previous['config']}")
+        regressions = baseline.compare(results, previous["results"], HIGHER_IS_BETTER, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against '{args.compare}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
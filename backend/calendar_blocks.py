@@ -0,0 +1,407 @@
+"""
+ChronoCharm - Calendar Blocks
+Persisted busy blocks (one-off, multi-hour, recurring) with an interval index
+
+Blocks are stored per user in one `calendars` document, keyed by block id,
+with a version counter bumped on every change. Times are whole hours,
+addressed as absolute hour indexes (date ordinal * 24 + hour), so an event
+may run past midnight.
+
+For queries the blocks are expanded over a window (recurrences included)
+into an IntervalIndex: sorted, merged busy intervals plus a max segment
+tree over the gaps between them. "Free runs of at least N hours between A
+and B" is a bisect to find the window plus a descent that only enters
+subtrees holding a long enough gap, i.e. O(log n + k) for k results.
+Indexes are cached per user and reused until the calendar's version moves.
+
+A calendar may also hold an availability template: free windows shaped
+like blocks (usually recurring, e.g. weekdays 9-17) minus exceptions
+(e.g. a holiday). Without one every hour not blocked is free. Templates
+are expanded lazily, one day mask at a time, over just the window being
+queried, so neither the stored template nor a request grows with the
+horizon.
+"""
+
+import bisect
+import os
+import uuid
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Iterator, Optional
+
+from database import Database
+from events import event_bus
+from metrics import cache_lookup, track
+
+# Days past the first requested day that a cached index covers
+CALENDAR_HORIZON_DAYS = int(os.getenv("CALENDAR_HORIZON_DAYS", "365"))
+CALENDAR_CACHE_SIZE = int(os.getenv("CALENDAR_CACHE_SIZE", "1024"))
+
+HOURS_PER_DAY = 24
+FULL_DAY = (1 << HOURS_PER_DAY) - 1
+MAX_BLOCK_HOURS = 7 * HOURS_PER_DAY
+MAX_QUERY_DAYS = 366
+MAX_TEMPLATE_WINDOWS = 100
+REPEAT_RULES = ("daily", "weekdays", "weekly")
+
+
+def parse_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def hour_index(day: date, hour: int = 0) -> int:
+    return day.toordinal() * HOURS_PER_DAY + hour
+
+
+def from_hour_index(index: int) -> tuple[date, int]:
+    return date.fromordinal(index // HOURS_PER_DAY), index % HOURS_PER_DAY
+
+
+def occurrences(start: date, repeat: Optional[str], until: Optional[date],
+                first: date, last: date) -> Iterator[date]:
+    """Days in [first, last] on which something starting on `start` recurs"""
+    if repeat is None:
+        if first <= start <= last:
+            yield start
+        return
+    if repeat not in REPEAT_RULES:
+        raise ValueError(f"Unknown repeat '{repeat}'. Choose from: {', '.join(REPEAT_RULES)}")
+    end = min(last, until) if until else last
+    step = 7 if repeat == "weekly" else 1
+    day = start
+    if first > start:
+        day += timedelta(days=-(-(first - start).days // step) * step)
+    while day <= end:
+        if repeat != "weekdays" or day.weekday() < 5:
+            yield day
+        day += timedelta(days=step)
+
+
+def validate_block(title: str, day: str, hour: int, hours: int,
+                   repeat: Optional[str] = None, until: Optional[str] = None) -> dict:
+    """A block document from request fields; raises ValueError"""
+    start = parse_day(day)
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in (hour, hours)):
+        raise ValueError("hour and hours must be whole numbers")
+    if not 0 <= hour < HOURS_PER_DAY:
+        raise ValueError("hour must be between 0 and 23")
+    if not 1 <= hours <= MAX_BLOCK_HOURS:
+        raise ValueError(f"hours must be between 1 and {MAX_BLOCK_HOURS}")
+    if repeat is not None and repeat not in REPEAT_RULES:
+        raise ValueError(f"Unknown repeat '{repeat}'. Choose from: {', '.join(REPEAT_RULES)}")
+    if until is not None and (repeat is None or parse_day(until) < start):
+        raise ValueError("until needs a repeat and must not be before date")
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "title": title,
+        "date": start.isoformat(),
+        "hour": hour,
+        "hours": hours,
+        "repeat": repeat,
+        "until": until,
+    }
+
+
+def _window(fields: dict, default_hours: int) -> dict:
+    """A validated availability window or exception (must end by midnight)"""
+    block = validate_block("", fields.get("date"), fields.get("hour", 0), fields.get("hours", default_hours),
+                           fields.get("repeat"), fields.get("until"))
+    if block["hour"] + block["hours"] > HOURS_PER_DAY:
+        raise ValueError("Availability windows and exceptions must end by midnight")
+    return {key: block[key] for key in ("date", "hour", "hours", "repeat", "until")}
+
+
+def validate_availability(windows: list[dict], exceptions: list[dict]) -> dict:
+    """An availability template from request fields; exceptions default to the whole day"""
+    if len(windows) + len(exceptions) > MAX_TEMPLATE_WINDOWS:
+        raise ValueError(f"At most {MAX_TEMPLATE_WINDOWS} windows and exceptions")
+    return {
+        "windows": [_window(window, 1) for window in windows],
+        "exceptions": [_window(exception, HOURS_PER_DAY) for exception in exceptions],
+    }
+
+
+def _parsed(windows: list[dict]) -> list[tuple]:
+    return [
+        (parse_day(w["date"]), w.get("repeat"), parse_day(w["until"]) if w.get("until") else None,
+         ((1 << w["hours"]) - 1) << w["hour"])
+        for w in windows
+    ]
+
+
+def _day_mask(windows: list[tuple], day: date) -> int:
+    mask = 0
+    for start, repeat, until, hours in windows:
+        if next(occurrences(start, repeat, until, day, day), None):
+            mask |= hours
+    return mask
+
+
+def expand_availability(template: dict, first: date, last: date) -> Iterator[tuple[date, int]]:
+    """(day, mask of available hours) for each day first..last, computed as iterated"""
+    windows, exceptions = _parsed(template["windows"]), _parsed(template["exceptions"])
+    day = first
+    while day <= last:
+        yield day, _day_mask(windows, day) & ~_day_mask(exceptions, day)
+        day += timedelta(days=1)
+
+
+def _mask_runs(mask: int, day: date) -> Iterator[tuple[int, int]]:
+    """Runs of set bits in a day mask as absolute hour intervals"""
+    origin = hour_index(day)
+    hour = 0
+    while mask >> hour:
+        if mask >> hour & 1:
+            start = hour
+            while mask >> hour & 1:
+                hour += 1
+            yield origin + start, origin + hour
+        else:
+            hour += 1
+
+
+class IntervalIndex:
+    """Busy time as sorted, merged half-open hour intervals"""
+
+    def __init__(self, intervals):
+        starts, ends = [], []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts = starts
+        self.ends = ends
+
+        # Leaf k holds the gap between interval k and k+1; inner nodes the max below
+        gaps = [starts[k + 1] - ends[k] for k in range(len(starts) - 1)]
+        self.size = 1
+        while self.size < len(gaps):
+            self.size *= 2
+        self.tree = [0] * (2 * self.size)
+        self.tree[self.size:self.size + len(gaps)] = gaps
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def is_free(self, start: int, end: int) -> bool:
+        k = bisect.bisect_right(self.ends, start)
+        return k == len(self.starts) or self.starts[k] >= end
+
+    def busy(self, start: int, end: int) -> list[tuple[int, int]]:
+        """Busy intervals overlapping [start, end), clipped to it"""
+        k = bisect.bisect_right(self.ends, start)
+        result = []
+        while k < len(self.starts) and self.starts[k] < end:
+            result.append((max(self.starts[k], start), min(self.ends[k], end)))
+            k += 1
+        return result
+
+    def _gaps_at_least(self, lo: int, hi: int, length: int) -> Iterator[int]:
+        """Gap indexes in [lo, hi] of at least `length`, in order"""
+        stack = [(1, 0, self.size - 1)]
+        while stack:
+            node, left, right = stack.pop()
+            if right < lo or left > hi or self.tree[node] < length:
+                continue
+            if left == right:
+                yield left
+                continue
+            mid = (left + right) // 2
+            stack.append((2 * node + 1, mid + 1, right))
+            stack.append((2 * node, left, mid))
+
+    def free(self, start: int, end: int, length: int = 1) -> list[tuple[int, int]]:
+        """Maximal free runs within [start, end) lasting at least `length` hours"""
+        if end - start < length:
+            return []
+        first = bisect.bisect_right(self.ends, start)
+        last = bisect.bisect_left(self.starts, end) - 1
+        if first > last:
+            return [(start, end)]
+        result = []
+        if self.starts[first] - start >= length:
+            result.append((start, self.starts[first]))
+        result.extend((self.ends[k], self.starts[k + 1]) for k in self._gaps_at_least(first, last - 1, length))
+        if end - self.ends[last] >= length:
+            result.append((self.ends[last], end))
+        return result
+
+
+def build_index(blocks: dict, first: date, last: date) -> IntervalIndex:
+    """Index of every block occurrence touching days first..last"""
+    intervals = []
+    for block in blocks.values():
+        spill = (block["hour"] + block["hours"] - 1) // HOURS_PER_DAY
+        until = parse_day(block["until"]) if block.get("until") else None
+        for day in occurrences(parse_day(block["date"]), block.get("repeat"), until,
+                               first - timedelta(days=spill), last):
+            start = hour_index(day, block["hour"])
+            intervals.append((start, start + block["hours"]))
+    return IntervalIndex(intervals)
+
+
+class IndexCache:
+    """LRU of each user's last-built index and template, valid while the version matches"""
+
+    def __init__(self, size: int = CALENDAR_CACHE_SIZE):
+        self.size = size
+        self._entries: OrderedDict[str, tuple[int, date, date, tuple]] = OrderedDict()
+
+    def get(self, user_id: str, version: int, first: date, last: date) -> Optional[tuple]:
+        entry = self._entries.get(user_id)
+        hit = entry is not None and entry[0] == version and entry[1] <= first and last <= entry[2]
+        cache_lookup("calendar_index", hit)
+        if not hit:
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[3]
+
+    def put(self, user_id: str, version: int, first: date, last: date, calendar: tuple) -> None:
+        self._entries[user_id] = (version, first, last, calendar)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+index_cache = IndexCache()
+
+
+class CalendarStore:
+    """Mongo persistence for one calendar document per user"""
+
+    @staticmethod
+    @track("mongo", "calendar_get")
+    async def get(user_id: str) -> dict:
+        db = Database.get_db(user_id)
+        doc = await db.calendars.find_one({"user_id": user_id}, {"_id": 0, "user_id": 0})
+        return {"version": 0, "blocks": {}, "availability": None, **(doc or {})}
+
+    @staticmethod
+    @track("mongo", "calendar_version")
+    async def version(user_id: str) -> int:
+        db = Database.get_db(user_id)
+        doc = await db.calendars.find_one({"user_id": user_id}, {"_id": 0, "version": 1})
+        return doc["version"] if doc else 0
+
+    @staticmethod
+    @track("mongo", "calendar_add_block")
+    async def add_block(user_id: str, block: dict) -> int:
+        """Store a validated block; returns the new calendar version"""
+        db = Database.get_db(user_id)
+        saved = await db.calendars.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": {f"blocks.{block['id']}": block}, "$inc": {"version": 1}},
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=True
+        )
+        event_bus.publish(user_id, "calendar", {"version": saved["version"]})
+        return saved["version"]
+
+    @staticmethod
+    @track("mongo", "calendar_remove_block")
+    async def remove_block(user_id: str, block_id: str) -> int:
+        """Delete a block; raises LookupError if it does not exist"""
+        db = Database.get_db(user_id)
+        saved = await db.calendars.find_one_and_update(
+            {"user_id": user_id, f"blocks.{block_id}": {"$exists": True}},
+            {"$unset": {f"blocks.{block_id}": ""}, "$inc": {"version": 1}},
+            projection={"_id": 0, "version": 1},
+            return_document=True
+        )
+        if saved is None:
+            raise LookupError(f"Unknown block '{block_id}'")
+        event_bus.publish(user_id, "calendar", {"version": saved["version"]})
+        return saved["version"]
+
+    @staticmethod
+    @track("mongo", "calendar_set_availability")
+    async def set_availability(user_id: str, template: Optional[dict]) -> int:
+        """Replace (or with None, clear) the availability template; returns the new version"""
+        db = Database.get_db(user_id)
+        saved = await db.calendars.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": {"availability": template}, "$inc": {"version": 1}},
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=True
+        )
+        event_bus.publish(user_id, "calendar", {"version": saved["version"]})
+        return saved["version"]
+
+    @classmethod
+    async def calendar(cls, user_id: str, first: date, last: date) -> tuple[IntervalIndex, Optional[dict]]:
+        """
+        Block index covering days first..last, plus the availability template
+
+        A cache hit costs one version-only read; a miss loads the calendar and
+        indexes CALENDAR_HORIZON_DAYS ahead so later windows hit too.
+        """
+        cached = index_cache.get(user_id, await cls.version(user_id), first, last)
+        if cached is not None:
+            return cached
+        doc = await cls.get(user_id)
+        horizon = max(last, first + timedelta(days=CALENDAR_HORIZON_DAYS))
+        calendar = (build_index(doc["blocks"], first, horizon), doc["availability"])
+        index_cache.put(user_id, doc["version"], first, horizon, calendar)
+        return calendar
+
+    @classmethod
+    async def window_index(cls, user_id: str, first: date, last: date,
+                           availability: Optional[dict] = None) -> IntervalIndex:
+        """
+        Busy time for days first..last: blocks, plus hours outside the template
+
+        An explicit template overrides the stored one. Without any template
+        the cached block index is used as-is; with one, only this window's
+        days are expanded into a fresh index.
+        """
+        index, stored = await cls.calendar(user_id, first, last)
+        template = availability or stored
+        if template is None:
+            return index
+        intervals = index.busy(hour_index(first), hour_index(last, HOURS_PER_DAY))
+        for day, mask in expand_availability(template, first, last):
+            intervals.extend(_mask_runs(~mask & FULL_DAY, day))
+        return IntervalIndex(intervals)
+
+    @classmethod
+    async def free_slots(cls, user_id: str, start: date, days: int, min_hours: int = 1,
+                         availability: Optional[dict] = None) -> list[dict]:
+        """Free runs of at least min_hours in the `days` days from start"""
+        if not 1 <= days <= MAX_QUERY_DAYS:
+            raise ValueError(f"days must be between 1 and {MAX_QUERY_DAYS}")
+        last = start + timedelta(days=days - 1)
+        index = await cls.window_index(user_id, start, last, availability)
+        origin = hour_index(start)
+        slots = []
+        for begin, end in index.free(origin, hour_index(last, HOURS_PER_DAY), max(1, min_hours)):
+            day, hour = from_hour_index(begin)
+            slots.append({
+                "date": day.isoformat(),
+                "dayIndex": (begin - origin) // HOURS_PER_DAY,
+                "hour": hour,
+                "hours": end - begin,
+            })
+        return slots
+
+    @classmethod
+    async def available_hours(cls, user_id: str, start: date, days: int,
+                              availability: Optional[dict] = None) -> list[dict]:
+        """Free hours from start in the per-hour shape /api/schedule takes"""
+        return [
+            {"dayIndex": (slot["dayIndex"] * HOURS_PER_DAY + slot["hour"] + i) // HOURS_PER_DAY,
+             "hour": (slot["hour"] + i) % HOURS_PER_DAY,
+             "isBlocked": False}
+            for slot in await cls.free_slots(user_id, start, days, availability=availability)
+            for i in range(slot["hours"])
+        ]
@@ -4,136 +4,647 @@ Manages user Mana balances and quest state
 """
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from contextvars import ContextVar
 from typing import Optional
+from datetime import datetime, timedelta, timezone
+import asyncio
 import os
 from dotenv import load_dotenv
 
+from pymongo import DeleteOne, ReplaceOne, ReturnDocument
+
+from events import event_bus
+from leaderboard import leaderboards
+from versions import versions
+import progression
+from sharding import HashRing
+from log import get_logger, sampled
+from metrics import track
+from tracing import mongo_listeners
+
 load_dotenv()
 
+logger = get_logger("database")
+
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/chronocharm")
 
+# Set (to an empty list) around an idempotent request; each committed ledger
+# write appends its user_id, so a failure after one can be told apart from
+# a failure that changed nothing
+ledger_writes: ContextVar[Optional[list]] = ContextVar("ledger_writes", default=None)
+
+# Comma-separated URIs, one per shard. Each URI's path names its database
+# (default "chronocharm"), so shards may share a cluster. Unset = MONGO_URI only.
+MONGO_SHARDS = [uri.strip() for uri in os.getenv("MONGO_SHARDS", "").split(",") if uri.strip()]
+# Stable shard names in MONGO_SHARDS order (default shard0, shard1, ...). The
+# hash ring is keyed on these, so credentials or hosts in a URI can change
+# without moving users; renaming or reordering unnamed shards does move them.
+SHARD_NAMES = [name.strip() for name in os.getenv("SHARD_NAMES", "").split(",") if name.strip()]
+
 class Database:
+    """
+    MongoDB connection registry
+    
+    Per-user data is spread over the configured shards by consistent hashing
+    on user_id; get_db(user_id) returns the owning shard's database. Shards
+    (and the ring) are keyed by SHARD_NAMES, never by URI.
+    """
+    
     client: Optional[AsyncIOMotorClient] = None
+    clients: dict[str, AsyncIOMotorClient] = {}
+    shards: dict = {}
+    ring: Optional[HashRing] = None
+    
+    # Collections whose documents belong to a single user (keyed by user_id)
+    USER_COLLECTIONS = ("users", "stats", "daily_rollups", "schedules", "calendars", "quest_logs",
+                        "idempotency_keys")
+    MIGRATE_ROUNDS = 5
     
     @classmethod
     async def connect(cls):
         """Initialize MongoDB connection"""
-        cls.client = AsyncIOMotorClient(MONGO_URI)
-        print(f"✓ Connected to MongoDB: {MONGO_URI}")
+        if MONGO_SHARDS:
+            names = SHARD_NAMES or [f"shard{i}" for i in range(len(MONGO_SHARDS))]
+            if len(names) != len(MONGO_SHARDS) or len(set(names)) != len(names):
+                raise ValueError("SHARD_NAMES must give one unique name per MONGO_SHARDS URI")
+            for name, uri in zip(names, MONGO_SHARDS):
+                client = AsyncIOMotorClient(uri, event_listeners=mongo_listeners())
+                cls.clients[name] = client
+                cls.shards[name] = client.get_default_database("chronocharm")
+        else:
+            client = AsyncIOMotorClient(MONGO_URI, event_listeners=mongo_listeners())
+            cls.clients["shard0"] = client
+            cls.shards["shard0"] = client.chronocharm
+        cls.client = next(iter(cls.clients.values()))
+        cls.ring = HashRing(cls.shards)
+        logger.info("mongo_connected", extra={"shards": len(cls.shards)})
+    
+    @classmethod
+    async def ping(cls):
+        """Round-trip to every shard; raises if any of them is unreachable"""
+        await asyncio.gather(*(client.admin.command("ping") for client in cls.clients.values()))
     
     @classmethod
     async def close(cls):
         """Close MongoDB connection"""
-        if cls.client:
-            cls.client.close()
-            print("✓ MongoDB connection closed")
+        if cls.clients:
+            for client in cls.clients.values():
+                client.close()
+            cls.clients = {}
+            cls.shards = {}
+            cls.client = None
+            cls.ring = None
+            logger.info("mongo_closed")
+    
+    @classmethod
+    async def ensure_indexes(cls):
+        """Create the indexes the ledger queries rely on (all shards concurrently)"""
+        await asyncio.gather(*(
+            index
+            for db in cls.all_dbs()
+            for index in (
+                db.users.create_index("user_id", unique=True),
+                *(db.users.create_index([(metric, -1), ("user_id", 1)]) for metric in leaderboards.METRICS),
+                db.daily_rollups.create_index([("user_id", 1), ("day", 1)], unique=True),
+                db.schedules.create_index("user_id", unique=True),
+                db.calendars.create_index("user_id", unique=True),
+                db.quest_logs.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+            )
+        ))
+    
+    @classmethod
+    def get_db(cls, user_id: Optional[str] = None):
+        """
+        Get database instance
+        
+        With a user_id, returns the shard that owns that user; without one,
+        returns the first shard (for data that is not per-user).
+        """
+        if not cls.client:
+            raise RuntimeError("Database not connected. Call connect() first.")
+        if user_id is None or len(cls.shards) == 1:
+            return next(iter(cls.shards.values()))
+        return cls.shards[cls.ring.get(user_id)]
     
     @classmethod
-    def get_db(cls):
-        """Get database instance"""
+    def all_dbs(cls) -> list:
+        """Every shard's database, for cross-user scans"""
         if not cls.client:
             raise RuntimeError("Database not connected. Call connect() first.")
-        return cls.client.chronocharm
+        return list(cls.shards.values())
+    
+    @classmethod
+    async def migrate_user(cls, user_id: str, source, target) -> None:
+        """
+        Copy every per-user document from source to target, then delete it
+        
+        Documents are upserted by _id before deletion, so an interrupted
+        migration can simply be re-run. Deletion is fenced: a source
+        document is only deleted if it still matches what was copied, so a
+        write that lands on the source mid-copy is picked up by the next
+        round instead of being lost. Raises RuntimeError if a collection is
+        still changing after MIGRATE_ROUNDS rounds (re-run it later).
+        """
+        for name in cls.USER_COLLECTIONS:
+            for _ in range(cls.MIGRATE_ROUNDS):
+                docs = await source[name].find({"user_id": user_id}).to_list(length=None)
+                if not docs:
+                    break
+                await target[name].bulk_write(
+                    [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs],
+                    ordered=False
+                )
+                # A whole-document filter only matches copies that are still current
+                await source[name].bulk_write([DeleteOne(doc) for doc in docs], ordered=False)
+            else:
+                if await source[name].count_documents({"user_id": user_id}, limit=1):
+                    raise RuntimeError(f"Could not migrate '{user_id}': {name} kept changing on the source shard")
+        logger.info("user_migrated", extra={"user_id": user_id})
+    
+    @classmethod
+    async def locate_user(cls, user_id: str) -> bool:
+        """
+        Pull a user onto its owning shard if it still lives on another one
+        
+        Only needed while a rebalance is in progress after adding shards;
+        returns True if the user was found elsewhere and moved.
+        """
+        if len(cls.shards) == 1:
+            return False
+        target = cls.get_db(user_id)
+        for db in cls.all_dbs():
+            if db is target:
+                continue
+            if await db.users.find_one({"user_id": user_id}, {"_id": 1}):
+                await cls.migrate_user(user_id, db, target)
+                return True
+        return False
+
+
+BALANCE_FIELDS = ("user_id", "balance", "total_earned", "total_lost", "quests_completed")
+
+DEFAULT_STATS = {
+    "endurance": 10,
+    "focus": 10,
+    "magic": 10,
+    "level": 1,
+    "xp": 0,
+    "xpToNextLevel": 100,
+    "title": "First Year",
+    "badges": [],
+    "currentStreak": 0,
+    "lastCompletedDate": None,
+}
+
+
+STATS_COUNTERS = ("xp", "endurance", "focus", "magic")
+STATS_SETTABLE = {"level": int, "xpToNextLevel": int, "title": str}  # field -> required type
+
+
+class StatsVersionConflict(Exception):
+    """A versioned stats update lost the race; carries the current stats"""
+    
+    def __init__(self, stats: dict, version: int):
+        super().__init__(f"Stats changed concurrently (current version {version})")
+        self.stats = stats
+        self.version = version
 
 
 class ManaLedger:
     """Manages user Mana balances and wager transactions"""
     
     STARTING_MANA = 1000
+    SETTLE_RETRIES = 5
     
     @staticmethod
-    async def get_or_create_user(user_id: str = "default") -> dict:
-        """Get user balance or initialize with starting Mana"""
-        db = Database.get_db()
+    def new_user(user_id: str) -> dict:
+        """Build a fresh user document (balance and embedded RPG stats)"""
+        return {
+            "user_id": user_id,
+            "balance": ManaLedger.STARTING_MANA,
+            "total_earned": 0,
+            "total_lost": 0,
+            "quests_completed": 0,
+            "balance_version": 0,
+            "stats_version": 0,
+            "stats": dict(DEFAULT_STATS, badges=[])
+        }
+    
+    @staticmethod
+    def _after_write(user: dict, publish: bool = True) -> None:
+        """Feed a freshly written user document to the in-memory read models"""
+        leaderboards.record(user)
+        versions.record(user)
+        if publish:
+            event_bus.publish_user(user)
+    
+    @staticmethod
+    @track("mongo", "get_or_create_user")
+    async def get_or_create_user(user_id: str = "default", projection: Optional[dict] = None) -> dict:
+        """
+        Get user balance or initialize with starting Mana
+        
+        RPG stats live on the same document under "stats", so a single
+        projected find_one serves balance, stats or both.
+        """
+        db = Database.get_db(user_id)
         users = db.users
         
-        user = await users.find_one({"user_id": user_id})
+        user = await users.find_one({"user_id": user_id}, projection)
+        
+        if not user and await Database.locate_user(user_id):
+            user = await users.find_one({"user_id": user_id}, projection)
         
         if not user:
-            user = {
-                "user_id": user_id,
-                "balance": ManaLedger.STARTING_MANA,
-                "total_earned": 0,
-                "total_lost": 0,
-                "quests_completed": 0
-            }
-            await users.insert_one(user)
-            print(f"✓ Created new user '{user_id}' with {ManaLedger.STARTING_MANA} Mana")
+            user = ManaLedger.new_user(user_id)
+            # $setOnInsert keeps concurrent first requests from racing into duplicates
+            await users.update_one(
+                {"user_id": user_id},
+                {"$setOnInsert": user},
+                upsert=True
+            )
+            ManaLedger._after_write(user, publish=False)
+            logger.info("user_created", extra={"user_id": user_id, "balance": ManaLedger.STARTING_MANA})
+            if projection:
+                user = ManaLedger._apply_projection(user, projection)
+        elif "stats" not in user and ManaLedger._wants_stats(projection):
+            user["stats"] = await ManaLedger._migrate_legacy_stats(user_id)
+            if projection:
+                user = ManaLedger._apply_projection(user, projection)
         
         return user
     
     @staticmethod
+    async def _update_user(user_id: str, query: dict, update: dict, projection: Optional[dict] = None,
+                           upsert: bool = False) -> Optional[dict]:
+        """
+        find_one_and_update a user on its owning shard, returning the new document
+        
+        A miss may mean a rebalance has routed the user here but not copied
+        it yet, so (like get_or_create_user) the user is located and the
+        update retried once before None is returned. With upsert, the user
+        is only inserted on that retry, so it is never duplicated on the new
+        shard while the original still lives on the old one.
+        """
+        users = Database.get_db(user_id).users
+        query = {"user_id": user_id, **query}
+        updated = await users.find_one_and_update(
+            query, update, projection=projection, return_document=ReturnDocument.AFTER
+        )
+        if updated is None and (await Database.locate_user(user_id) or upsert):
+            updated = await users.find_one_and_update(
+                query, update, projection=projection, upsert=upsert, return_document=ReturnDocument.AFTER
+            )
+        writes = ledger_writes.get()
+        if updated is not None and writes is not None:
+            writes.append(user_id)
+        return updated
+    
+    @staticmethod
+    def _wants_stats(projection: Optional[dict]) -> bool:
+        """Whether a projection includes any embedded stats field"""
+        if not projection:
+            return True
+        return any(key == "stats" or key.startswith("stats.") for key in projection)
+    
+    @staticmethod
+    def _apply_projection(user: dict, projection: dict) -> dict:
+        """Trim an in-memory user document to the fields a projection selects"""
+        projected = {}
+        for key in projection:
+            if key == "_id":
+                continue
+            head, _, tail = key.partition(".")
+            if head not in user:
+                continue
+            if tail:
+                projected.setdefault(head, {})[tail] = user[head].get(tail)
+            else:
+                projected[head] = user[head]
+        return projected
+    
+    @staticmethod
+    async def _migrate_legacy_stats(user_id: str) -> dict:
+        """Fold a pre-merge document from the old `stats` collection into the user"""
+        db = Database.get_db(user_id)
+        legacy = await db.stats.find_one({"user_id": user_id}, {"_id": 0, "user_id": 0})
+        stats = dict(DEFAULT_STATS, badges=[])
+        if legacy:
+            stats.update({k: v for k, v in legacy.items() if k in DEFAULT_STATS})
+        await db.users.update_one(
+            {"user_id": user_id, "stats": {"$exists": False}},
+            {"$set": {"stats": stats}}
+        )
+        return stats
+    
+    @staticmethod
+    @track("mongo", "get_profile")
+    async def get_profile(user_id: str = "default", fields: Optional[list[str]] = None) -> dict:
+        """
+        Get balance and RPG stats together from one projected read
+        
+        Args:
+            user_id: User to look up (created with defaults if missing)
+            fields: Optional subset of balance/stats field names to return
+        
+        Returns:
+            {"user_id", "balance": {...}, "stats": {...}} limited to the
+            requested fields; a section is omitted when none of its fields
+            were requested.
+        """
+        balance_fields = [f for f in BALANCE_FIELDS if f != "user_id"]
+        stats_fields = list(DEFAULT_STATS)
+        if fields:
+            unknown = set(fields) - set(balance_fields) - set(stats_fields)
+            if unknown:
+                raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+            balance_fields = [f for f in balance_fields if f in fields]
+            stats_fields = [f for f in stats_fields if f in fields]
+        
+        projection = {"_id": 0, "user_id": 1}
+        projection.update({f: 1 for f in balance_fields})
+        projection.update({f"stats.{f}": 1 for f in stats_fields})
+        
+        user = await ManaLedger.get_or_create_user(user_id, projection)
+        
+        profile = {"user_id": user_id}
+        if balance_fields:
+            profile["balance"] = {f: user.get(f) for f in balance_fields}
+        if stats_fields:
+            stats = user.get("stats") or {}
+            profile["stats"] = {f: stats.get(f, DEFAULT_STATS[f]) for f in stats_fields}
+        return profile
+    
+    @staticmethod
+    @track("mongo", "get_stats")
+    async def get_stats(user_id: str = "default") -> dict:
+        """Get the user's embedded RPG stats, including their version counter"""
+        user = await ManaLedger.get_or_create_user(user_id, {"_id": 0, "stats": 1, "stats_version": 1})
+        stored = user.get("stats") or {}
+        stats = {field: stored.get(field, default) for field, default in DEFAULT_STATS.items()}
+        stats["version"] = user.get("stats_version", 0)
+        return stats
+    
+    @staticmethod
+    @track("mongo", "set_stats")
+    async def set_stats(user_id: str, stats: dict) -> None:
+        """Overwrite the user's embedded RPG stats"""
+        stats = dict(stats, lastCompletedDate=progression.normalize_day(stats.get("lastCompletedDate")))
+        updated = await ManaLedger._update_user(
+            user_id,
+            {},
+            {
+                "$set": {"stats": stats},
+                "$inc": {"stats_version": 1},
+                "$setOnInsert": {
+                    k: v for k, v in ManaLedger.new_user(user_id).items()
+                    if k not in ("user_id", "stats", "stats_version")
+                }
+            },
+            projection={"_id": 0, "user_id": 1, "stats": 1, "stats_version": 1},
+            upsert=True
+        )
+        ManaLedger._after_write(updated)
+    
+    @staticmethod
+    @track("mongo", "patch_stats")
+    async def patch_stats(user_id: str, inc: Optional[dict] = None, set_fields: Optional[dict] = None,
+                          add_badges: Optional[list[str]] = None,
+                          expected_version: Optional[int] = None) -> dict:
+        """
+        Apply a partial stats update in one atomic write
+        
+        Counters are $inc'ed and badges $addToSet, so concurrent deltas from
+        several tabs all land. With expected_version the write only applies
+        if nobody else changed the stats since that version was read;
+        otherwise StatsVersionConflict is raised with the current stats.
+        
+        Returns the updated stats including the new version.
+        """
+        inc = inc or {}
+        set_fields = set_fields or {}
+        unknown = (set(inc) - set(STATS_COUNTERS)) | (set(set_fields) - set(STATS_SETTABLE))
+        if unknown:
+            raise ValueError(f"Fields cannot be patched: {', '.join(sorted(unknown))}")
+        for field, value in set_fields.items():
+            expected = STATS_SETTABLE[field]
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise ValueError(f"{field} must be {'an integer' if expected is int else 'a string'}")
+        
+        update = {"$inc": {"stats_version": 1, **{f"stats.{k}": v for k, v in inc.items()}}}
+        if set_fields:
+            update["$set"] = {f"stats.{k}": v for k, v in set_fields.items()}
+        if add_badges:
+            update["$addToSet"] = {"stats.badges": {"$each": list(add_badges)}}
+        
+        # Users without embedded stats are migrated before patching, not $inc'ed into a partial document
+        query = {"user_id": user_id, "stats": {"$exists": True}}
+        if expected_version is not None:
+            # Documents that predate versioning have no counter and count as version 0
+            query["stats_version"] = expected_version if expected_version else {"$in": [0, None]}
+        
+        db = Database.get_db(user_id)
+        projection = {"_id": 0, "user_id": 1, "stats": 1, "stats_version": 1}
+        
+        async def apply():
+            return await db.users.find_one_and_update(
+                query, update, projection=projection, return_document=ReturnDocument.AFTER
+            )
+        
+        updated = await apply()
+        if updated is None:
+            # Creates the user or folds in its legacy stats collection document
+            current = await ManaLedger.get_stats(user_id)
+            if expected_version is not None and current["version"] != expected_version:
+                raise StatsVersionConflict(current, current["version"])
+            updated = await apply()
+            if updated is None:  # Another write landed between the read and the retry
+                current = await ManaLedger.get_stats(user_id)
+                raise StatsVersionConflict(current, current["version"])
+        
+        ManaLedger._after_write(updated)
+        return dict(DEFAULT_STATS, **updated["stats"], version=updated.get("stats_version", 0))
+    
+    @staticmethod
+    @track("mongo", "get_balance")
     async def get_balance(user_id: str = "default") -> int:
         """Get current Mana balance"""
         user = await ManaLedger.get_or_create_user(user_id)
         return user["balance"]
     
     @staticmethod
+    @track("mongo", "deduct_stake")
     async def deduct_stake(user_id: str, stake: int) -> dict:
         """
         Deduct stake from user balance (called when accepting a wager)
         Returns updated user document
         """
-        db = Database.get_db()
-        users = db.users
-        
         user = await ManaLedger.get_or_create_user(user_id)
         
         if user["balance"] < stake:
             raise ValueError(f"Insufficient Mana. Balance: {user['balance']}, Required: {stake}")
         
-        result = await users.update_one(
-            {"user_id": user_id},
-            {"$inc": {"balance": -stake}}
+        updated_user = await ManaLedger._update_user(
+            user_id, {}, {"$inc": {"balance": -stake, "balance_version": 1}}
         )
-        
-        updated_user = await users.find_one({"user_id": user_id})
-        print(f"✓ Deducted {stake} Mana stake. New balance: {updated_user['balance']}")
+        ManaLedger._after_write(updated_user)
+        logger.info("stake_deducted", extra=sampled(user_id=user_id, stake=stake, balance=updated_user["balance"]))
         
         return updated_user
     
     @staticmethod
-    async def award_bounty(user_id: str, bounty: int, stake: int) -> dict:
+    @track("mongo", "award_bounty")
+    async def award_bounty(user_id: str, bounty: int, stake: int, minutes_focused: int = 0,
+                           duration_minutes: Optional[int] = None, day: Optional[str] = None) -> dict:
         """
         Award bounty to user (called when completing a task)
+        
+        XP, level, streak and badge progression is applied in the same
+        write that credits the Mana, guarded by stats_version so concurrent
+        stats writes are retried rather than overwritten. `day` is the
+        client's local YYYY-MM-DD, which decides the streak day.
         Returns updated user document
         """
-        db = Database.get_db()
-        users = db.users
-        
         total_win = bounty + stake  # Return stake + bounty
         
-        result = await users.update_one(
-            {"user_id": user_id},
-            {
-                "$inc": {
-                    "balance": total_win,
-                    "total_earned": bounty,
-                    "quests_completed": 1
-                }
-            }
-        )
+        async def settle() -> dict:
+            for _ in range(ManaLedger.SETTLE_RETRIES):
+                user = await ManaLedger.get_or_create_user(
+                    user_id, {"_id": 0, "stats": 1, "stats_version": 1}
+                )
+                version = user.get("stats_version", 0)
+                stats = progression.apply_quest_won(
+                    dict(DEFAULT_STATS, **(user.get("stats") or {})),
+                    bounty,
+                    minutes_focused=minutes_focused,
+                    duration_minutes=duration_minutes,
+                    today=progression.local_day(day)
+                )
+                updated = await ManaLedger._update_user(
+                    user_id,
+                    {"stats_version": version if version else {"$in": [0, None]}},
+                    {
+                        "$inc": {
+                            "balance": total_win,
+                            "total_earned": bounty,
+                            "quests_completed": 1,
+                            "balance_version": 1,
+                            "stats_version": 1
+                        },
+                        "$set": {"stats": stats}
+                    }
+                )
+                if updated is not None:
+                    return updated
+            raise RuntimeError(f"Could not settle wager for '{user_id}': stats kept changing concurrently")
         
-        updated_user = await users.find_one({"user_id": user_id})
-        print(f"✓ Awarded {bounty} Mana bounty + {stake} stake returned. New balance: {updated_user['balance']}")
+        # Only a settled win is counted: a failed settle is retried by the client
+        updated_user = await settle()
+        await DailyRollups.record(user_id, won=True, stake=stake, bounty=bounty, minutes_focused=minutes_focused)
+        
+        ManaLedger._after_write(updated_user)
+        logger.info("bounty_awarded", extra=sampled(
+            user_id=user_id, bounty=bounty, stake=stake, balance=updated_user["balance"]
+        ))
         
         return updated_user
     
     @staticmethod
-    async def lose_stake(user_id: str, stake: int) -> dict:
+    @track("mongo", "lose_stake")
+    async def lose_stake(user_id: str, stake: int, minutes_focused: int = 0) -> dict:
         """
         Record stake loss (stake was already deducted, just update stats)
         Returns updated user document
         """
-        db = Database.get_db()
-        users = db.users
+        updated_user = await ManaLedger._update_user(
+            user_id, {}, {"$inc": {"total_lost": stake, "balance_version": 1}}
+        )
+        if updated_user is None:
+            raise LookupError(f"User '{user_id}' not found")
+        await DailyRollups.record(user_id, won=False, stake=stake, minutes_focused=minutes_focused)
+        ManaLedger._after_write(updated_user)
+        logger.info("stake_lost", extra=sampled(user_id=user_id, stake=stake, balance=updated_user["balance"]))
         
-        result = await users.update_one(
-            {"user_id": user_id},
-            {"$inc": {"total_lost": stake}}
+        return updated_user
+    
+    @staticmethod
+    @track("mongo", "reset_user")
+    async def reset_user(user_id: str) -> None:
+        """Reset balance and lifetime totals to starting values (for testing)"""
+        reset = {
+            "balance": ManaLedger.STARTING_MANA,
+            "total_earned": 0,
+            "total_lost": 0,
+            "quests_completed": 0
+        }
+        updated = await ManaLedger._update_user(
+            user_id,
+            {},
+            {"$set": reset, "$inc": {"balance_version": 1}},
+            projection={"_id": 0, "user_id": 1, "balance_version": 1, **{k: 1 for k in reset}}
+        )
+        if updated is not None:
+            ManaLedger._after_write(updated)
+
+
+class DailyRollups:
+    """
+    Per-user, per-day wager aggregates maintained incrementally on settlement
+    
+    One document per (user_id, day) holds running totals, so history reads
+    touch O(days) documents no matter how many wagers were settled.
+    """
+    
+    FIELDS = ("wins", "losses", "stake", "bounty", "mana_lost", "minutes_focused")
+    MAX_DAYS = 366
+    
+    @staticmethod
+    def day_key(when: Optional[datetime] = None) -> str:
+        """UTC calendar day bucket, e.g. '2024-03-07'"""
+        return (when or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+    
+    @staticmethod
+    @track("mongo", "rollup_record")
+    async def record(user_id: str, won: bool, stake: int, bounty: int = 0,
+                     minutes_focused: int = 0, when: Optional[datetime] = None) -> None:
+        """Fold one settled wager into its day's rollup document"""
+        db = Database.get_db(user_id)
+        await db.daily_rollups.update_one(
+            {"user_id": user_id, "day": DailyRollups.day_key(when)},
+            {
+                "$inc": {
+                    "wins": 1 if won else 0,
+                    "losses": 0 if won else 1,
+                    "stake": stake,
+                    "bounty": bounty if won else 0,
+                    "mana_lost": 0 if won else stake,
+                    "minutes_focused": max(0, minutes_focused)
+                }
+            },
+            upsert=True
         )
+    
+    @staticmethod
+    @track("mongo", "rollup_history")
+    async def history(user_id: str, days: int = 90) -> list[dict]:
+        """
+        Daily rollups for the last `days` days (today inclusive), oldest first
         
-        updated_user = await users.find_one({"user_id": user_id})
-        print(f"✓ Stake lost ({stake} Mana). Balance: {updated_user['balance']}")
+        Days without any settled wagers are filled with zeros so charts get a
+        continuous series.
+        """
+        days = max(1, min(days, DailyRollups.MAX_DAYS))
+        today = datetime.now(timezone.utc)
+        keys = [DailyRollups.day_key(today - timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
         
-        return updated_user
+        db = Database.get_db(user_id)
+        cursor = db.daily_rollups.find(
+            {"user_id": user_id, "day": {"$gte": keys[0], "$lte": keys[-1]}},
+            {"_id": 0, "user_id": 0}
+        ).sort("day", 1)
+        found = {doc["day"]: doc async for doc in cursor}
+        
+        return [
+            {"day": key, **{field: found.get(key, {}).get(field, 0) for field in DailyRollups.FIELDS}}
+            for key in keys
+        ]
@@ -0,0 +1,97 @@
+"""
+ChronoCharm - Realtime Events
+In-process pub/sub feeding the /ws push channel
+"""
+
+import asyncio
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Publish from Mongo change streams instead of in-process calls, so every
+# worker sees every worker's writes (needs a replica set / Atlas cluster).
+USE_CHANGE_STREAMS = os.getenv("EVENTS_CHANGE_STREAMS", "").lower() in ("1", "true", "yes")
+
+BALANCE_EVENT_FIELDS = ("balance", "total_earned", "total_lost", "quests_completed")
+
+
+class EventBus:
+    """
+    Per-user fan-out of small JSON events to subscribed queues
+
+    Publishing never blocks: each subscriber has a bounded queue and a slow
+    consumer drops its oldest pending event, since every event carries the
+    full current value and the newest one supersedes the rest.
+    """
+
+    QUEUE_SIZE = 64
+
+    def __init__(self):
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    def subscriber_count(self, user_id: Optional[str] = None) -> int:
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    @contextmanager
+    def subscribe(self, user_id: str) -> Iterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event_type: str, data: dict) -> None:
+        queues = self._subscribers.get(user_id)
+        if not queues:
+            return
+        event = {"type": event_type, "user_id": user_id, "data": data}
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def publish_user(self, user: Optional[dict], local: bool = True) -> None:
+        """
+        Publish balance and stats events from an updated user document
+
+        Ledger code calls this with local=True after each write; when change
+        streams are enabled those calls are skipped because the stream
+        watcher publishes the same documents (with local=False).
+        """
+        if not user or (local and USE_CHANGE_STREAMS):
+            return
+        user_id = user["user_id"]
+        if user_id not in self._subscribers:
+            return
+        if all(field in user for field in BALANCE_EVENT_FIELDS):
+            self.publish(user_id, "balance", {field: user[field] for field in BALANCE_EVENT_FIELDS})
+        if "stats" in user:
+            self.publish(user_id, "stats", dict(user["stats"], version=user.get("stats_version", 0)))
+
+    async def watch_changes(self, db, on_user=None) -> None:
+        """
+        Tail one shard's users collection and publish every changed user
+
+        on_user, if given, is also called with each changed document (used
+        to keep this worker's leaderboards in sync with other workers).
+        Runs until cancelled.
+        """
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        async with db.users.watch(pipeline, full_document="updateLookup") as stream:
+            async for change in stream:
+                user = change.get("fullDocument")
+                if not user:
+                    continue
+                self.publish_user(user, local=False)
+                if on_user:
+                    on_user(user)
+
+
+event_bus = EventBus()
@@ -0,0 +1,79 @@
+"""
+ChronoCharm - Health State
+Dependency checks behind the liveness and readiness probes
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from log import get_logger
+
+logger = get_logger("health")
+
+# How long a readiness check result is reused before re-checking
+READY_CHECK_INTERVAL = float(os.getenv("READY_CHECK_INTERVAL", "5"))
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "1"))
+
+
+class HealthState:
+    """
+    Latest result of each dependency check
+
+    Required checks (Mongo, indexes, leaderboards) gate readiness; optional
+    ones (Gemini) are reported so a degraded pod is visible, but the ledger
+    endpoints keep serving without them.
+    """
+
+    def __init__(self):
+        self.checks: dict[str, dict] = {}
+        self._probes: dict[str, asyncio.Lock] = {}
+
+    def register(self, name: str, required: bool = True) -> None:
+        self.checks.setdefault(name, {"ok": False, "required": required, "error": "pending", "checked_at": None})
+
+    def mark(self, name: str, ok: bool, error: Optional[BaseException] = None) -> None:
+        check = self.checks[name]
+        if check["ok"] != ok:
+            log = logger.info if ok else logger.warning
+            log("dependency_" + ("up" if ok else "down"), extra={"check": name, "error": str(error) if error else None})
+        check.update(ok=ok, error=None if ok else (str(error) or type(error).__name__), checked_at=time.time())
+
+    async def run(self, name: str, check: Callable[[], Awaitable], timeout: float = READY_CHECK_TIMEOUT) -> bool:
+        """Run one check with a timeout, record the outcome and return it"""
+        try:
+            await asyncio.wait_for(check(), timeout)
+        except Exception as e:
+            self.mark(name, False, e)
+            return False
+        self.mark(name, True)
+        return True
+
+    async def refresh(self, name: str, check: Callable[[], Awaitable],
+                      max_age: float = READY_CHECK_INTERVAL) -> bool:
+        """
+        Re-run a check if its last result is older than max_age
+
+        Concurrent probes share one in-flight check instead of each hitting
+        the dependency.
+        """
+        lock = self._probes.setdefault(name, asyncio.Lock())
+        async with lock:
+            last = self.checks[name]["checked_at"]
+            if last is not None and time.time() - last < max_age:
+                return self.checks[name]["ok"]
+            return await self.run(name, check)
+
+    @property
+    def ready(self) -> bool:
+        return all(check["ok"] for check in self.checks.values() if check["required"])
+
+    def snapshot(self) -> dict:
+        return {
+            name: {"ok": check["ok"], "required": check["required"], "error": check["error"]}
+            for name, check in self.checks.items()
+        }
+
+
+health_state = HealthState()
@@ -0,0 +1,161 @@
+"""
+ChronoCharm - Idempotency Keys
+Dedupes retried wager mutations so a retry replays the first response
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from database import Database, ledger_writes
+from metrics import cache_lookup
+
+
+class IdempotencyConflict(Exception):
+    """Key reused with a different payload, or its first request is still running elsewhere"""
+
+
+class IdempotencyStore:
+    """
+    Two-tier store of first responses keyed by (scope, user_id, key)
+
+    An in-memory LRU answers most retries without any I/O. Misses fall
+    through to the TTL-indexed `idempotency_keys` collection, which also
+    acts as a claim: the first request inserts a pending marker, so a
+    retry landing on another worker cannot re-run the mutation.
+    A request that fails before any ledger write releases its claim so the
+    client may retry it; one that fails after a write has committed keeps
+    the claim as "failed", and retries are refused rather than re-run.
+    """
+
+    COLLECTION = "idempotency_keys"
+    TTL_SECONDS = 24 * 60 * 60
+    MEMORY_CAPACITY = 10_000
+
+    def __init__(self, ttl_seconds: int = TTL_SECONDS, capacity: int = MEMORY_CAPACITY):
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self._memory: OrderedDict[str, tuple[float, str, dict]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def ensure_indexes(self, db) -> None:
+        await db[self.COLLECTION].create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        await db[self.COLLECTION].create_index("user_id")  # Database.migrate_user moves keys with their user
+
+    @staticmethod
+    def fingerprint(payload: dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _remember(self, scoped: str, fingerprint: str, response: dict) -> None:
+        self._memory[scoped] = (time.monotonic() + self.ttl_seconds, fingerprint, response)
+        self._memory.move_to_end(scoped)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _recall(self, scoped: str) -> Optional[tuple[str, dict]]:
+        entry = self._memory.get(scoped)
+        if entry is None:
+            return None
+        expires_at, fingerprint, response = entry
+        if expires_at < time.monotonic():
+            del self._memory[scoped]
+            return None
+        self._memory.move_to_end(scoped)
+        return fingerprint, response
+
+    @staticmethod
+    def _check(scoped: str, expected: str, stored: str) -> None:
+        if expected != stored:
+            raise IdempotencyConflict(f"Idempotency key '{scoped.rsplit(':', 1)[-1]}' was already used with a different request")
+
+    async def run(self, key: Optional[str], scope: str, user_id: str, payload: dict,
+                  handler: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Run handler once per idempotency key and replay its response afterwards
+
+        Without a key the handler simply runs. Concurrent duplicates within
+        this process wait on the first call instead of racing it.
+        """
+        if not key:
+            return await handler()
+
+        scoped = f"{scope}:{user_id}:{key}"
+        fingerprint = self.fingerprint(payload)
+
+        cached = self._recall(scoped)
+        cache_lookup("idempotency", cached is not None)
+        if cached:
+            self._check(scoped, fingerprint, cached[0])
+            return cached[1]
+
+        if scoped in self._in_flight:
+            await asyncio.shield(self._in_flight[scoped])
+            return await self.run(key, scope, user_id, payload, handler)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[scoped] = future
+        try:
+            return await self._run_claimed(scoped, user_id, fingerprint, handler)
+        finally:
+            del self._in_flight[scoped]
+            future.set_result(None)
+
+    async def _run_claimed(self, scoped: str, user_id: str, fingerprint: str,
+                           handler: Callable[[], Awaitable[dict]]) -> dict:
+        collection = Database.get_db(user_id)[self.COLLECTION]
+        try:
+            await collection.insert_one({
+                "_id": scoped,
+                "user_id": user_id,
+                "fingerprint": fingerprint,
+                "status": "pending",
+                "created_at": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            stored = await collection.find_one({"_id": scoped})
+            if stored is None:
+                # Expired between the insert and the read; treat as fresh
+                return await self._run_claimed(scoped, user_id, fingerprint, handler)
+            self._check(scoped, fingerprint, stored["fingerprint"])
+            if stored["status"] == "failed":
+                raise IdempotencyConflict(
+                    f"A request with this idempotency key failed after changing the ledger "
+                    f"({stored.get('error', 'unknown error')}); check the balance before retrying with a new key"
+                )
+            if stored["status"] != "done":
+                raise IdempotencyConflict("A request with this idempotency key is still in progress")
+            self._remember(scoped, stored["fingerprint"], stored["response"])
+            return stored["response"]
+
+        writes: list = []
+        token = ledger_writes.set(writes)
+        try:
+            response = await handler()
+        except BaseException as e:
+            if writes:
+                await collection.update_one(
+                    {"_id": scoped, "status": "pending"},
+                    {"$set": {"status": "failed", "error": str(e) or type(e).__name__}}
+                )
+            else:
+                await collection.delete_one({"_id": scoped, "status": "pending"})
+            raise
+        finally:
+            ledger_writes.reset(token)
+
+        # Remembered first, so a failure storing it still replays on this worker
+        self._remember(scoped, fingerprint, response)
+        await collection.update_one(
+            {"_id": scoped},
+            {"$set": {"status": "done", "response": response}}
+        )
+        return response
+
+
+idempotency = IdempotencyStore()
@@ -0,0 +1,282 @@
+"""
+ChronoCharm - Leaderboards
+In-memory ranked leaderboards kept in sync from ledger mutations
+"""
+
+import heapq
+import itertools
+import random
+from typing import Iterator, Optional
+
+from log import get_logger
+from metrics import cache_lookup
+
+logger = get_logger("leaderboard")
+
+
+class SkipList:
+    """
+    Indexable skip list of unique, totally ordered keys
+
+    Each forward link also stores its width (how many bottom-level nodes it
+    skips), so insert, remove, rank and positional lookup are all O(log n).
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    class _Node:
+        __slots__ = ("key", "next", "width")
+
+        def __init__(self, key, level: int):
+            self.key = key
+            self.next = [None] * level
+            self.width = [1] * level
+
+    def __init__(self, seed: Optional[int] = None):
+        self._rng = random.Random(seed)
+        self._head = self._Node(None, self.MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and self._rng.random() < self.P:
+            level += 1
+        return level
+
+    def _find(self, key):
+        """Return per-level predecessors of key and their bottom-level positions"""
+        update = [self._head] * self.MAX_LEVEL
+        positions = [0] * self.MAX_LEVEL
+        node, pos = self._head, 0
+        for lvl in range(self._level - 1, -1, -1):
+            while node.next[lvl] is not None and node.next[lvl].key < key:
+                pos += node.width[lvl]
+                node = node.next[lvl]
+            update[lvl] = node
+            positions[lvl] = pos
+        return update, positions
+
+    def insert(self, key) -> None:
+        """Insert key (must not already be present)"""
+        update, positions = self._find(key)
+        level = self._random_level()
+        if level > self._level:
+            for lvl in range(self._level, level):
+                update[lvl] = self._head
+                positions[lvl] = 0
+                self._head.width[lvl] = self._size + 1
+            self._level = level
+
+        node = self._Node(key, level)
+        index = positions[0] + 1  # 1-based position of the new node
+        for lvl in range(level):
+            prev = update[lvl]
+            node.next[lvl] = prev.next[lvl]
+            prev.next[lvl] = node
+            # Split the predecessor's span around the new node
+            node.width[lvl] = prev.width[lvl] - (index - positions[lvl]) + 1
+            prev.width[lvl] = index - positions[lvl]
+        for lvl in range(level, self._level):
+            update[lvl].width[lvl] += 1
+        self._size += 1
+
+    def remove(self, key) -> bool:
+        """Remove key; returns False if it was not present"""
+        update, _ = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return False
+        for lvl in range(self._level):
+            prev = update[lvl]
+            if prev.next[lvl] is node:
+                prev.width[lvl] += node.width[lvl] - 1
+                prev.next[lvl] = node.next[lvl]
+            else:
+                prev.width[lvl] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+        return True
+
+    def rank(self, key) -> Optional[int]:
+        """0-based position of key, or None if absent"""
+        update, positions = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return None
+        return positions[0]
+
+    def iter_from(self, index: int) -> Iterator:
+        """Iterate keys starting at 0-based position index"""
+        if index >= self._size:
+            return
+        node, pos = self._head, -1
+        for lvl in range(self._level - 1, -1, -1):
+            while node.next[lvl] is not None and pos + node.width[lvl] <= index:
+                pos += node.width[lvl]
+                node = node.next[lvl]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+
+class Leaderboard:
+    """Ranks users by a single numeric metric, highest first"""
+
+    def __init__(self, metric: str):
+        self.metric = metric
+        self._scores: dict[str, int] = {}
+        self._order = SkipList()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @staticmethod
+    def _key(user_id: str, score: int) -> tuple:
+        # Negated score sorts highest first; user_id breaks ties deterministically
+        return (-score, user_id)
+
+    def update(self, user_id: str, score: int) -> None:
+        """Set a user's score, moving them in the ordering if it changed"""
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._order.remove(self._key(user_id, old))
+        self._order.insert(self._key(user_id, score))
+        self._scores[user_id] = score
+
+    def discard(self, user_id: str) -> None:
+        """Drop a user from the board"""
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._order.remove(self._key(user_id, old))
+
+    def top(self, k: int, offset: int = 0) -> list[dict]:
+        """Top k entries starting after `offset` entries, as rank/user_id/score dicts"""
+        entries = []
+        for i, (neg_score, user_id) in enumerate(self._order.iter_from(offset)):
+            if i >= k:
+                break
+            entries.append({"rank": offset + i + 1, "user_id": user_id, self.metric: -neg_score})
+        return entries
+
+    def rank(self, user_id: str) -> Optional[dict]:
+        """1-based rank and score for a user, or None if not on the board"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        position = self._order.rank(self._key(user_id, score))
+        return {"rank": position + 1, "user_id": user_id, self.metric: score, "total": len(self)}
+
+
+class Leaderboards:
+    """
+    Registry of leaderboards over ledger metrics
+
+    Boards are rebuilt from indexed Mongo queries on startup and then kept
+    current by ManaLedger calling record() with each updated user document.
+    Until load() has finished, queries fall back to the same indexes.
+    Each worker process holds its own boards; mutations made by other
+    workers only show up after that worker's next load(). Updates recorded
+    while load() streams are also replayed onto the new boards before they
+    replace the old ones, so none are lost to the swap.
+    """
+
+    METRICS = ("total_earned", "quests_completed")
+    LOAD_BATCH_SIZE = 1000
+
+    def __init__(self):
+        self.boards = {metric: Leaderboard(metric) for metric in self.METRICS}
+        self.ready = False
+        # user_id -> latest metrics recorded while load() is streaming, else None
+        self._pending: Optional[dict[str, dict]] = None
+
+    def get(self, metric: str) -> Leaderboard:
+        if metric not in self.boards:
+            raise ValueError(f"Unknown leaderboard metric '{metric}'. Choose from: {', '.join(self.METRICS)}")
+        return self.boards[metric]
+
+    def record(self, user: Optional[dict]) -> None:
+        """Sync every board from a (possibly partial) user document"""
+        if not user or "user_id" not in user:
+            return
+        scores = {metric: user[metric] for metric in self.METRICS if metric in user}
+        self._apply(self.boards, user["user_id"], scores)
+        if self._pending is not None:
+            self._pending.setdefault(user["user_id"], {}).update(scores)
+
+    @staticmethod
+    def _apply(boards: dict[str, Leaderboard], user_id: str, scores: dict) -> None:
+        for metric, score in scores.items():
+            boards[metric].update(user_id, score)
+
+    async def load(self, dbs: list) -> None:
+        """Cold-start every board by streaming users from every shard"""
+        projection = {"_id": 0, "user_id": 1, **{metric: 1 for metric in self.METRICS}}
+        boards = {metric: Leaderboard(metric) for metric in self.METRICS}
+        self._pending = {}
+        try:
+            for db in dbs:
+                cursor = db.users.find({}, projection).batch_size(self.LOAD_BATCH_SIZE)
+                async for user in cursor:
+                    for metric, board in boards.items():
+                        board.update(user["user_id"], user.get(metric, 0))
+            # The stream may have read a user before a write it raced with
+            for user_id, scores in self._pending.items():
+                self._apply(boards, user_id, scores)
+            self.boards = boards
+            self.ready = True
+        finally:
+            self._pending = None
+        logger.info("leaderboards_loaded", extra={"users": len(boards[self.METRICS[0]])})
+
+    async def top(self, dbs: list, metric: str, k: int, offset: int = 0) -> list[dict]:
+        """Top k users for a metric"""
+        board = self.get(metric)
+        cache_lookup("leaderboard", self.ready)
+        if self.ready:
+            return board.top(k, offset)
+        # Each shard's index yields its own top offset+k; merge them in order
+        per_shard = []
+        for db in dbs:
+            cursor = (
+                db.users.find({}, {"_id": 0, "user_id": 1, metric: 1})
+                .sort([(metric, -1), ("user_id", 1)])
+                .limit(offset + k)
+            )
+            per_shard.append(await cursor.to_list(length=offset + k))
+        merged = heapq.merge(*per_shard, key=lambda user: Leaderboard._key(user["user_id"], user.get(metric, 0)))
+        return [
+            {"rank": offset + i + 1, "user_id": user["user_id"], metric: user.get(metric, 0)}
+            for i, user in enumerate(itertools.islice(merged, offset, offset + k))
+        ]
+
+    async def rank(self, dbs: list, user_db, metric: str, user_id: str) -> Optional[dict]:
+        """A single user's rank for a metric (user_db is the user's own shard)"""
+        board = self.get(metric)
+        cache_lookup("leaderboard", self.ready)
+        if self.ready:
+            return board.rank(user_id)
+        user = await user_db.users.find_one({"user_id": user_id}, {"_id": 0, metric: 1})
+        if user is None:
+            return None
+        score = user.get(metric, 0)
+        ahead = total = 0
+        for db in dbs:
+            ahead += await db.users.count_documents({
+                "$or": [
+                    {metric: {"$gt": score}},
+                    {metric: score, "user_id": {"$lt": user_id}}
+                ]
+            })
+            total += await db.users.estimated_document_count()
+        return {"rank": ahead + 1, "user_id": user_id, metric: score, "total": total}
+
+
+leaderboards = Leaderboards()
@@ -3,22 +3,151 @@ ChronoCharm - FastAPI Backend
 High-stakes productivity app for ADHD executive function
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
 from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
+import inspect
+import json
 import os
 from dotenv import load_dotenv
 
-from database import Database, ManaLedger
-from ai_service import OddsMaker, QuestLog
+from database import Database, ManaLedger, DailyRollups, StatsVersionConflict, BALANCE_FIELDS
+from ai_service import OddsMaker, QuestLog, build_slots_by_day, fallback_schedule
+from optimizer import score_schedule
+from leaderboard import leaderboards
+from events import event_bus, USE_CHANGE_STREAMS
+from idempotency import idempotency, IdempotencyConflict
+import transfer
+from log import get_logger, shutdown_logging
+from metrics import MetricsMiddleware, registry as metrics_registry
+from ratelimit import llm_admission, RateLimited
+from versions import versions, etag, etag_matches
+from health import health_state
+from profiling import ProfilingMiddleware, PROFILE_ENABLED
+from tracing import TracingMiddleware, TRACING_ENABLED, tracer, summarize
+from scheduling import Schedule, ScheduleStore, ScheduleVersionConflict, valid_entries, MAX_DAYS as SCHEDULE_MAX_DAYS
+from calendar_blocks import CalendarStore, parse_day, validate_availability, validate_block
+from quest_logs import QuestLogStore
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; stdlib json is used without it
+    orjson = None
 
 load_dotenv()
 
+logger = get_logger("api")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed"""
+    
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Seconds startup waits for Mongo before serving anyway (not ready, still retrying)
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "30"))
+STARTUP_RETRY_MAX = 30
+
+# Initialize AI service
+odds_maker = OddsMaker()
+
+# Startup retries and change-stream watchers, cancelled on shutdown
+background_tasks: list[asyncio.Task] = []
+
+health_state.register("mongo")
+health_state.register("indexes")
+health_state.register("leaderboards")
+health_state.register("ai", required=False)
+
+
+# === Startup & Shutdown ===
+
+def _on_remote_user(user: dict) -> None:
+    """Keep this worker's in-memory read models in sync with other workers' writes"""
+    leaderboards.record(user)
+    versions.record(user)
+
+
+async def _ensure_all_indexes() -> None:
+    await asyncio.gather(
+        Database.ensure_indexes(),
+        *(idempotency.ensure_indexes(db) for db in Database.all_dbs())
+    )
+
+
+async def _initialize_mongo() -> None:
+    """
+    Ping Mongo, then build indexes and load leaderboards concurrently
+    
+    Retries with backoff until everything succeeds, so a pod that started
+    before its database recovers on its own instead of staying unready.
+    """
+    delay = 1
+    while True:
+        if await health_state.run("mongo", Database.ping):
+            loaded = await asyncio.gather(
+                health_state.run("indexes", _ensure_all_indexes, timeout=STARTUP_TIMEOUT),
+                health_state.run("leaderboards", lambda: leaderboards.load(Database.all_dbs()),
+                                 timeout=STARTUP_TIMEOUT)
+            )
+            if all(loaded):
+                break
+        logger.warning("startup_retry", extra={"retry_in": delay, "checks": health_state.snapshot()})
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, STARTUP_RETRY_MAX)
+    
+    if USE_CHANGE_STREAMS:
+        for db in Database.all_dbs():
+            background_tasks.append(asyncio.create_task(
+                event_bus.watch_changes(db, on_user=_on_remote_user)
+            ))
+    logger.info("backend_ready")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Bring dependencies up concurrently, then serve
+    
+    Mongo initialization and Gemini warmup run side by side. If Mongo isn't
+    up within STARTUP_TIMEOUT the app starts anyway: /live passes, /ready
+    reports 503 and initialization keeps retrying in the background.
+    """
+    await Database.connect()
+    mongo_init = asyncio.create_task(_initialize_mongo())
+    background_tasks.append(mongo_init)
+    await asyncio.gather(
+        asyncio.wait({mongo_init}, timeout=STARTUP_TIMEOUT),
+        health_state.run("ai", lambda: run_in_threadpool(odds_maker.warmup), timeout=STARTUP_TIMEOUT)
+    )
+    if not health_state.ready:
+        logger.warning("started_not_ready", extra={"checks": health_state.snapshot()})
+    
+    yield
+    
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await Database.close()
+    shutdown_logging()
+
+
 app = FastAPI(
     title="ChronoCharm API",
     description="AI-powered high-stakes productivity for ADHD brains",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS for React frontend
@@ -26,29 +155,21 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:5175", "*"],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
     expose_headers=["*"]
 )
 
-# Initialize AI service
-odds_maker = OddsMaker()
-
-
-# === Startup & Shutdown ===
+# Per-route latency histograms, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
 
-@app.on_event("startup")
-async def startup():
-    """Connect to MongoDB on startup"""
-    await Database.connect()
-    print("✓ ChronoCharm backend ready")
-
-
-@app.on_event("shutdown")
-async def shutdown():
-    """Close MongoDB connection on shutdown"""
-    await Database.close()
+# Opt-in per-request profiling (PROFILE_ENABLED); absent from the stack otherwise
+if PROFILE_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
+# Request/ledger/Mongo spans (TRACING_ENABLED); outermost so it sees everything
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
 
 # === Request/Response Models ===
 
@@ -71,6 +192,9 @@ class WagerCompleteRequest(BaseModel):
     stake: int
     won: bool  # True = claimed bounty, False = time ran out
     user_id: str = "default"
+    minutes_focused: int = 0
+    duration_minutes: Optional[int] = None  # Timer length, for the quick-finish XP bonus
+    day: Optional[str] = None  # Client's local YYYY-MM-DD, so streaks follow the user's midnight
 
 
 class BalanceResponse(BaseModel):
@@ -90,41 +214,151 @@ class RPGStats(BaseModel):
     xpToNextLevel: int = 100
     title: str = "First Year"
     badges: list[str] = []
+    currentStreak: int = 0
+    lastCompletedDate: Optional[str] = None
+    version: int = 0  # Bumped on every stats write; echo it back in PATCH expected_version
+
+
+class StatsPatch(BaseModel):
+    inc: dict[str, int] = {}  # xp, endurance, focus, magic
+    set: dict[str, int | str] = {}  # level, xpToNextLevel, title
+    add_badges: list[str] = []
+    expected_version: Optional[int] = None
 
 
 # === Endpoints ===
 
 @app.get("/health")
 async def health():
-    """Health check endpoint"""
+    """Health check endpoint (kept for existing clients; same as /live)"""
+    return {"status": "ok", "service": "chronocharm"}
+
+
+@app.get("/live")
+async def live():
+    """Liveness probe: the event loop is responsive; never checks dependencies"""
     return {"status": "ok", "service": "chronocharm"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 only when every required dependency is up
+    
+    Mongo is re-pinged at most every READY_CHECK_INTERVAL seconds once
+    startup has finished; Gemini is reported but doesn't gate readiness.
+    """
+    if health_state.checks["indexes"]["ok"]:
+        await health_state.refresh("mongo", Database.ping)
+    is_ready = health_state.ready
+    return FastJSONResponse(
+        {"status": "ready" if is_ready else "not_ready", "checks": health_state.snapshot()},
+        status_code=200 if is_ready else 503
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of request, Mongo, LLM and cache metrics"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+BALANCE_PROJECTION = {"_id": 0, "balance_version": 1, **{f: 1 for f in BALANCE_FIELDS}}
+
+
+def _etag_headers(kind: str, version: int) -> dict:
+    # no-cache lets browsers keep the body but revalidate with If-None-Match every time
+    return {"ETag": etag(kind, version), "Cache-Control": "no-cache"}
+
+
+def _not_modified(user_id: str, kind: str, if_none_match: Optional[str]) -> Optional[Response]:
+    """
+    304 for a conditional GET whose ETag matches the in-memory version map
+    
+    Answered without touching Mongo; an unknown user/version falls through
+    to a normal read.
+    """
+    if not if_none_match:
+        return None
+    version = versions.get(user_id, kind)
+    if version is None or not etag_matches(if_none_match, etag(kind, version)):
+        return None
+    return Response(status_code=304, headers=_etag_headers(kind, version))
+
+
 @app.get("/api/balance", response_model=BalanceResponse)
-async def get_balance(user_id: str = "default"):
-    """Get user's current Mana balance and stats"""
+async def get_balance(user_id: str = "default", if_none_match: Optional[str] = Header(None)):
+    """
+    Get user's current Mana balance and stats
+    
+    Hot read path: the projected ledger document already has exactly the
+    BalanceResponse fields, so it is serialized directly instead of being
+    rebuilt as a model and re-validated through response_model. Responses
+    carry a weak ETag built from balance_version; If-None-Match is answered
+    with 304 from the version map.
+    """
+    not_modified = _not_modified(user_id, "balance", if_none_match)
+    if not_modified:
+        return not_modified
     try:
-        user = await ManaLedger.get_or_create_user(user_id)
-        return BalanceResponse(
-            user_id=user["user_id"],
-            balance=user["balance"],
-            total_earned=user["total_earned"],
-            total_lost=user["total_lost"],
-            quests_completed=user["quests_completed"]
-        )
+        user = await ManaLedger.get_or_create_user(user_id, BALANCE_PROJECTION)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    version = user.get("balance_version", 0)
+    versions.record({"user_id": user_id, "balance_version": version})
+    return FastJSONResponse(
+        {field: user[field] for field in BALANCE_FIELDS},
+        headers=_etag_headers("balance", version)
+    )
+
+
+@app.get("/api/profile")
+async def get_profile(user_id: str = "default", fields: Optional[str] = None):
+    """
+    Get balance and RPG stats together in one request
+    
+    `fields` is an optional comma-separated list of BalanceResponse/RPGStats
+    field names (e.g. "balance,level,xp") so clients fetch only what they render.
+    """
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        return FastJSONResponse(await ManaLedger.get_profile(user_id, requested))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def call_llm(endpoint: str, user_id: str, func, *args):
+    """
+    Run a blocking OddsMaker call behind admission control
+    
+    Over-limit requests fail fast with 429 + Retry-After; admitted ones run
+    in the threadpool so Gemini latency never blocks the event loop.
+    """
+    try:
+        async with llm_admission.admit(endpoint, user_id):
+            return await run_in_threadpool(func, *args)
+    except RateLimited as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": e.retry_after_header}
+        )
+
+
 @app.post("/api/breakdown")
 async def breakdown_assignment(request: BreakdownRequest):
     """
     Break down a large assignment into micro-tasks with AI
     Returns tasks, quote, and estimated time
+    
+    The result is also saved as a quest log (its id is returned as questId)
+    so clients can reload it from /api/quests instead of asking Gemini again.
     """
     try:
         # Ensure user exists and has balance
-        user = await ManaLedger.get_or_create_user(request.user_id)
+        user = await ManaLedger.get_or_create_user(request.user_id, {"_id": 1})
         
         # Use AI to break down the assignment
         # Format the request to include task count and wizard mode
@@ -132,7 +366,10 @@ async def breakdown_assignment(request: BreakdownRequest):
         if request.isWizardMode:
             prompt_suffix += " Use magical, wizard-themed language with emojis to make tasks more engaging and fun!"
         
-        quest_log = odds_maker.breakdown_assignment(request.assignment + prompt_suffix)
+        quest_log = await call_llm(
+            "breakdown", request.user_id,
+            odds_maker.breakdown_assignment, request.assignment + prompt_suffix
+        )
         
         # Transform quest_log to new format
         tasks = []
@@ -142,6 +379,8 @@ async def breakdown_assignment(request: BreakdownRequest):
                 "title": task.title,
                 "description": task.encouragement_quote,  # Use quote as description
                 "estimatedTime": f"{task.duration_minutes} min",
+                "stake": task.required_stake,
+                "bounty": task.reward_bounty,
                 "completed": False
             })
         
@@ -156,29 +395,151 @@ async def breakdown_assignment(request: BreakdownRequest):
         import random
         quote = random.choice(quotes)
         
+        total = f"{sum(t.duration_minutes for t in quest_log.tasks[:request.taskCount])} minutes"
+        
+        try:
+            quest_id = await QuestLogStore.create(request.user_id, request.assignment, tasks, quote, total)
+        except Exception as e:  # The Gemini result is still worth returning unsaved
+            logger.warning("quest_log_save_failed", extra={"user_id": request.user_id, "error": str(e)})
+            quest_id = None
+        
         return {
+            "questId": quest_id,
             "tasks": tasks,
             "quote": quote,
-            "totalEstimatedTime": f"{sum(t.duration_minutes for t in quest_log.tasks[:request.taskCount])} minutes"
+            "totalEstimatedTime": total
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI breakdown failed: {str(e)}")
 
 
-@app.post("/api/wager/start")
-async def start_wager(request: WagerStartRequest):
+@app.get("/api/quests")
+async def list_quests(user_id: str = "default", limit: int = 20, cursor: Optional[str] = None,
+                      fields: Optional[str] = None):
     """
-    Accept a wager - deduct stake from user balance
+    A user's saved quest logs, newest first
+    
+    Pass the returned nextCursor to get the following page (null on the
+    last one). fields picks what to return, e.g. fields=assignment,tasks.title,tasks.status
+    for a board view; id and createdAt are always included.
     """
     try:
-        updated_user = await ManaLedger.deduct_stake(request.user_id, request.stake)
-        
-        return {
+        return await QuestLogStore.page(user_id, limit, cursor, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/quests/{quest_id}")
+async def get_quest(quest_id: str, user_id: str = "default", fields: Optional[str] = None):
+    """One saved quest log"""
+    try:
+        quest = await QuestLogStore.get(user_id, quest_id, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if quest is None:
+        raise HTTPException(status_code=404, detail=f"Unknown quest '{quest_id}'")
+    return quest
+
+
+class QuestTaskUpdate(BaseModel):
+    status: str  # pending, active, completed, failed
+    user_id: str = "default"
+
+
+@app.patch("/api/quests/{quest_id}/tasks/{task_id}")
+async def update_quest_task(quest_id: str, task_id: str, update: QuestTaskUpdate):
+    """Record a task's state in its saved quest log"""
+    try:
+        found = await QuestLogStore.set_task_status(update.user_id, quest_id, task_id, update.status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail=f"Unknown task '{task_id}' in quest '{quest_id}'")
+    return {"success": True, "status": update.status}
+
+
+async def _start_wager(request: WagerStartRequest) -> dict:
+    updated_user = await ManaLedger.deduct_stake(request.user_id, request.stake)
+    event_bus.publish(request.user_id, "wager", {
+        "task_id": request.task_id,
+        "state": "started",
+        "stake": request.stake
+    })
+    
+    return {
+        "success": True,
+        "task_id": request.task_id,
+        "stake_deducted": request.stake,
+        "new_balance": updated_user["balance"]
+    }
+
+
+async def _complete_wager(request: WagerCompleteRequest) -> dict:
+    if request.won:
+        # User completed the task - award bounty + return stake
+        updated_user = await ManaLedger.award_bounty(
+            request.user_id,
+            request.bounty,
+            request.stake,
+            request.minutes_focused,
+            request.duration_minutes,
+            request.day
+        )
+        result = {
             "success": True,
-            "task_id": request.task_id,
-            "stake_deducted": request.stake,
+            "outcome": "won",
+            "bounty_awarded": request.bounty,
+            "stake_returned": request.stake,
+            "total_gain": request.bounty + request.stake,
+            "new_balance": updated_user["balance"],
+            "stats": RPGStats(**updated_user["stats"], version=updated_user["stats_version"]).model_dump()
+        }
+    else:
+        # User failed - stake is lost (already deducted)
+        updated_user = await ManaLedger.lose_stake(
+            request.user_id,
+            request.stake,
+            request.minutes_focused
+        )
+        result = {
+            "success": True,
+            "outcome": "lost",
+            "stake_lost": request.stake,
             "new_balance": updated_user["balance"]
         }
+    
+    event_bus.publish(request.user_id, "wager", {
+        "task_id": request.task_id,
+        "state": result["outcome"],
+        "stake": request.stake,
+        "bounty": request.bounty if request.won else 0
+    })
+    return result
+
+
+@app.post("/api/wager/start")
+async def start_wager(request: WagerStartRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Accept a wager - deduct stake from user balance
+    
+    Send an `Idempotency-Key` header to make client retries safe: repeats
+    of the same key replay the first response instead of deducting again.
+    """
+    try:
+        return await idempotency.run(
+            idempotency_key, "wager/start", request.user_id, request.model_dump(),
+            lambda: _start_wager(request)
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -186,119 +547,619 @@ async def start_wager(request: WagerStartRequest):
 
 
 @app.post("/api/wager/complete")
-async def complete_wager(request: WagerCompleteRequest):
+async def complete_wager(request: WagerCompleteRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Complete a wager - award bounty if won, record loss if time ran out
+    
+    A win also applies XP/level/streak progression server-side and returns
+    the updated stats, so clients need no follow-up stats write.
+    Accepts an optional `Idempotency-Key` header, as for /api/wager/start.
     """
     try:
-        if request.won:
-            # User completed the task - award bounty + return stake
-            updated_user = await ManaLedger.award_bounty(
-                request.user_id,
-                request.bounty,
-                request.stake
-            )
-            result = {
-                "success": True,
-                "outcome": "won",
-                "bounty_awarded": request.bounty,
-                "stake_returned": request.stake,
-                "total_gain": request.bounty + request.stake,
-                "new_balance": updated_user["balance"]
-            }
-        else:
-            # User failed - stake is lost (already deducted)
-            updated_user = await ManaLedger.lose_stake(request.user_id, request.stake)
-            result = {
-                "success": True,
-                "outcome": "lost",
-                "stake_lost": request.stake,
-                "new_balance": updated_user["balance"]
+        return await idempotency.run(
+            idempotency_key, "wager/complete", request.user_id, request.model_dump(),
+            lambda: _complete_wager(request)
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/history")
+async def get_history(user_id: str = "default", days: int = 90):
+    """
+    Daily wager history for charts (wins, losses, stake, bounty, minutes focused)
+    
+    Served from per-day rollup documents, so cost scales with `days`
+    rather than with the number of wagers settled.
+    """
+    try:
+        history = await DailyRollups.history(user_id, days)
+        return {
+            "user_id": user_id,
+            "days": history,
+            "totals": {
+                field: sum(day[field] for day in history)
+                for field in DailyRollups.FIELDS
             }
-        
-        return result
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/stats")
-async def get_stats(user_id: str = "default"):
-    """Get user's RPG stats"""
+@app.get("/api/stats", response_model=RPGStats)
+async def get_stats(user_id: str = "default", if_none_match: Optional[str] = Header(None)):
+    """Get user's RPG stats (served directly, with an ETag, like /api/balance)"""
+    not_modified = _not_modified(user_id, "stats", if_none_match)
+    if not_modified:
+        return not_modified
     try:
-        db = Database.get_db()
-        stats = await db.stats.find_one({"user_id": user_id})
-        
-        if not stats:
-            # Create default stats
-            default_stats = RPGStats().model_dump()
-            default_stats["user_id"] = user_id
-            await db.stats.insert_one(default_stats)
-            return RPGStats()
-        
-        return RPGStats(**{k: v for k, v in stats.items() if k != "_id" and k != "user_id"})
+        stats = await ManaLedger.get_stats(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    versions.record({"user_id": user_id, "stats_version": stats["version"]})
+    return FastJSONResponse(stats, headers=_etag_headers("stats", stats["version"]))
 
 
 @app.post("/api/stats")
 async def update_stats(stats: RPGStats, user_id: str = "default"):
     """Update user's RPG stats"""
     try:
-        db = Database.get_db()
-        stats_dict = stats.model_dump()
-        stats_dict["user_id"] = user_id
-        
-        await db.stats.update_one(
-            {"user_id": user_id},
-            {"$set": stats_dict},
-            upsert=True
-        )
+        await ManaLedger.set_stats(user_id, stats.model_dump(exclude={"version"}))
         
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.patch("/api/stats")
+async def patch_stats(patch: StatsPatch, user_id: str = "default"):
+    """
+    Apply stat deltas instead of overwriting the whole document
+    
+    `inc` adds to counters, `add_badges` appends without duplicates and
+    `set` replaces single fields. Pass the `version` from a previous read as
+    `expected_version` to reject the write (409) if the stats changed since.
+    """
+    try:
+        stats = await ManaLedger.patch_stats(
+            user_id,
+            inc=patch.inc,
+            set_fields=patch.set,
+            add_badges=patch.add_badges,
+            expected_version=patch.expected_version
+        )
+        return RPGStats(**stats)
+    except StatsVersionConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "stats": e.stats, "version": e.version}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/reset")
 async def reset_user(user_id: str = "default"):
     """
     Reset user balance to starting value (for testing)
     """
     try:
-        db = Database.get_db()
-        await db.users.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "balance": ManaLedger.STARTING_MANA,
-                    "total_earned": 0,
-                    "total_lost": 0,
-                    "quests_completed": 0
-                }
-            }
-        )
+        await ManaLedger.reset_user(user_id)
         return {"success": True, "balance": ManaLedger.STARTING_MANA}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/leaderboard/{metric}")
+async def get_leaderboard(metric: str, limit: int = 10, offset: int = 0):
+    """Top users by total_earned or quests_completed"""
+    limit = max(1, min(limit, 100))
+    try:
+        entries = await leaderboards.top(Database.all_dbs(), metric, limit, max(0, offset))
+        return {"metric": metric, "entries": entries}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/leaderboard/{metric}/rank")
+async def get_leaderboard_rank(metric: str, user_id: str = "default"):
+    """A single user's position on a leaderboard"""
+    try:
+        entry = await leaderboards.rank(
+            Database.all_dbs(), Database.get_db(user_id), metric, user_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"User '{user_id}' is not ranked")
+    return entry
+
+
+@app.websocket("/ws")
+async def updates_socket(websocket: WebSocket, user_id: str = "default"):
+    """
+    Push channel for balance, stats, wager-state, schedule and calendar changes
+    
+    Sends a {"type": "profile"} snapshot on connect, then one
+    {"type": "balance" | "stats" | "wager" | "schedule" | "calendar", "data": ...}
+    message per change.
+    Clients may send anything (e.g. "ping") to keep the connection alive.
+    """
+    await websocket.accept()
+    with event_bus.subscribe(user_id) as queue:
+        try:
+            profile = await ManaLedger.get_profile(user_id)
+            await websocket.send_json({"type": "profile", "user_id": user_id, "data": profile})
+            
+            receiver = asyncio.create_task(_drain_client(websocket))
+            try:
+                while not receiver.done():
+                    getter = asyncio.create_task(queue.get())
+                    done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter not in done:
+                        getter.cancel()
+                        break
+                    await websocket.send_json(getter.result())
+            finally:
+                receiver.cancel()
+        except WebSocketDisconnect:
+            pass
+
+
+async def _drain_client(websocket: WebSocket) -> None:
+    """Read (and ignore) client messages until the socket closes"""
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+def require_admin(token: Optional[str]):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is configured and matches"""
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/api/admin/traces")
+async def list_traces(limit: int = 20, min_duration_ms: float = 0, x_admin_token: Optional[str] = Header(None)):
+    """
+    Most recent traces (memory exporter) with round-trip counts and critical path
+    
+    Traces still in flight are skipped until their root span has ended.
+    """
+    require_admin(x_admin_token)
+    if tracer.memory is None:
+        raise HTTPException(status_code=404, detail="Tracing with the memory exporter is not enabled")
+    summaries = []
+    for spans in reversed(tracer.memory.traces().values()):
+        if len(summaries) >= max(1, min(limit, 200)):
+            break
+        if not any(span.kind == "SERVER" for span in spans):
+            continue
+        summary = summarize(spans)
+        if summary["duration_ms"] >= min_duration_ms:
+            summaries.append(summary)
+    return {"traces": summaries}
+
+
+@app.get("/api/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Every recorded span of one trace, in OTLP/JSON field names"""
+    require_admin(x_admin_token)
+    if tracer.memory is None:
+        raise HTTPException(status_code=404, detail="Tracing with the memory exporter is not enabled")
+    spans = tracer.memory.traces().get(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"Unknown trace '{trace_id}'")
+    return {"summary": summarize(spans), "spans": [span.to_dict() for span in spans]}
+
+
+@app.get("/api/admin/export/{collection}")
+async def export_collection(collection: str, x_admin_token: Optional[str] = Header(None)):
+    """Stream a whole collection as NDJSON (any per-user collection, e.g. users, stats, quest_logs)"""
+    require_admin(x_admin_token)
+    try:
+        transfer.check_collection(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return StreamingResponse(
+        transfer.export_ndjson(collection),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{collection}.ndjson"'}
+    )
+
+
+@app.post("/api/admin/import/{collection}")
+async def import_collection(collection: str, request: Request, mode: str = "upsert",
+                            x_admin_token: Optional[str] = Header(None)):
+    """Bulk-load an NDJSON request body into a collection"""
+    require_admin(x_admin_token)
+    try:
+        transfer.check_collection(collection)
+        return await transfer.import_ndjson(collection, transfer.iter_lines(request.stream()), mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# === Calendar ===
+
+class CalendarBlockRequest(BaseModel):
+    date: str  # YYYY-MM-DD of the (first) occurrence
+    hour: int
+    hours: int = 1
+    title: str = ""
+    repeat: Optional[str] = None  # daily, weekdays, weekly
+    until: Optional[str] = None
+    user_id: str = "default"
+
+
+@app.get("/api/calendar/blocks")
+async def get_calendar_blocks(user_id: str = "default"):
+    """The user's busy blocks and calendar version"""
+    try:
+        calendar = await CalendarStore.get(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": calendar["version"], "blocks": list(calendar["blocks"].values())}
+
+
+@app.post("/api/calendar/blocks")
+async def add_calendar_block(request: CalendarBlockRequest):
+    """Add a busy block: one-off, multi-hour (may run past midnight) or recurring"""
+    try:
+        block = validate_block(request.title, request.date, request.hour, request.hours, request.repeat, request.until)
+        version = await CalendarStore.add_block(request.user_id, block)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": version, "block": block}
+
+
+@app.delete("/api/calendar/blocks/{block_id}")
+async def remove_calendar_block(block_id: str, user_id: str = "default"):
+    """Remove a block (every occurrence of a recurring one)"""
+    try:
+        version = await CalendarStore.remove_block(user_id, block_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": version}
+
+
+class AvailabilityTemplate(BaseModel):
+    # Free windows {date, hour, hours, repeat?, until?}; exceptions carve hours out
+    windows: list[dict]
+    exceptions: list[dict] = []
+
+
+class AvailabilityRequest(AvailabilityTemplate):
+    user_id: str = "default"
+
+
+@app.get("/api/calendar/availability")
+async def get_availability(user_id: str = "default"):
+    """The user's availability template (null: every unblocked hour is free)"""
+    try:
+        calendar = await CalendarStore.get(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": calendar["version"], "availability": calendar["availability"]}
+
+
+@app.put("/api/calendar/availability")
+async def set_availability(request: AvailabilityRequest):
+    """Replace the availability template, e.g. weekdays 9-17 except holidays"""
+    try:
+        template = validate_availability(request.windows, request.exceptions)
+        version = await CalendarStore.set_availability(request.user_id, template)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": version, "availability": template}
+
+
+@app.delete("/api/calendar/availability")
+async def clear_availability(user_id: str = "default"):
+    """Drop the template so every unblocked hour counts as free again"""
+    try:
+        version = await CalendarStore.set_availability(user_id, None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": version}
+
+
+@app.get("/api/calendar/free")
+async def get_free_slots(start: str, days: int = 7, min_hours: int = 1, user_id: str = "default"):
+    """Free runs of at least min_hours in the `days` days from start (template minus blocks)"""
+    try:
+        slots = await CalendarStore.free_slots(user_id, parse_day(start), days, min_hours)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"start": start, "days": days, "slots": slots}
+
+
 class ScheduleRequest(BaseModel):
     tasks: list
-    available_hours: list
+    # Either the free hours themselves, or a date range read from the stored calendar
+    available_hours: Optional[list] = None
+    start_date: Optional[str] = None
+    days: int = 7
+    availability: Optional[AvailabilityTemplate] = None  # overrides the stored template
+    strategy: str = "llm"  # or "optimizer" to skip Gemini
+    user_id: str = "default"
+
+
+SCHEDULE_STRATEGIES = ("llm", "optimizer")
 
 
 @app.post("/api/schedule")
 async def schedule_tasks(request: ScheduleRequest):
     """
     Use AI to intelligently schedule tasks into available time slots
+    
+    The plan is checked against the free hours (overlaps and out-of-range
+    slots are moved to the next free run) and saved as the user's schedule,
+    which /api/schedule/replan then adjusts incrementally. Without
+    available_hours, the free hours of start_date + days come from the
+    stored calendar (dayIndex 0 is start_date): the availability template,
+    given inline or stored, expanded over just that range, minus blocks.
+    
+    The response's `score` rates the saved plan on the optimizer's scale
+    and `source` says whether it came from Gemini or the optimizer, so both
+    strategies can be compared on the same input.
+    """
+    try:
+        if request.strategy not in SCHEDULE_STRATEGIES:
+            raise ValueError(f"Unknown strategy '{request.strategy}'. Choose from: {', '.join(SCHEDULE_STRATEGIES)}")
+        available_hours = request.available_hours
+        if available_hours is None:
+            if not request.start_date:
+                raise ValueError("Send available_hours or a start_date")
+            if request.days > SCHEDULE_MAX_DAYS:
+                raise ValueError(f"days must be at most {SCHEDULE_MAX_DAYS}")
+            template = request.availability and validate_availability(
+                request.availability.windows, request.availability.exceptions
+            )
+            available_hours = await CalendarStore.available_hours(
+                request.user_id, parse_day(request.start_date), request.days, template
+            )
+        if request.strategy == "optimizer":
+            result = await run_in_threadpool(fallback_schedule, request.tasks, build_slots_by_day(available_hours))
+        else:
+            result = await call_llm(
+                "schedule", request.user_id,
+                odds_maker.schedule_tasks, request.tasks, available_hours
+            )
+            if request.tasks and not valid_entries(result.get("schedule"), len(request.tasks)):
+                # Nothing usable in Gemini's answer; place everything with the optimizer
+                result = await run_in_threadpool(fallback_schedule, request.tasks, build_slots_by_day(available_hours))
+        placements = valid_entries(result.get("schedule"), len(request.tasks))
+        proposed = {entry["taskIndex"]: entry for entry in placements}
+        schedule = Schedule.plan(request.tasks, available_hours, placements)
+        version = await ScheduleStore.save(request.user_id, schedule)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    entries = []
+    for entry in schedule.entries():
+        original = proposed.get(entry["taskIndex"], {})
+        kept = (original.get("dayIndex"), original.get("startHour")) == (entry["dayIndex"], entry["startHour"])
+        entries.append({
+            **entry,
+            "reasoning": original.get("reasoning", "") if kept else "Moved to the next free slot"
+        })
+    return {
+        **result,
+        "schedule": entries,
+        "unscheduled": schedule.unscheduled,
+        "version": version,
+        "score": score_schedule(request.tasks, build_slots_by_day(available_hours), entries),
+    }
+
+
+@app.get("/api/schedule")
+async def get_schedule(user_id: str = "default"):
+    """The user's persisted schedule"""
+    try:
+        schedule = await ScheduleStore.get(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if schedule is None:
+        raise HTTPException(status_code=404, detail=f"No schedule for '{user_id}'")
+    return schedule
+
+
+class ScheduleChange(BaseModel):
+    type: str  # completed, failed, blocked, unblocked, moved
+    task_id: Optional[str] = None
+    dayIndex: Optional[int] = None
+    hour: Optional[int] = None
+    hours: int = 1
+
+
+class ReplanRequest(BaseModel):
+    changes: list[ScheduleChange]
+    expected_version: Optional[int] = None
+    user_id: str = "default"
+
+
+@app.post("/api/schedule/replan")
+async def replan_schedule(request: ReplanRequest):
+    """
+    Adjust the persisted schedule for what changed, without asking Gemini
+    
+    - completed (task_id, optional hour it finished): back-to-back tasks after it move up
+    - failed (task_id): the task is retried in the next free slot after its old one
+    - blocked / unblocked (dayIndex, hour, hours): only overlapping tasks move
+    - moved (task_id, dayIndex, hour): tasks in the way move to their next free slot
+    
+    Returns the new version and only the tasks that moved.
     """
     try:
-        result = odds_maker.schedule_tasks(request.tasks, request.available_hours)
-        return result
+        return await ScheduleStore.replan(
+            request.user_id,
+            [change.model_dump() for change in request.changes],
+            request.expected_version
+        )
+    except ScheduleVersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.version})
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# === Batch ===
+
+class BatchOperation(BaseModel):
+    op: str
+    args: dict = {}
+    id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation]
+
+
+def _query(endpoint, **fixed):
+    """
+    Args model and handler for an endpoint that takes only query/path parameters
+    
+    The model is built from the endpoint's signature, so batch args are
+    coerced and checked the way FastAPI checks the query string. Parameters
+    in `fixed` (headers) are passed as given instead of read from args.
+    """
+    fields = {
+        name: (param.annotation, ... if param.default is param.empty else param.default)
+        for name, param in inspect.signature(endpoint).parameters.items() if name not in fixed
+    }
+    model = create_model(f"{endpoint.__name__}_args", __config__=ConfigDict(extra="forbid"), **fields)
+    return model, lambda args: endpoint(**dict(args), **fixed)
+
+
+def _with_params(body: type[BaseModel], **params) -> type[BaseModel]:
+    """Args model for an endpoint that takes a body plus query/header parameters"""
+    return create_model(f"{body.__name__}Args", __base__=body, **params)
+
+
+def _body(args: BaseModel, body: type[BaseModel]) -> BaseModel:
+    return body(**args.model_dump(include=set(body.model_fields)))
+
+
+# op name -> (mutates user state, args model, handler taking the validated args)
+BATCH_OPERATIONS = {
+    "balance": (False, *_query(get_balance, if_none_match=None)),
+    "profile": (False, *_query(get_profile)),
+    "stats": (False, *_query(get_stats, if_none_match=None)),
+    "stats.update": (True, _with_params(RPGStats, user_id=(str, "default")),
+                     lambda a: update_stats(_body(a, RPGStats), a.user_id)),
+    "stats.patch": (True, _with_params(StatsPatch, user_id=(str, "default")),
+                    lambda a: patch_stats(_body(a, StatsPatch), a.user_id)),
+    "history": (False, *_query(get_history)),
+    "leaderboard": (False, *_query(get_leaderboard)),
+    "leaderboard.rank": (False, *_query(get_leaderboard_rank)),
+    "wager.start": (True, _with_params(WagerStartRequest, idempotency_key=(Optional[str], None)),
+                    lambda a: start_wager(_body(a, WagerStartRequest), a.idempotency_key)),
+    "wager.complete": (True, _with_params(WagerCompleteRequest, idempotency_key=(Optional[str], None)),
+                       lambda a: complete_wager(_body(a, WagerCompleteRequest), a.idempotency_key)),
+    "breakdown": (True, BreakdownRequest, breakdown_assignment),
+    "quests": (False, *_query(list_quests)),
+    "quest": (False, *_query(get_quest)),
+    "schedule": (True, ScheduleRequest, schedule_tasks),
+    "schedule.get": (False, *_query(get_schedule)),
+    "schedule.replan": (True, ReplanRequest, replan_schedule),
+    "calendar.blocks": (False, *_query(get_calendar_blocks)),
+    "calendar.free": (False, *_query(get_free_slots)),
+    "calendar.availability": (False, *_query(get_availability)),
+}
+
+MAX_BATCH_OPERATIONS = 50
+
+
+def _batch_body(result):
+    """Unwrap handler results that were already rendered as JSON responses"""
+    if isinstance(result, JSONResponse):
+        return orjson.loads(result.body) if orjson else json.loads(result.body)
+    if isinstance(result, BaseModel):
+        return result.model_dump()
+    return result
+
+
+async def _run_batch_operation(operation: BatchOperation, after: list[asyncio.Task]) -> dict:
+    if after:
+        await asyncio.wait(after)
+    entry = {"id": operation.id, "op": operation.op}
+    if operation.op not in BATCH_OPERATIONS:
+        entry.update(status=400, error=f"Unknown operation '{operation.op}'")
+        return entry
+    _, args_model, handler = BATCH_OPERATIONS[operation.op]
+    try:
+        args = args_model.model_validate(operation.args)
+    except ValidationError as e:
+        entry.update(status=422, error=e.errors(include_url=False, include_context=False))
+        return entry
+    try:
+        entry["status"] = 200
+        entry["body"] = _batch_body(await handler(args))
+    except HTTPException as e:
+        entry.update(status=e.status_code, error=e.detail)
+    except Exception as e:
+        entry.update(status=500, error=str(e))
+    return entry
+
+
+@app.post("/api/batch")
+async def batch(request: BatchRequest):
+    """
+    Run several API operations in one HTTP request
+    
+    Each operation names one of BATCH_OPERATIONS and passes that endpoint's
+    parameters in `args`. Operations run concurrently, except that a
+    mutation and any other operation on the same user_id keep their
+    request order. Results come back in request order, each with its own
+    status and body (or error).
+    """
+    if len(request.operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+    
+    tasks: list[asyncio.Task] = []
+    lanes: list[tuple[Optional[str], bool]] = []
+    for operation in request.operations:
+        mutates = BATCH_OPERATIONS.get(operation.op, (False, None))[0]
+        # Leaderboard pages aren't tied to a user, so they never wait on anything
+        user = None if operation.op == "leaderboard" else operation.args.get("user_id", "default")
+        after = [
+            task for task, (other_user, other_mutates) in zip(tasks, lanes)
+            if user is not None and other_user == user and (mutates or other_mutates)
+        ]
+        tasks.append(asyncio.create_task(_run_batch_operation(operation, after)))
+        lanes.append((user, mutates))
+    
+    return {"results": list(await asyncio.gather(*tasks))}
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8004))
@@ -0,0 +1,237 @@
+"""
+ChronoCharm - Metrics
+Low-overhead in-process counters and histograms in Prometheus text format
+"""
+
+import asyncio
+import bisect
+import contextlib
+import functools
+import threading
+import time
+from typing import Callable, ContextManager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by label values"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "chronocharm_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status")
+)
+operation_duration = registry.histogram(
+    "chronocharm_operation_duration_seconds",
+    "Latency of instrumented Mongo and LLM operations",
+    ("component", "operation")
+)
+operation_errors = registry.counter(
+    "chronocharm_operation_errors_total",
+    "Instrumented operations that raised",
+    ("component", "operation")
+)
+llm_calls = registry.counter(
+    "chronocharm_llm_calls_total",
+    "Gemini calls by outcome (ok, error, fallback)",
+    ("operation", "outcome")
+)
+cache_requests = registry.counter(
+    "chronocharm_cache_requests_total",
+    "Cache lookups by cache name and result (hit, miss)",
+    ("cache", "result")
+)
+
+
+# Context-manager factories entered around every tracked call (the profiler
+# registers one). Empty unless something opts in, so tracked calls pay one check.
+operation_hooks: list[Callable[[str, str], ContextManager]] = []
+
+
+def add_operation_hook(hook: Callable[[str, str], ContextManager]) -> None:
+    if hook not in operation_hooks:
+        operation_hooks.append(hook)
+
+
+@contextlib.contextmanager
+def _hooked(component: str, operation: str):
+    with contextlib.ExitStack() as stack:
+        for hook in operation_hooks:
+            stack.enter_context(hook(component, operation))
+        yield
+
+
+def track(component: str, operation: str) -> Callable:
+    """
+    Decorator recording latency (and errors) of a sync or async function
+
+    component is "mongo" or "llm"; operation is usually the method name.
+    Any registered operation_hooks are entered around the call.
+    """
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    if operation_hooks:
+                        with _hooked(component, operation):
+                            return await func(*args, **kwargs)
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    operation_errors.inc(component, operation)
+                    raise
+                finally:
+                    operation_duration.observe(time.perf_counter() - start, component, operation)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                if operation_hooks:
+                    with _hooked(component, operation):
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
+            except BaseException:
+                operation_errors.inc(component, operation)
+                raise
+            finally:
+                operation_duration.observe(time.perf_counter() - start, component, operation)
+        return sync_wrapper
+
+    return decorator
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    cache_requests.inc(cache, "hit" if hit else "miss")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request by its route template
+
+    Using the matched route's path (e.g. /api/leaderboard/{metric}) keeps
+    label cardinality bounded; unmatched paths are grouped as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status["code"]
+            )
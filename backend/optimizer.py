@@ -0,0 +1,278 @@
+"""
+ChronoCharm - Schedule Optimizer
+Scores schedules against the scheduling rules and builds good ones without Gemini
+
+The score mirrors the rules in the scheduling prompt:
+    fit        - complex tasks in peak energy (9-12, 14-17), simple tasks in
+                 low energy; sleeping hours (energy 0) count against any task
+    buffer     - intense tasks booked back-to-back are penalised
+    grouping   - simple tasks next to each other earn a small bonus
+    spread     - per-day load is penalised convexly, more so past DAILY_HOURS
+    earliness  - a small per-day cost breaks ties towards sooner
+    unscheduled- tasks left out cost more than any placement could earn
+
+Every term is local to a task, a day or a pair of touching tasks, so
+inserting or removing one task changes the score by an O(1) delta. The
+optimizer places tasks greedily (heaviest first, best day by that delta)
+and then hill-climbs with random relocate and swap moves until the local
+search budget (OPTIMIZER_BUDGET_MS, default 20ms) runs out.
+"""
+
+import math
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+OPTIMIZER_BUDGET_MS = float(os.getenv("OPTIMIZER_BUDGET_MS", "20"))
+
+HOURS_PER_DAY = 24
+ENERGY_CURVE = (
+    0, 0, 0, 0, 0, 0, 0.2, 0.3, 0.6, 1, 1, 1,
+    0.6, 0.6, 1, 1, 1, 0.6, 0.4, 0.3, 0.3, 0.2, 0, 0,
+)
+TIERS = ("simple", "moderate", "complex")
+TIER_TARGET = (0.3, 0.6, 1.0)
+TIER_WEIGHT = (1.0, 1.5, 2.0)
+
+DAILY_HOURS = 6
+SPREAD_WEIGHT = 0.05
+OVERLOAD_WEIGHT = 0.5
+BUFFER_PENALTY = {(2, 2): 1.0, (1, 2): 0.5, (2, 1): 0.5}
+GROUP_BONUS = 0.2
+EARLINESS = 0.02
+UNSCHEDULED_PENALTY = 10.0
+
+# Hour -> fit per tier, and prefix sums so a block's fit is one subtraction
+FIT = tuple(
+    tuple(-1.0 if energy == 0 else 1 - abs(energy - target) for energy in ENERGY_CURVE)
+    for target in TIER_TARGET
+)
+FIT_PREFIX = tuple(
+    tuple(sum(fit[:hour]) for hour in range(HOURS_PER_DAY + 1)) for fit in FIT
+)
+# (tier, hours) -> start hours from best to worst fit
+RANKED_STARTS = {
+    (tier, hours): sorted(
+        range(HOURS_PER_DAY - hours + 1),
+        key=lambda start, tier=tier, hours=hours: -(FIT_PREFIX[tier][start + hours] - FIT_PREFIX[tier][start])
+    )
+    for tier in range(len(TIERS))
+    for hours in range(1, HOURS_PER_DAY + 1)
+}
+
+
+def complexity_tier(stake: int) -> int:
+    """0 simple, 1 moderate, 2 complex (same cut-offs as the prompt)"""
+    return 0 if stake < 15 else 1 if stake < 25 else 2
+
+
+def _load_cost(load: int) -> float:
+    return SPREAD_WEIGHT * load * load + OVERLOAD_WEIGHT * max(0, load - DAILY_HOURS) ** 2
+
+
+def _pair(left: int, right: int) -> float:
+    """Score of two touching tasks, by tier"""
+    if left == 0 and right == 0:
+        return GROUP_BONUS
+    return -BUFFER_PENALTY.get((left, right), 0.0)
+
+
+def _mask(hours: List[int]) -> int:
+    """Bitmask of the given hours; repeats set their bit once"""
+    mask = 0
+    for hour in set(hours):
+        mask |= 1 << hour
+    return mask
+
+
+class _State:
+    """Placements plus per-day occupancy, with exact O(1) score deltas"""
+
+    def __init__(self, tasks: List[dict], slots_by_day: Dict[int, List[int]]):
+        self.hours = [min(HOURS_PER_DAY, max(1, math.ceil(t.get("estimatedMinutes", 60) / 60))) for t in tasks]
+        self.tier = [complexity_tier(t.get("stake", 10)) for t in tasks]
+        self.weight = [TIER_WEIGHT[tier] for tier in self.tier]
+        self.days = sorted(day for day, hours in slots_by_day.items() if hours)
+        self.free = {day: _mask(slots_by_day[day]) for day in self.days}
+        self.owner = {day: [-1] * HOURS_PER_DAY for day in self.days}
+        self.load = {day: 0 for day in self.days}
+        self.placement: List[Optional[tuple]] = [None] * len(tasks)
+        # day -> {(tier, hours): best start}, dropped whenever that day changes
+        self.best: Dict[int, Dict[tuple, Optional[int]]] = {}
+        self.terms = {"fit": 0.0, "buffer": 0.0, "spread": 0.0, "earliness": 0.0,
+                      "unscheduled": -UNSCHEDULED_PENALTY * sum(self.weight)}
+
+    def score(self) -> float:
+        return sum(self.terms.values())
+
+    def fits(self, day: int, start: int, hours: int) -> bool:
+        mask = ((1 << hours) - 1) << start
+        return start + hours <= HOURS_PER_DAY and self.free[day] & mask == mask
+
+    def best_start(self, task: int, day: int) -> Optional[int]:
+        cached = self.best.setdefault(day, {})
+        key = (self.tier[task], self.hours[task])
+        if key not in cached:
+            cached[key] = self._best_start(day, *key)
+        return cached[key]
+
+    def _best_start(self, day: int, tier: int, hours: int) -> Optional[int]:
+        free = runs = self.free[day]
+        for i in range(1, hours):
+            runs &= free >> i
+        if runs:
+            for start in RANKED_STARTS[tier, hours]:
+                if runs >> start & 1:
+                    return start
+        return None
+
+    def _changed(self, day: int) -> None:
+        self.best.pop(day, None)
+
+    def _delta(self, task: int, day: int, start: int) -> dict:
+        """Term changes from inserting task at (day, start), which must be free"""
+        hours, tier, owner = self.hours[task], self.tier[task], self.owner[day]
+        buffer = 0.0
+        if start > 0 and owner[start - 1] >= 0:
+            buffer += _pair(self.tier[owner[start - 1]], tier)
+        if start + hours < HOURS_PER_DAY and owner[start + hours] >= 0:
+            buffer += _pair(tier, self.tier[owner[start + hours]])
+        return {
+            "fit": self.weight[task] * (FIT_PREFIX[tier][start + hours] - FIT_PREFIX[tier][start]),
+            "buffer": buffer,
+            "spread": _load_cost(self.load[day]) - _load_cost(self.load[day] + hours),
+            "earliness": -EARLINESS * self.weight[task] * day,
+            "unscheduled": UNSCHEDULED_PENALTY * self.weight[task],
+        }
+
+    def insert_gain(self, task: int, day: int, start: int) -> float:
+        """sum(_delta(...).values()) without building the dict (the greedy's hot path)"""
+        hours, tier, weight, owner, load = self.hours[task], self.tier[task], self.weight[task], self.owner[day], self.load[day]
+        gain = (weight * (FIT_PREFIX[tier][start + hours] - FIT_PREFIX[tier][start] - EARLINESS * day + UNSCHEDULED_PENALTY)
+                + _load_cost(load) - _load_cost(load + hours))
+        if start > 0 and owner[start - 1] >= 0:
+            gain += _pair(self.tier[owner[start - 1]], tier)
+        if start + hours < HOURS_PER_DAY and owner[start + hours] >= 0:
+            gain += _pair(tier, self.tier[owner[start + hours]])
+        return gain
+
+    def insert(self, task: int, day: int, start: int) -> None:
+        for term, change in self._delta(task, day, start).items():
+            self.terms[term] += change
+        hours = self.hours[task]
+        self.free[day] &= ~(((1 << hours) - 1) << start)
+        self.load[day] += hours
+        self.owner[day][start:start + hours] = [task] * hours
+        self.placement[task] = (day, start)
+        self._changed(day)
+
+    def remove(self, task: int) -> tuple:
+        day, start = self.placement[task]
+        hours = self.hours[task]
+        self.free[day] |= ((1 << hours) - 1) << start
+        self.load[day] -= hours
+        self.owner[day][start:start + hours] = [-1] * hours
+        self.placement[task] = None
+        self._changed(day)
+        for term, change in self._delta(task, day, start).items():
+            self.terms[term] -= change
+        return day, start
+
+    def best_placement(self, task: int, days: List[int]) -> Optional[tuple]:
+        best, best_gain = None, float("-inf")
+        for day in days:
+            start = self.best_start(task, day)
+            if start is None:
+                continue
+            gain = self.insert_gain(task, day, start)
+            if gain > best_gain:
+                best, best_gain = (day, start), gain
+        return best
+
+
+def _schedule(state: _State) -> List[dict]:
+    return [
+        {"taskIndex": task, "dayIndex": day, "startHour": start,
+         "reasoning": f"{TIERS[state.tier[task]].capitalize()} task at energy {ENERGY_CURVE[start]:g}"}
+        for task, placement in enumerate(state.placement) if placement
+        for day, start in (placement,)
+    ]
+
+
+def _summary(state: _State) -> dict:
+    return {"total": round(state.score(), 3), **{term: round(value, 3) for term, value in state.terms.items()}}
+
+
+def score_schedule(tasks: List[dict], slots_by_day: Dict[int, List[int]], schedule: List[dict]) -> dict:
+    """
+    Score an existing schedule (e.g. Gemini's) on the optimizer's scale
+
+    Entries outside the free hours, overlapping another task or naming an
+    unknown task count as unscheduled.
+    """
+    state = _State(tasks, slots_by_day)
+    for entry in schedule:
+        task, day, start = entry.get("taskIndex"), entry.get("dayIndex"), entry.get("startHour")
+        if (isinstance(task, int) and 0 <= task < len(tasks) and state.placement[task] is None
+                and day in state.free and isinstance(start, int) and start >= 0
+                and state.fits(day, start, state.hours[task])):
+            state.insert(task, day, start)
+    return _summary(state)
+
+
+def optimize(tasks: List[dict], slots_by_day: Dict[int, List[int]],
+             time_budget_ms: float = OPTIMIZER_BUDGET_MS, seed: int = 0) -> dict:
+    """Greedy placement, then local search for time_budget_ms; returns schedule and score"""
+    state = _State(tasks, slots_by_day)
+    order = sorted(range(len(tasks)), key=lambda task: (-state.weight[task] * state.hours[task], task))
+    for task in order:
+        placement = state.best_placement(task, state.days)
+        if placement:
+            state.insert(task, *placement)
+
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + time_budget_ms / 1000
+    iterations = 0
+    while tasks and state.days:
+        if iterations % 32 == 0 and time.perf_counter() >= deadline:
+            break
+        iterations += 1
+        task = rng.randrange(len(tasks))
+        if rng.random() < 0.5:
+            _try_relocate(state, task, rng.choice(state.days))
+        else:
+            _try_swap(state, task, rng.randrange(len(tasks)))
+
+    return {"schedule": _schedule(state), "score": _summary(state), "iterations": iterations}
+
+
+def _try_relocate(state: _State, task: int, day: int) -> None:
+    """Move a task to its best start on another day if that scores higher"""
+    before = state.score()
+    old = state.remove(task) if state.placement[task] else None
+    start = state.best_start(task, day)
+    if start is not None and (day, start) != old and before < state.score() + state.insert_gain(task, day, start):
+        state.insert(task, day, start)
+    elif old:
+        state.insert(task, *old)
+
+
+def _try_swap(state: _State, first: int, second: int) -> None:
+    """Exchange two placed tasks' start slots if both fit and the score rises"""
+    a, b = state.placement[first], state.placement[second]
+    if first == second or not a or not b:
+        return
+    before = state.score()
+    state.remove(first)
+    state.remove(second)
+    if state.fits(*b, state.hours[first]):
+        state.insert(first, *b)
+        if state.fits(*a, state.hours[second]):
+            state.insert(second, *a)
+            if state.score() > before:
+                return
+            state.remove(second)
+        state.remove(first)
+    state.insert(first, *a)
+    state.insert(second, *b)
@@ -0,0 +1,274 @@
+"""
+ChronoCharm - Request Profiling
+Opt-in sampling profiler that writes one collapsed-stack file per request
+
+Enable with PROFILE_ENABLED=1; nothing is installed otherwise. A request
+is then profiled when it sends `X-Profile: <PROFILE_TOKEN>` (any value if
+no token is set) or is picked by PROFILE_SAMPLE_RATE (0-1). Only paths
+starting with one of PROFILE_PATHS (default "/api/") are eligible, and at
+most PROFILE_MAX_ACTIVE requests are profiled at once.
+
+A sampler thread records the request task's async stack every
+PROFILE_INTERVAL_MS, including while it is suspended, so the output is
+wall-clock. Each stack is rooted at a category frame:
+    cpu    - the task was executing Python on the event loop
+    mongo  - suspended inside a tracked Mongo operation
+    llm    - suspended inside a tracked Gemini call (threadpool)
+    wait   - suspended on anything else (admission queue, other tasks)
+
+Output goes to PROFILE_DIR as <stamp>-<route>-<id>.folded (feed it to
+flamegraph.pl, speedscope or inferno) plus a .json summary with exact
+Mongo/LLM time and every tracked operation. Profiled responses carry a
+Server-Timing header and X-Profile-Id.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from log import get_logger
+from metrics import add_operation_hook
+
+logger = get_logger("profiling")
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_PATHS = tuple(p for p in os.getenv("PROFILE_PATHS", "/api/").split(",") if p)
+PROFILE_MAX_ACTIVE = int(os.getenv("PROFILE_MAX_ACTIVE", "4"))
+
+PROFILE_HEADER = b"x-profile"
+
+_active: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _await_chain(awaitable) -> list:
+    """Frames of a coroutine and everything it is awaiting, outermost first"""
+    frames = []
+    while awaitable is not None:
+        frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+                 or getattr(awaitable, "ag_frame", None))
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+                     or getattr(awaitable, "ag_await", None))
+    return frames
+
+
+def _covered(intervals: list[tuple[float, float]]) -> float:
+    """Length of the union of intervals (nested and concurrent calls count once)"""
+    total = 0.0
+    end = float("-inf")
+    for start, stop in sorted(intervals):
+        if stop <= end:
+            continue
+        total += stop - max(start, end)
+        end = stop
+    return total
+
+
+class RequestProfile:
+    """Samples and tracked operations for one in-flight request"""
+
+    def __init__(self, task: asyncio.Task, root_frame, interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.task = task
+        self.root_frame = root_frame
+        self.loop_thread = threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.categories: Counter = Counter()
+        self.inflight: list[tuple[str, str]] = []
+        self.intervals: dict[str, list] = defaultdict(list)
+        self.operations: list[dict] = []
+        self.started = self.finished = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.finished = time.perf_counter()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:  # A racing frame must never take the request down
+                continue
+
+    def _sample(self) -> None:
+        coro = self.task.get_coro()
+        leaf = None
+        if getattr(coro, "cr_running", False):
+            # Executing right now: the loop thread's real stack has the sync frames too
+            frame = sys._current_frames().get(self.loop_thread)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            category = "cpu"
+        else:
+            frames = _await_chain(coro)
+            operation = self.inflight[-1] if self.inflight else None
+            if operation:
+                category = operation[0]
+                leaf = f"[{operation[0]}] {operation[1]}"
+            else:
+                category = "wait"
+        try:
+            root = frames.index(self.root_frame)
+        except ValueError:
+            return
+        labels = [category, *(_frame_label(f) for f in frames[root + 1:])]
+        if leaf:
+            labels.append(leaf)
+        self.stacks[";".join(labels)] += 1
+        self.categories[category] += 1
+
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def breakdown(self) -> dict:
+        """Milliseconds by category: Mongo/LLM exact, CPU estimated from samples"""
+        wall = self.elapsed()
+        samples = sum(self.categories.values())
+        return {
+            "total": wall * 1000,
+            "mongo": _covered(self.intervals["mongo"]) * 1000,
+            "llm": _covered(self.intervals["llm"]) * 1000,
+            "cpu": wall * self.categories["cpu"] / samples * 1000 if samples else 0.0,
+        }
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.breakdown().items())
+
+    def write(self, directory: str, method: str, route: str, status: int) -> str:
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{self.id}")
+        with open(base + ".folded", "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w") as f:
+            json.dump({
+                "id": self.id,
+                "method": method,
+                "route": route,
+                "status": status,
+                "interval_ms": self.interval * 1000,
+                "samples": dict(self.categories),
+                "ms": {name: round(ms, 2) for name, ms in self.breakdown().items()},
+                "operations": self.operations,
+            }, f, indent=2)
+        return base
+
+
+@contextlib.contextmanager
+def _operation_hook(component: str, operation: str):
+    """metrics.track hook: marks tracked calls made on behalf of a profiled request"""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    entry = (component, operation)
+    start = time.perf_counter()
+    profile.inflight.append(entry)
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        profile.inflight.remove(entry)
+        profile.intervals[component].append((start, end))
+        profile.operations.append({
+            "component": component,
+            "operation": operation,
+            "start_ms": round((start - profile.started) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        })
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling opted-in requests
+
+    Only added to the app when PROFILE_ENABLED is set; requests that are
+    not picked go straight through.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, token: Optional[str] = PROFILE_TOKEN,
+                 directory: str = PROFILE_DIR, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.token = token
+        self.directory = directory
+        self.interval = interval_ms / 1000
+        self.active = 0
+        add_operation_hook(_operation_hook)
+
+    def _wanted(self, scope) -> bool:
+        if scope["type"] != "http" or not scope["path"].startswith(PROFILE_PATHS):
+            return False
+        if self.active >= PROFILE_MAX_ACTIVE:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER and (self.token is None or value.decode() == self.token):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(asyncio.current_task(), sys._getframe(), self.interval)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message, headers=[
+                    *message.get("headers", []),
+                    (b"server-timing", profile.server_timing().encode()),
+                    (b"x-profile-id", profile.id.encode()),
+                ])
+            await send(message)
+
+        context = _active.set(profile)
+        self.active += 1
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.stop()
+            _active.reset(context)
+            self.active -= 1
+            route = getattr(scope.get("route"), "path", scope["path"])
+            path = await asyncio.to_thread(profile.write, self.directory, scope["method"], route, status["code"])
+            logger.info("request_profiled", extra={
+                "profile_id": profile.id, "route": route, "path": path,
+                **{f"{name}_ms": round(ms, 1) for name, ms in profile.breakdown().items()}
+            })
@@ -0,0 +1,129 @@
+"""
+ChronoCharm - RPG Progression Rules
+XP, levels, titles, streaks and badges applied when a quest is won
+"""
+
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+TITLES = [
+    "First Year",
+    "Second Year",
+    "Third Year",
+    "Fourth Year",
+    "Fifth Year",
+    "Prefect",
+    "Head Student",
+    "Auror",
+    "Wizard Extraordinaire",
+    "Master of Tasks",
+]
+
+STAT_CAP = 100
+LEVEL_UP_STAT_BONUS = 5
+QUICK_FINISH_RATIO = 0.8  # Finishing within 80% of the timer earns the bonus
+QUICK_FINISH_XP = 10
+STREAK_ENDURANCE_GAIN = 2
+STREAK_BREAK_ENDURANCE_LOSS = 5
+STREAK_BADGES = (7, 30, 100)
+
+
+def calculate_level(xp: int) -> int:
+    return math.floor(math.sqrt(max(xp, 0) / 100)) + 1
+
+
+def xp_for_next_level(level: int) -> int:
+    return level * level * 100
+
+
+def title_for_level(level: int) -> str:
+    return TITLES[min(level, len(TITLES)) - 1]
+
+
+def normalize_day(value: Optional[str]) -> Optional[str]:
+    """
+    lastCompletedDate as ISO YYYY-MM-DD
+
+    Older clients stored JavaScript's toDateString() ("Mon Oct 19 2026");
+    those are converted. Anything else unparseable is dropped (None), which
+    counts as no previous completion rather than a broken streak.
+    """
+    if not value:
+        return None
+    for parse in (date.fromisoformat, lambda v: datetime.strptime(v, "%a %b %d %Y").date()):
+        try:
+            return parse(value).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def local_day(value: Optional[str], now: Optional[datetime] = None) -> date:
+    """
+    The completing client's local day, so streaks roll over at the user's
+    midnight rather than UTC's
+
+    Every timezone's date is within a day of the UTC date, so a key that is
+    further off (or not ISO YYYY-MM-DD) falls back to the UTC date.
+    """
+    utc_today = (now or datetime.now(timezone.utc)).date()
+    try:
+        day = date.fromisoformat(value) if value else None
+    except ValueError:
+        day = None
+    if day is None or abs((day - utc_today).days) > 1:
+        return utc_today
+    return day
+
+
+def apply_quest_won(stats: dict, bounty: int, minutes_focused: int = 0,
+                    duration_minutes: Optional[int] = None, today: Optional[date] = None) -> dict:
+    """
+    Return new stats after winning a quest (the input dict is not modified)
+
+    Awards the bounty as XP plus a bonus for finishing early, levels up
+    (raising the weakest attribute each level and badging every 5th),
+    and advances the daily streak.
+    """
+    stats = dict(stats, badges=list(stats.get("badges", [])))
+    today = today or date.today()
+
+    xp_gain = bounty
+    if duration_minutes and minutes_focused < duration_minutes * QUICK_FINISH_RATIO:
+        xp_gain += QUICK_FINISH_XP
+
+    old_level = stats.get("level", 1)
+    stats["xp"] = stats.get("xp", 0) + xp_gain
+    new_level = calculate_level(stats["xp"])
+    for level in range(old_level + 1, new_level + 1):
+        weakest = min(("endurance", "focus", "magic"), key=lambda name: stats.get(name, 0))
+        stats[weakest] = min(STAT_CAP, stats.get(weakest, 0) + LEVEL_UP_STAT_BONUS)
+        if level % 5 == 0 and f"Level {level}" not in stats["badges"]:
+            stats["badges"].append(f"Level {level}")
+    stats["level"] = max(old_level, new_level)
+    stats["xpToNextLevel"] = xp_for_next_level(stats["level"])
+    stats["title"] = title_for_level(stats["level"])
+
+    _advance_streak(stats, today)
+    return stats
+
+
+def _advance_streak(stats: dict, today: date) -> None:
+    last = normalize_day(stats.get("lastCompletedDate"))
+    if last is not None and last >= today.isoformat():  # Same day, or a client behind the last one's clock
+        return
+
+    endurance = stats.get("endurance", 0)
+    if last is None or last == (today - timedelta(days=1)).isoformat():
+        stats["currentStreak"] = stats.get("currentStreak", 0) + 1 if last else 1
+        stats["endurance"] = min(STAT_CAP, endurance + STREAK_ENDURANCE_GAIN)
+    else:
+        stats["currentStreak"] = 1
+        stats["endurance"] = max(0, endurance - STREAK_BREAK_ENDURANCE_LOSS)
+    stats["lastCompletedDate"] = today.isoformat()
+
+    for days in STREAK_BADGES:
+        badge = f"{days}-Day Streak"
+        if stats["currentStreak"] == days and badge not in stats["badges"]:
+            stats["badges"].append(badge)
@@ -0,0 +1,145 @@
+"""
+ChronoCharm - Quest Logs
+Persisted breakdown results with per-task state, paged by keyset cursor
+
+Every /api/breakdown result is stored as one `quest_logs` document, so a
+reload is a read instead of another Gemini call. Listing walks the
+(user_id, created_at, _id) index newest first: the cursor is the last
+document's (created_at, _id), and the next page starts strictly after it,
+so each page costs the same however deep it is and pages do not shift
+when new logs are added. `fields` projects documents (including single
+task fields such as tasks.title) so board views fetch only what they show.
+"""
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from database import Database
+from metrics import track
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+TASK_STATUSES = ("pending", "active", "completed", "failed")
+TASK_FIELDS = ("id", "title", "description", "estimatedTime", "stake", "bounty", "status", "completed")
+QUEST_FIELDS = ("assignment", "quote", "totalEstimatedTime", "taskCount", "tasks")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[dict]:
+    """
+    Mongo projection from a comma-separated field list; None means everything
+
+    id and createdAt are always returned (the cursor needs them).
+    Raises ValueError for unknown fields.
+    """
+    if not fields:
+        return None
+    projection = {"created_at": 1}
+    for field in (f.strip() for f in fields.split(",")):
+        if field in ("id", "createdAt"):
+            continue
+        top, _, sub = field.partition(".")
+        if top not in QUEST_FIELDS or (sub and (top != "tasks" or sub not in TASK_FIELDS)):
+            raise ValueError(f"Unknown field '{field}'. Choose from: {', '.join(QUEST_FIELDS)}, "
+                             f"tasks.<{'|'.join(TASK_FIELDS)}>")
+        projection[field] = 1
+    if "tasks" in projection:  # A whole-array projection collides with tasks.<field>
+        projection = {key: 1 for key in projection if not key.startswith("tasks.")}
+    return projection
+
+
+def encode_cursor(doc: dict) -> str:
+    position = {"t": doc["created_at"].isoformat(), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+
+
+def _public(doc: dict) -> dict:
+    """API shape: string id and ISO createdAt instead of _id/created_at"""
+    doc = dict(doc)
+    doc.pop("user_id", None)
+    created = doc.pop("created_at")
+    if created.tzinfo is None:  # Mongo hands back naive UTC
+        created = created.replace(tzinfo=timezone.utc)
+    return {"id": str(doc.pop("_id")), "createdAt": created.isoformat(), **doc}
+
+
+class QuestLogStore:
+    """Mongo persistence for generated quest logs"""
+
+    @staticmethod
+    @track("mongo", "quest_log_create")
+    async def create(user_id: str, assignment: str, tasks: list[dict], quote: str,
+                     total_estimated_time: str) -> str:
+        """Store a breakdown; returns the quest log id"""
+        db = Database.get_db(user_id)
+        result = await db.quest_logs.insert_one({
+            "user_id": user_id,
+            "created_at": datetime.now(timezone.utc),
+            "assignment": assignment,
+            "quote": quote,
+            "totalEstimatedTime": total_estimated_time,
+            "taskCount": len(tasks),
+            "tasks": [{**task, "status": "pending"} for task in tasks],
+        })
+        return str(result.inserted_id)
+
+    @staticmethod
+    @track("mongo", "quest_log_page")
+    async def page(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                   fields: Optional[str] = None) -> dict:
+        """One page of a user's quest logs, newest first, plus the cursor for the next"""
+        query: dict = {"user_id": user_id}
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}},
+            ]
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        db = Database.get_db(user_id)
+        docs = await db.quest_logs.find(query, parse_fields(fields)).sort(
+            [("created_at", -1), ("_id", -1)]
+        ).limit(limit + 1).to_list(length=limit + 1)
+        page = docs[:limit]
+        return {
+            "quests": [_public(doc) for doc in page],
+            "nextCursor": encode_cursor(page[-1]) if len(docs) > limit else None,
+        }
+
+    @staticmethod
+    @track("mongo", "quest_log_get")
+    async def get(user_id: str, quest_id: str, fields: Optional[str] = None) -> Optional[dict]:
+        """A single quest log, or None if it does not exist for this user"""
+        if not ObjectId.is_valid(quest_id):
+            return None
+        db = Database.get_db(user_id)
+        doc = await db.quest_logs.find_one({"_id": ObjectId(quest_id), "user_id": user_id}, parse_fields(fields))
+        return _public(doc) if doc else None
+
+    @staticmethod
+    @track("mongo", "quest_log_set_task_status")
+    async def set_task_status(user_id: str, quest_id: str, task_id: str, status: str) -> bool:
+        """Update one task's state in place; False if the quest or task is unknown"""
+        if status not in TASK_STATUSES:
+            raise ValueError(f"Unknown status '{status}'. Choose from: {', '.join(TASK_STATUSES)}")
+        if not ObjectId.is_valid(quest_id):
+            return False
+        db = Database.get_db(user_id)
+        result = await db.quest_logs.update_one(
+            {"_id": ObjectId(quest_id), "user_id": user_id, "tasks.id": task_id},
+            {"$set": {"tasks.$.status": status, "tasks.$.completed": status == "completed"}}
+        )
+        return result.matched_count > 0
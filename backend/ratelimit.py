@@ -0,0 +1,142 @@
+"""
+ChronoCharm - LLM Admission Control
+Per-user and global token buckets plus a bounded concurrency queue
+
+Configure with LLM_USER_RATE / LLM_USER_BURST (requests per minute and
+burst per user), LLM_GLOBAL_RATE / LLM_GLOBAL_BURST (across all users),
+LLM_CONCURRENCY (Gemini calls in flight) and LLM_QUEUE (calls allowed to
+wait for a slot before new ones are shed).
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from metrics import registry
+
+LLM_USER_RATE = float(os.getenv("LLM_USER_RATE", "6"))
+LLM_USER_BURST = float(os.getenv("LLM_USER_BURST", "3"))
+LLM_GLOBAL_RATE = float(os.getenv("LLM_GLOBAL_RATE", "300"))
+LLM_GLOBAL_BURST = float(os.getenv("LLM_GLOBAL_BURST", "30"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_QUEUE = int(os.getenv("LLM_QUEUE", "16"))
+
+admissions = registry.counter(
+    "chronocharm_llm_admission_total",
+    "LLM endpoint admission decisions (admitted, user_limited, global_limited, shed)",
+    ("endpoint", "result")
+)
+
+
+class RateLimited(Exception):
+    """Request rejected by admission control; retry_after is in seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available; returns 0, or seconds until they would be"""
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def refund(self, tokens: float = 1) -> None:
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class LLMAdmission:
+    """
+    Gatekeeper in front of the OddsMaker endpoints
+
+    A request must pass its user's bucket, then the global bucket, then
+    find room in the concurrency queue. Anything that fails is rejected
+    immediately with a Retry-After hint instead of piling up behind Gemini,
+    so ledger endpoints keep their latency during spikes.
+    """
+
+    MAX_TRACKED_USERS = 50_000
+
+    def __init__(self, user_rate_per_min: float = LLM_USER_RATE, user_burst: float = LLM_USER_BURST,
+                 global_rate_per_min: float = LLM_GLOBAL_RATE, global_burst: float = LLM_GLOBAL_BURST,
+                 concurrency: int = LLM_CONCURRENCY, queue: int = LLM_QUEUE):
+        self.user_rate = user_rate_per_min / 60
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate_per_min / 60, global_burst)
+        self.concurrency = concurrency
+        self.queue = queue
+        self._users: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._waiting = 0
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            if len(self._users) > self.MAX_TRACKED_USERS:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    @asynccontextmanager
+    async def admit(self, endpoint: str, user_id: str) -> AsyncIterator[None]:
+        """Hold an LLM slot for the duration of the block, or raise RateLimited"""
+        user_bucket = self._user_bucket(user_id)
+        wait = user_bucket.try_acquire()
+        if wait:
+            admissions.inc(endpoint, "user_limited")
+            raise RateLimited("Too many AI requests for this user", wait)
+
+        wait = self.global_bucket.try_acquire()
+        if wait:
+            user_bucket.refund()
+            admissions.inc(endpoint, "global_limited")
+            raise RateLimited("AI service is busy", wait)
+
+        if self._semaphore.locked() and self._waiting >= self.queue:
+            user_bucket.refund()
+            self.global_bucket.refund()
+            admissions.inc(endpoint, "shed")
+            raise RateLimited("AI service is at capacity", 1.0)
+
+        admissions.inc(endpoint, "admitted")
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+llm_admission = LLMAdmission()
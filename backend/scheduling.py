@@ -0,0 +1,438 @@
+"""
+ChronoCharm - Schedules
+Persisted per-user task schedules with incremental re-planning
+
+A schedule is an hourly grid over `days` days. Each day's occupancy is a
+24-bit mask (blocked hours | hours held by tasks), so finding the next free
+run of N hours is a few shifts per day. Re-planning applies a change
+(task completed early, wager failed, hours blocked/unblocked, task moved)
+by touching only the tasks it displaces, and persists only the fields that
+changed, guarded by the schedule's version counter.
+"""
+
+import math
+from typing import Optional
+
+from database import Database
+from events import event_bus
+from log import get_logger, sampled
+from metrics import track
+
+logger = get_logger("scheduling")
+
+HOURS_PER_DAY = 24
+FULL_DAY = (1 << HOURS_PER_DAY) - 1
+DEFAULT_DAYS = 7
+MAX_DAYS = 84
+REPLAN_RETRIES = 5
+
+CHANGE_TYPES = ("completed", "failed", "blocked", "unblocked", "moved")
+
+
+class ScheduleVersionConflict(Exception):
+    """The schedule changed since the client read `expected_version`"""
+
+    def __init__(self, version: int):
+        super().__init__(f"Schedule is at version {version}")
+        self.version = version
+
+
+def hours_needed(task: dict) -> int:
+    """Whole hour slots a task occupies (same rounding as the calendar UI)"""
+    return min(HOURS_PER_DAY, max(1, math.ceil(task.get("estimatedMinutes", 60) / 60)))
+
+
+def _span(start: int, hours: int) -> int:
+    return ((1 << hours) - 1) << start
+
+
+def _run_starts(free: int, hours: int) -> int:
+    """Bit p is set iff hours p..p+hours-1 are all free"""
+    runs = free
+    for i in range(1, hours):
+        runs &= free >> i
+    return runs
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def valid_entries(proposed, task_count: int) -> list[dict]:
+    """
+    Proposed placements whose taskIndex, dayIndex and startHour are in-range ints
+    
+    Gemini's output is only loosely shaped; anything else is dropped here
+    rather than failing the request.
+    """
+    if not isinstance(proposed, list):
+        return []
+    return [
+        entry for entry in proposed
+        if isinstance(entry, dict)
+        and all(_is_int(entry.get(key)) for key in ("taskIndex", "dayIndex", "startHour"))
+        and 0 <= entry["taskIndex"] < task_count
+        and 0 <= entry["dayIndex"] < MAX_DAYS
+        and 0 <= entry["startHour"] < HOURS_PER_DAY
+    ]
+
+
+class Schedule:
+    """
+    In-memory schedule with dirty tracking
+
+    placements map task_id -> {"dayIndex", "startHour", "hours"}; tasks
+    that could not be placed are listed in `unscheduled`.
+    """
+
+    def __init__(self, days: int, tasks: Optional[dict] = None, placements: Optional[dict] = None,
+                 blocked: Optional[list[int]] = None, unscheduled: Optional[list[str]] = None):
+        self.days = days
+        self.tasks = tasks or {}
+        self.placements: dict[str, dict] = {}
+        self.blocked = list(blocked) if blocked else [0] * days
+        self.busy = list(self.blocked)
+        self.by_day: list[dict[int, str]] = [{} for _ in range(days)]
+        self.unscheduled = list(unscheduled or [])
+        self.dirty_tasks: set[str] = set()
+        self.dirty_days: set[int] = set()
+        self.unscheduled_dirty = False
+        for task_id, placement in (placements or {}).items():
+            self._occupy(task_id, placement["dayIndex"], placement["startHour"], placement["hours"])
+        self.dirty_tasks.clear()
+
+    # === (De)serialization ===
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Schedule":
+        days = doc["days"]
+        blocked = [doc.get("blocked", {}).get(str(day), 0) for day in range(days)]
+        return cls(days, doc.get("tasks"), doc.get("placements"), blocked, doc.get("unscheduled"))
+
+    def to_doc(self) -> dict:
+        return {
+            "days": self.days,
+            "tasks": self.tasks,
+            "placements": self.placements,
+            "blocked": {str(day): mask for day, mask in enumerate(self.blocked) if mask},
+            "unscheduled": self.unscheduled,
+        }
+
+    def update_document(self) -> dict:
+        """Mongo update operators for just the fields touched since loading"""
+        set_fields, unset_fields = {}, {}
+        for task_id in self.dirty_tasks:
+            set_fields[f"tasks.{task_id}"] = self.tasks[task_id]
+            if task_id in self.placements:
+                set_fields[f"placements.{task_id}"] = self.placements[task_id]
+            else:
+                unset_fields[f"placements.{task_id}"] = ""
+        for day in self.dirty_days:
+            set_fields[f"blocked.{day}"] = self.blocked[day]
+        if self.unscheduled_dirty:
+            set_fields["unscheduled"] = self.unscheduled
+        update = {}
+        if set_fields:
+            update["$set"] = set_fields
+        if unset_fields:
+            update["$unset"] = unset_fields
+        return update
+
+    def entries(self) -> list[dict]:
+        """Placements in time order, in the shape /api/schedule returns"""
+        return sorted(
+            ({"taskId": task_id, "taskIndex": self.tasks[task_id].get("index"), **placement}
+             for task_id, placement in self.placements.items()),
+            key=lambda e: (e["dayIndex"], e["startHour"])
+        )
+
+    # === Grid primitives ===
+
+    def _occupy(self, task_id: str, day: int, start: int, hours: int) -> None:
+        self.placements[task_id] = {"dayIndex": day, "startHour": start, "hours": hours}
+        self.busy[day] |= _span(start, hours)
+        self.by_day[day][start] = task_id
+        self.dirty_tasks.add(task_id)
+        if task_id in self.unscheduled:
+            self.unscheduled.remove(task_id)
+            self.unscheduled_dirty = True
+
+    def _release(self, task_id: str) -> Optional[dict]:
+        placement = self.placements.pop(task_id, None)
+        if placement is not None:
+            day = placement["dayIndex"]
+            self.busy[day] &= ~_span(placement["startHour"], placement["hours"])
+            del self.by_day[day][placement["startHour"]]
+            self.dirty_tasks.add(task_id)
+        return placement
+
+    def _overlapping(self, day: int, start: int, hours: int) -> list[str]:
+        end = start + hours
+        return [
+            task_id for task_start, task_id in sorted(self.by_day[day].items())
+            if task_start < end and task_start + self.placements[task_id]["hours"] > start
+        ]
+
+    def find_slot(self, hours: int, day: int, hour: int = 0) -> Optional[tuple[int, int]]:
+        """Earliest (day, hour) at or after the given one with `hours` free hours in a row"""
+        day, hour = day + hour // HOURS_PER_DAY, hour % HOURS_PER_DAY
+        for d in range(day, self.days):
+            runs = _run_starts(~self.busy[d] & FULL_DAY, hours) & (FULL_DAY << (hour if d == day else 0))
+            if runs:
+                return d, (runs & -runs).bit_length() - 1
+        return None
+
+    def _place_from(self, task_id: str, day: int, hour: int, before: Optional[dict], moves: list) -> None:
+        """Put a task in the first free run from (day, hour), else mark it unscheduled"""
+        slot = self.find_slot(self.tasks[task_id]["hours"], day, hour)
+        if slot:
+            self._occupy(task_id, slot[0], slot[1], self.tasks[task_id]["hours"])
+        elif task_id not in self.unscheduled:
+            self.unscheduled.append(task_id)
+            self.unscheduled_dirty = True
+            self.dirty_tasks.add(task_id)
+        moves.append(self._move(task_id, before))
+
+    def _move(self, task_id: str, before: Optional[dict]) -> dict:
+        after = self.placements.get(task_id)
+        return {
+            "taskId": task_id,
+            "from": {"dayIndex": before["dayIndex"], "startHour": before["startHour"]} if before else None,
+            "to": {"dayIndex": after["dayIndex"], "startHour": after["startHour"]} if after else None,
+        }
+
+    # === Planning ===
+
+    @classmethod
+    def plan(cls, tasks: list[dict], available_hours: list[dict], proposed: list[dict]) -> "Schedule":
+        """
+        Build a schedule from the calendar's tasks and free hours
+
+        Hours of the horizon not listed as free are treated as blocked.
+        Proposed placements (from Gemini or the fallback) are kept when they
+        fit; otherwise the task goes to the next free run after it. Malformed
+        proposals are ignored, as are free hours outside the horizon.
+        """
+        free = {}
+        for slot in available_hours:
+            day, hour = slot.get("dayIndex"), slot.get("hour")
+            if not slot.get("isBlocked", False) and _is_int(day) and day >= 0 \
+                    and _is_int(hour) and 0 <= hour < HOURS_PER_DAY:
+                free[day] = free.get(day, 0) | (1 << hour)
+        days = max([DEFAULT_DAYS, *(day + 1 for day in free)])
+        if days > MAX_DAYS:
+            raise ValueError(f"Schedules cover at most {MAX_DAYS} days")
+        schedule = cls(days, blocked=[FULL_DAY & ~free.get(day, 0) for day in range(days)])
+
+        ids = []
+        for index, task in enumerate(tasks):
+            task_id = str(task.get("id") or f"task-{index}")
+            if "." in task_id or task_id.startswith("$"):
+                raise ValueError(f"Invalid task id '{task_id}'")
+            ids.append(task_id)
+            schedule.tasks[task_id] = {
+                "index": index,
+                "title": task.get("title", ""),
+                "estimatedMinutes": task.get("estimatedMinutes", 60),
+                "stake": task.get("stake", 10),
+                "hours": hours_needed(task),
+                "status": "pending",
+                "attempts": 0,
+            }
+
+        moves: list = []
+        for entry in valid_entries(proposed, len(ids)):
+            task_id = ids[entry["taskIndex"]]
+            if task_id in schedule.placements:
+                continue
+            day, hour = entry["dayIndex"], entry["startHour"]
+            hours = schedule.tasks[task_id]["hours"]
+            if day < days and hour + hours <= HOURS_PER_DAY \
+                    and not schedule.busy[day] & _span(hour, hours):
+                schedule._occupy(task_id, day, hour, hours)
+            elif day < days:
+                schedule._place_from(task_id, day, hour, None, moves)
+        for task_id in ids:
+            if task_id not in schedule.placements and task_id not in schedule.unscheduled:
+                schedule._place_from(task_id, 0, 0, None, moves)
+        return schedule
+
+    def apply(self, change: dict) -> list[dict]:
+        """Apply one change; returns the moves it caused"""
+        kind = change.get("type")
+        if kind not in CHANGE_TYPES:
+            raise ValueError(f"Unknown change type '{kind}'. Choose from: {', '.join(CHANGE_TYPES)}")
+        moves: list = []
+        getattr(self, f"_apply_{kind}")(change, moves)
+        return moves
+
+    def _task(self, change: dict) -> str:
+        task_id = change.get("task_id")
+        if task_id not in self.tasks:
+            raise ValueError(f"Unknown task '{task_id}'")
+        return task_id
+
+    def _range(self, change: dict) -> tuple[int, int, int]:
+        day, hour, hours = change.get("dayIndex"), change.get("hour"), change.get("hours") or 1
+        if not isinstance(day, int) or not 0 <= day < self.days:
+            raise ValueError(f"dayIndex must be between 0 and {self.days - 1}")
+        if not isinstance(hour, int) or not 0 <= hour or hour + hours > HOURS_PER_DAY:
+            raise ValueError("hour/hours must stay within the day")
+        return day, hour, hours
+
+    def _apply_completed(self, change: dict, moves: list) -> None:
+        """
+        Finished: with `hour`, the rest of its slot is freed and the pending
+        tasks booked back-to-back after it move up to fill the gap
+        """
+        task_id = self._task(change)
+        self.tasks[task_id]["status"] = "done"
+        self.dirty_tasks.add(task_id)
+        placement = self.placements.get(task_id)
+        hour = change.get("hour")
+        if placement is None or hour is None:
+            return
+        day, start, end = placement["dayIndex"], placement["startHour"], placement["startHour"] + placement["hours"]
+        cut = max(start, min(hour, end))
+        if cut == end:
+            return
+        self._release(task_id)
+        if cut > start:
+            self._occupy(task_id, day, start, cut - start)
+
+        cursor, next_start = cut, end
+        while next_start < HOURS_PER_DAY:
+            follower = self.by_day[day].get(next_start)
+            if follower is None or self.tasks[follower]["status"] != "pending":
+                break
+            before = self._release(follower)
+            self._occupy(follower, day, cursor, before["hours"])
+            moves.append(self._move(follower, before))
+            cursor += before["hours"]
+            next_start = before["startHour"] + before["hours"]
+
+    def _apply_failed(self, change: dict, moves: list) -> None:
+        """Wager lost: the task is retried in the next free run after its old slot"""
+        task_id = self._task(change)
+        task = self.tasks[task_id]
+        task["status"] = "pending"
+        task["attempts"] = task.get("attempts", 0) + 1
+        before = self._release(task_id)
+        self.dirty_tasks.add(task_id)
+        if before:
+            self._place_from(task_id, before["dayIndex"], before["startHour"] + before["hours"], before, moves)
+        else:
+            self._place_from(task_id, max(0, change.get("dayIndex") or 0), max(0, change.get("hour") or 0), None, moves)
+
+    def _apply_blocked(self, change: dict, moves: list) -> None:
+        """Hours blocked: only the tasks overlapping them are moved later"""
+        day, hour, hours = self._range(change)
+        displaced = [(task_id, self._release(task_id)) for task_id in self._overlapping(day, hour, hours)]
+        self.blocked[day] |= _span(hour, hours)
+        self.busy[day] |= _span(hour, hours)
+        self.dirty_days.add(day)
+        for task_id, before in displaced:
+            if self.tasks[task_id]["status"] == "pending":
+                self._place_from(task_id, day, before["startHour"], before, moves)
+            else:
+                moves.append(self._move(task_id, before))
+
+    def _apply_unblocked(self, change: dict, moves: list) -> None:
+        """Hours freed: unscheduled tasks get a chance to land from there on"""
+        day, hour, hours = self._range(change)
+        span = _span(hour, hours) & self.blocked[day]
+        self.blocked[day] &= ~span
+        self.busy[day] &= ~span
+        self.dirty_days.add(day)
+        for task_id in list(self.unscheduled):
+            if self.find_slot(self.tasks[task_id]["hours"], day, hour):
+                self._place_from(task_id, day, hour, None, moves)
+
+    def _apply_moved(self, change: dict, moves: list) -> None:
+        """Dragged to a new start: tasks in the way move to their next free run"""
+        task_id = self._task(change)
+        hours = self.tasks[task_id]["hours"]
+        day, hour, _ = self._range(dict(change, hours=hours))
+        if self.blocked[day] & _span(hour, hours):
+            raise ValueError("Target hours are blocked")
+        before = self._release(task_id)
+        displaced = [(other, self._release(other)) for other in self._overlapping(day, hour, hours)]
+        self._occupy(task_id, day, hour, hours)
+        self.tasks[task_id]["status"] = "pending"
+        moves.append(self._move(task_id, before))
+        for other, other_before in displaced:
+            self._place_from(other, day, other_before["startHour"], other_before, moves)
+
+
+class ScheduleStore:
+    """Mongo persistence for one schedule document per user"""
+
+    @staticmethod
+    @track("mongo", "schedule_save")
+    async def save(user_id: str, schedule: Schedule) -> int:
+        """Replace the user's schedule; returns the new version"""
+        db = Database.get_db(user_id)
+        saved = await db.schedules.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": schedule.to_doc(), "$inc": {"version": 1}},
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=True
+        )
+        return saved["version"]
+
+    @staticmethod
+    @track("mongo", "schedule_get")
+    async def get(user_id: str) -> Optional[dict]:
+        """The persisted schedule in response shape, or None"""
+        db = Database.get_db(user_id)
+        doc = await db.schedules.find_one({"user_id": user_id}, {"_id": 0})
+        if not doc:
+            return None
+        schedule = Schedule.from_doc(doc)
+        return {
+            "version": doc["version"],
+            "days": schedule.days,
+            "schedule": schedule.entries(),
+            "unscheduled": schedule.unscheduled,
+            "tasks": schedule.tasks,
+        }
+
+    @staticmethod
+    @track("mongo", "schedule_replan")
+    async def replan(user_id: str, changes: list[dict], expected_version: Optional[int] = None) -> dict:
+        """
+        Apply changes to the persisted schedule and write back only the diff
+
+        Without expected_version a concurrent write is retried on the fresh
+        document; with it, ScheduleVersionConflict is raised instead.
+        Raises LookupError if the user has no schedule yet.
+        """
+        db = Database.get_db(user_id)
+        for _ in range(REPLAN_RETRIES):
+            doc = await db.schedules.find_one({"user_id": user_id}, {"_id": 0, "user_id": 0})
+            if not doc:
+                raise LookupError(f"No schedule for '{user_id}'; POST /api/schedule first")
+            if expected_version is not None and doc["version"] != expected_version:
+                raise ScheduleVersionConflict(doc["version"])
+
+            schedule = Schedule.from_doc(doc)
+            moves = [move for change in changes for move in schedule.apply(change)]
+            update = schedule.update_document()
+            version = doc["version"]
+            if update:
+                update["$inc"] = {"version": 1}
+                result = await db.schedules.update_one({"user_id": user_id, "version": version}, update)
+                if not result.modified_count:
+                    if expected_version is not None:
+                        raise ScheduleVersionConflict(version + 1)
+                    continue
+                version += 1
+
+            result = {"version": version, "moves": moves, "unscheduled": schedule.unscheduled}
+            event_bus.publish(user_id, "schedule", {"version": version})
+            logger.info("schedule_replanned", extra=sampled(
+                user_id=user_id, changes=len(changes), moves=len(moves), fields=len(update.get("$set", {}))
+            ))
+            return result
+        raise RuntimeError(f"Could not re-plan schedule for '{user_id}': it kept changing concurrently")
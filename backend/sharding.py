@@ -0,0 +1,97 @@
+"""
+ChronoCharm - User Sharding
+Consistent-hash ring mapping user_id to one of several Mongo databases
+
+Rebalancing CLI (from backend/), after adding a URI to MONGO_SHARDS (and
+its name to SHARD_NAMES, if set):
+    python sharding.py rebalance
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import sys
+from typing import Iterable
+
+from log import get_logger
+
+logger = get_logger("sharding")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes
+
+    Each shard is hashed onto the ring `vnodes` times; a key belongs to the
+    first shard point clockwise from its own hash. Adding a shard only moves
+    the keys that land on the new shard's points (about 1/N of them).
+    """
+
+    VNODES = 128
+
+    def __init__(self, shards: Iterable[str], vnodes: int = VNODES):
+        self.shards = list(dict.fromkeys(shards))
+        if not self.shards:
+            raise ValueError("HashRing needs at least one shard")
+        points = sorted(
+            (self._hash(f"{shard}#{i}"), shard)
+            for shard in self.shards
+            for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def get(self, key: str) -> str:
+        """Shard that owns key"""
+        if len(self.shards) == 1:
+            return self.shards[0]
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+async def rebalance(batch_size: int = 1000) -> dict:
+    """
+    Move every user stored on the wrong shard to the one the ring assigns
+
+    Scans each shard's users collection and migrates misplaced users with
+    Database.migrate_user. Safe to re-run; users already in place are skipped.
+    """
+    from database import Database
+
+    moved = scanned = 0
+    for shard, db in Database.shards.items():
+        cursor = db.users.find({}, {"_id": 0, "user_id": 1}).batch_size(batch_size)
+        async for user in cursor:
+            scanned += 1
+            target = Database.ring.get(user["user_id"])
+            if target != shard:
+                await Database.migrate_user(user["user_id"], db, Database.shards[target])
+                moved += 1
+    logger.info("rebalance_finished", extra={"scanned": scanned, "moved": moved})
+    return {"scanned": scanned, "moved": moved}
+
+
+async def _main(argv: list[str]) -> int:
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="ChronoCharm shard maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("rebalance", help="Migrate users to the shard MONGO_SHARDS now assigns them")
+    run.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    await Database.connect()
+    try:
+        await rebalance(args.batch_size)
+    finally:
+        await Database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -14,13 +14,13 @@ BASE_URL = "http://127.0.0.1:8004"
 TEST_USER = "test_user_comprehensive"
 
 # Helper functions for making requests
-def get(path, params=None):
+def get(path, params=None, headers=None):
     """Make GET request to backend"""
-    return requests.get(f"{BASE_URL}{path}", params=params)
+    return requests.get(f"{BASE_URL}{path}", params=params, headers=headers)
 
-def post(path, json=None, params=None):
+def post(path, json=None, params=None, headers=None):
     """Make POST request to backend"""
-    return requests.post(f"{BASE_URL}{path}", json=json, params=params)
+    return requests.post(f"{BASE_URL}{path}", json=json, params=params, headers=headers)
 
 
 class TestWagerMechanics:
@@ -81,6 +81,43 @@ class TestWagerMechanics:
         assert new_balance == initial_balance + 70  # 20 stake + 50 bounty
         print(f"✓ Bounty awarded: {initial_balance} → {new_balance}")
     
+    def test_win_applies_progression(self):
+        """Winning returns stats with the bounty added as XP"""
+        before = get("/api/stats", params={"user_id": TEST_USER}).json()
+        response = post("/api/wager/complete", json={
+            "user_id": TEST_USER,
+            "task_id": "test_task_xp",
+            "stake": 10,
+            "bounty": 30,
+            "won": True
+        })
+        assert response.status_code == 200
+        stats = response.json()["stats"]
+        assert stats["xp"] == before["xp"] + 30
+        assert stats["xpToNextLevel"] == stats["level"] ** 2 * 100
+        assert stats["currentStreak"] >= 1
+        assert get("/api/stats", params={"user_id": TEST_USER}).json()["xp"] == stats["xp"]
+        print(f"✓ Progression applied: {before['xp']} → {stats['xp']} XP")
+
+    def test_streak_follows_client_day_across_midnight(self):
+        """Wins just before and after the user's local midnight extend the streak once"""
+        import uuid
+        from datetime import datetime, timedelta, timezone
+        user = f"{TEST_USER}_midnight_{uuid.uuid4().hex[:8]}"
+        utc_today = datetime.now(timezone.utc).date()
+        streaks = []
+        # 23:50 on the user's yesterday, then 00:10 and 00:20 on their today
+        for i, day in enumerate((utc_today - timedelta(days=1), utc_today, utc_today)):
+            response = post("/api/wager/complete", json={
+                "user_id": user, "task_id": f"midnight_{i}", "stake": 5, "bounty": 10,
+                "won": True, "day": day.isoformat()
+            })
+            assert response.status_code == 200
+            streaks.append(response.json()["stats"]["currentStreak"])
+        assert streaks == [1, 2, 2]
+        assert get("/api/stats", params={"user_id": user}).json()["lastCompletedDate"] == utc_today.isoformat()
+        print(f"✓ Streak crossed midnight: {streaks}")
+    
     def test_lose_wager_forfeits_stake(self):
         """Losing a task forfeits stake"""
         # Start with fresh stake
@@ -109,6 +146,95 @@ class TestWagerMechanics:
         print(f"✓ Stake lost correctly")
 
 
+class TestIdempotency:
+    """Test Idempotency-Key handling on wager mutations"""
+    
+    def test_retry_does_not_double_deduct(self):
+        """Retrying wager/start with the same key deducts once"""
+        import uuid
+        key = str(uuid.uuid4())
+        wager = {"user_id": TEST_USER, "task_id": "idem_task", "stake": 7}
+        initial_balance = get("/api/balance", params={"user_id": TEST_USER}).json()["balance"]
+        
+        first = post("/api/wager/start", json=wager, headers={"Idempotency-Key": key})
+        retry = post("/api/wager/start", json=wager, headers={"Idempotency-Key": key})
+        assert first.status_code == retry.status_code == 200
+        assert first.json() == retry.json()
+        
+        final_balance = get("/api/balance", params={"user_id": TEST_USER}).json()["balance"]
+        assert final_balance == initial_balance - 7
+        print(f"✓ Retry replayed: {initial_balance} → {final_balance}")
+    
+    def test_key_reuse_with_different_payload(self):
+        """Reusing a key for a different request is rejected"""
+        import uuid
+        key = str(uuid.uuid4())
+        post("/api/wager/start", json={"user_id": TEST_USER, "task_id": "idem_a", "stake": 1},
+             headers={"Idempotency-Key": key})
+        response = post("/api/wager/start", json={"user_id": TEST_USER, "task_id": "idem_b", "stake": 2},
+                        headers={"Idempotency-Key": key})
+        assert response.status_code == 409
+        print(f"✓ Conflicting reuse rejected")
+
+    def _run_twice(self, handler_factory):
+        """Run a keyed handler twice in-process (against the backend's Mongo); returns calls, errors, balances"""
+        import asyncio
+        import uuid
+        from database import Database, ManaLedger
+        from idempotency import IdempotencyStore, IdempotencyConflict
+        user = f"{TEST_USER}_idem_{uuid.uuid4().hex[:8]}"
+        key = str(uuid.uuid4())
+        store = IdempotencyStore()
+        calls, errors = [], []
+        handler = handler_factory(user, calls)
+
+        async def scenario():
+            await Database.connect()
+            try:
+                start = await ManaLedger.get_balance(user)
+                for _ in range(2):
+                    try:
+                        await store.run(key, "wager/start", user, {"stake": 5}, handler)
+                    except (RuntimeError, IdempotencyConflict) as e:
+                        errors.append(type(e).__name__)
+                return start, await ManaLedger.get_balance(user)
+            finally:
+                await Database.close()
+
+        return calls, errors, asyncio.run(scenario())
+
+    def test_failure_after_ledger_write_is_not_rerun(self):
+        """An exception after the stake is deducted keeps the claim; the retry is refused"""
+        from database import ManaLedger
+
+        def factory(user, calls):
+            async def deduct_then_fail():
+                calls.append(1)
+                await ManaLedger.deduct_stake(user, 5)
+                raise RuntimeError("response could not be recorded")
+            return deduct_then_fail
+
+        calls, errors, (start, end) = self._run_twice(factory)
+        assert len(calls) == 1
+        assert errors == ["RuntimeError", "IdempotencyConflict"]
+        assert end == start - 5
+        print(f"✓ Post-write failure not re-run: {start} → {end}")
+
+    def test_failure_before_ledger_write_can_retry(self):
+        """An exception before any ledger write releases the claim for a retry"""
+        def factory(user, calls):
+            async def fail_early():
+                calls.append(1)
+                raise RuntimeError("model unavailable")
+            return fail_early
+
+        calls, errors, (start, end) = self._run_twice(factory)
+        assert len(calls) == 2
+        assert errors == ["RuntimeError", "RuntimeError"]
+        assert end == start
+        print(f"✓ Pre-write failure released its claim")
+
+
 class TestAIBreakdown:
     """Test Gemini AI task breakdown"""
     
@@ -161,6 +287,49 @@ class TestAIBreakdown:
         print(f"✓ Task count parameter respected")
 
 
+class TestQuestLogs:
+    """Test persisted breakdowns, cursor paging and projections"""
+    
+    def _breakdown(self, assignment):
+        response = post("/api/breakdown", json={"user_id": TEST_USER, "assignment": assignment, "taskCount": 3})
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_breakdown_is_saved(self):
+        """A breakdown can be reloaded by its questId"""
+        data = self._breakdown("Read chapter 4 of the biology textbook")
+        assert data["questId"]
+        quest = get(f"/api/quests/{data['questId']}", params={"user_id": TEST_USER}).json()
+        assert [t["title"] for t in quest["tasks"]] == [t["title"] for t in data["tasks"]]
+        print(f"✓ Quest {data['questId']} saved with {quest['taskCount']} tasks")
+    
+    def test_cursor_pages_do_not_overlap(self):
+        """Consecutive pages are disjoint and newest first"""
+        self._breakdown("Outline a history essay")
+        self._breakdown("Solve problem set 2")
+        first = get("/api/quests", params={"user_id": TEST_USER, "limit": 1}).json()
+        assert first["nextCursor"]
+        second = get("/api/quests", params={"user_id": TEST_USER, "limit": 1, "cursor": first["nextCursor"]}).json()
+        assert first["quests"][0]["id"] != second["quests"][0]["id"]
+        assert first["quests"][0]["createdAt"] >= second["quests"][0]["createdAt"]
+        print(f"✓ Cursor paging works")
+    
+    def test_projection_and_task_status(self):
+        """fields limits the payload; task status updates persist"""
+        data = self._breakdown("Practice French vocabulary")
+        task_id = data["tasks"][0]["id"]
+        response = requests.patch(f"{BASE_URL}/api/quests/{data['questId']}/tasks/{task_id}",
+                                  json={"user_id": TEST_USER, "status": "completed"})
+        assert response.status_code == 200
+        quest = get(f"/api/quests/{data['questId']}", params={
+            "user_id": TEST_USER, "fields": "tasks.title,tasks.status"
+        }).json()
+        assert set(quest) == {"id", "createdAt", "tasks"}
+        assert set(quest["tasks"][0]) == {"title", "status"}
+        assert quest["tasks"][0]["status"] == "completed"
+        print(f"✓ Projected quest: {quest['tasks'][0]}")
+
+
 class TestAIScheduler:
     """Test AI-powered calendar scheduling"""
     
@@ -200,6 +369,153 @@ class TestAIScheduler:
         # Verify tasks got scheduled
         assert isinstance(schedule, list)
         print(f"✓ Schedule returned with {len(schedule)} entries")
+    
+    def test_optimizer_strategy_scores_plan(self):
+        """The optimizer puts complex work in peak hours and reports a score"""
+        response = post("/api/schedule", json={
+            "strategy": "optimizer",
+            "tasks": [
+                {"title": "Proof set", "estimatedMinutes": 60, "stake": 40},
+                {"title": "Tidy notes", "estimatedMinutes": 60, "stake": 5}
+            ],
+            "available_hours": [
+                {"dayIndex": 0, "hour": h, "isBlocked": False}
+                for h in range(6, 22)
+            ]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["source"] == "optimizer"
+        complex_entry = next(e for e in data["schedule"] if e["taskIndex"] == 0)
+        assert 9 <= complex_entry["startHour"] < 17
+        assert data["score"]["unscheduled"] == 0
+        print(f"✓ Optimizer plan scored {data['score']['total']}")
+
+
+class TestScheduleReplan:
+    """Test persisted schedules and incremental re-planning"""
+    
+    def _plan(self):
+        response = post("/api/schedule", json={
+            "user_id": TEST_USER,
+            "tasks": [
+                {"id": "a", "title": "Outline", "estimatedMinutes": 60, "stake": 5},
+                {"id": "b", "title": "Draft", "estimatedMinutes": 60, "stake": 10},
+                {"id": "c", "title": "Edit", "estimatedMinutes": 60, "stake": 5}
+            ],
+            "available_hours": [
+                {"dayIndex": 0, "hour": h, "isBlocked": False}
+                for h in range(9, 17)
+            ]
+        })
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_schedule_is_persisted(self):
+        """The normalized plan is saved and readable"""
+        planned = self._plan()
+        saved = get("/api/schedule", params={"user_id": TEST_USER}).json()
+        assert saved["version"] == planned["version"]
+        slots = [(e["dayIndex"], e["startHour"]) for e in saved["schedule"]]
+        assert len(slots) == len(set(slots))
+        print(f"✓ Schedule persisted at version {saved['version']}")
+    
+    def test_block_moves_only_overlapping_task(self):
+        """Blocking a task's hour moves that task and nothing else"""
+        planned = self._plan()
+        target = planned["schedule"][0]
+        response = post("/api/schedule/replan", json={
+            "user_id": TEST_USER,
+            "expected_version": planned["version"],
+            "changes": [{"type": "blocked", "dayIndex": target["dayIndex"], "hour": target["startHour"]}]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"] == planned["version"] + 1
+        assert [move["taskId"] for move in data["moves"]] == [target["taskId"]]
+        print(f"✓ Blocked hour moved only {target['taskId']}")
+    
+    def test_stale_version_conflicts(self):
+        """Re-planning against an old version returns 409"""
+        planned = self._plan()
+        response = post("/api/schedule/replan", json={
+            "user_id": TEST_USER,
+            "expected_version": planned["version"] - 1,
+            "changes": [{"type": "completed", "task_id": "a"}]
+        })
+        assert response.status_code == 409
+        assert response.json()["detail"]["version"] == planned["version"]
+        print(f"✓ Stale re-plan rejected")
+
+    def test_range_past_schedule_horizon_rejected(self):
+        """A calendar range longer than a schedule can hold is a 400, not a truncated plan"""
+        response = post("/api/schedule", json={
+            "user_id": TEST_USER,
+            "tasks": [{"id": "a", "title": "Outline", "estimatedMinutes": 60, "stake": 5}],
+            "start_date": "2026-01-05",
+            "days": 200,
+            "strategy": "optimizer"
+        })
+        assert response.status_code == 400
+        print(f"✓ Over-long schedule range rejected")
+
+
+class TestCalendar:
+    """Test stored calendar blocks and free-slot queries"""
+    
+    START = "2030-01-07"  # a Monday
+    
+    def _add(self, **block):
+        response = post("/api/calendar/blocks", json={"user_id": TEST_USER, "date": self.START, **block})
+        assert response.status_code == 200
+        return response.json()["block"]
+    
+    def test_block_splits_free_time(self):
+        """A block removes its hours from the free runs"""
+        block = self._add(title="Lab", hour=10, hours=3)
+        slots = get("/api/calendar/free", params={"user_id": TEST_USER, "start": self.START, "days": 1}).json()["slots"]
+        assert all(not (s["hour"] < 13 and s["hour"] + s["hours"] > 10) for s in slots)
+        requests.delete(f"{BASE_URL}/api/calendar/blocks/{block['id']}", params={"user_id": TEST_USER})
+        print(f"✓ Free runs around block: {[(s['hour'], s['hours']) for s in slots]}")
+    
+    def test_recurring_block_and_min_hours(self):
+        """Weekday blocks recur, and min_hours filters short runs"""
+        block = self._add(title="Sleep", hour=22, hours=10, repeat="weekdays")
+        slots = get("/api/calendar/free", params={
+            "user_id": TEST_USER, "start": self.START, "days": 3, "min_hours": 14
+        }).json()["slots"]
+        assert slots and all(s["hours"] >= 14 for s in slots)
+        requests.delete(f"{BASE_URL}/api/calendar/blocks/{block['id']}", params={"user_id": TEST_USER})
+        print(f"✓ {len(slots)} runs of 14h+ between recurring blocks")
+    
+    def test_availability_template_limits_free_time(self):
+        """Free runs stay inside weekday 9-17 and skip exception days"""
+        response = requests.put(f"{BASE_URL}/api/calendar/availability", json={
+            "user_id": TEST_USER,
+            "windows": [{"date": self.START, "hour": 9, "hours": 8, "repeat": "weekdays"}],
+            "exceptions": [{"date": "2030-01-08"}]
+        })
+        assert response.status_code == 200
+        slots = get("/api/calendar/free", params={"user_id": TEST_USER, "start": self.START, "days": 7}).json()["slots"]
+        requests.delete(f"{BASE_URL}/api/calendar/availability", params={"user_id": TEST_USER})
+        assert slots and all(9 <= s["hour"] and s["hour"] + s["hours"] <= 17 for s in slots)
+        assert {s["dayIndex"] for s in slots} == {0, 2, 3, 4}
+        print(f"✓ Template expanded to {len(slots)} free runs")
+    
+    def test_invalid_block_rejected(self):
+        """Out-of-range hours are rejected"""
+        response = post("/api/calendar/blocks", json={"user_id": TEST_USER, "date": self.START, "hour": 25})
+        assert response.status_code == 400
+        print(f"✓ Invalid block rejected")
+    
+    def test_non_integer_availability_hours_rejected(self):
+        """String or fractional window hours are a 400, not a 500"""
+        for window in ({"date": self.START, "hour": "9", "hours": 8}, {"date": self.START, "hour": 9, "hours": 1.5}):
+            response = requests.put(f"{BASE_URL}/api/calendar/availability", json={
+                "user_id": TEST_USER, "windows": [window]
+            })
+            assert response.status_code == 400
+        print(f"✓ Non-integer availability hours rejected")
 
 
 class TestStatsAndRPG:
@@ -242,6 +558,214 @@ class TestStatsAndRPG:
         assert stats["level"] == 5
         assert stats["endurance"] == 50
         print(f"✓ Stats updated successfully")
+    
+    def test_patch_stats_applies_deltas(self):
+        """PATCH increments counters and adds badges"""
+        before = get("/api/stats", params={"user_id": TEST_USER}).json()
+        response = requests.patch(f"{BASE_URL}/api/stats", params={"user_id": TEST_USER}, json={
+            "inc": {"xp": 25},
+            "add_badges": ["Patched"]
+        })
+        assert response.status_code == 200
+        after = response.json()
+        assert after["xp"] == before["xp"] + 25
+        assert after["badges"].count("Patched") == 1
+        assert after["version"] == before["version"] + 1
+        print(f"✓ Stats patched: {before['xp']} → {after['xp']} XP")
+    
+    def test_patch_stats_version_conflict(self):
+        """Stale expected_version is rejected with 409"""
+        current = get("/api/stats", params={"user_id": TEST_USER}).json()
+        response = requests.patch(f"{BASE_URL}/api/stats", params={"user_id": TEST_USER}, json={
+            "set": {"title": "Prefect"},
+            "expected_version": current["version"] - 1
+        })
+        assert response.status_code == 409
+        print(f"✓ Stale version rejected")
+
+    def test_patch_stats_set_checks_types(self):
+        """set values must match the field's type"""
+        for bad in ({"title": 3}, {"level": "7"}):
+            response = requests.patch(f"{BASE_URL}/api/stats", params={"user_id": TEST_USER}, json={"set": bad})
+            assert response.status_code == 400
+        print(f"✓ Mistyped set values rejected")
+
+
+class TestProfile:
+    """Test combined balance + stats profile endpoint"""
+    
+    def test_profile_returns_balance_and_stats(self):
+        """Profile bundles balance and RPG stats in one response"""
+        response = get("/api/profile", params={"user_id": TEST_USER})
+        assert response.status_code == 200
+        data = response.json()
+        
+        balance = get("/api/balance", params={"user_id": TEST_USER}).json()
+        assert data["balance"]["balance"] == balance["balance"]
+        assert data["stats"]["level"] >= 1
+        print(f"✓ Profile: {data['balance']['balance']} Mana, Level {data['stats']['level']}")
+    
+    def test_profile_field_projection(self):
+        """Only requested fields are returned"""
+        response = get("/api/profile", params={"user_id": TEST_USER, "fields": "balance,xp"})
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["balance"]) == {"balance"}
+        assert set(data["stats"]) == {"xp"}
+        print(f"✓ Projection respected")
+    
+    def test_profile_unknown_field_rejected(self):
+        """Unknown field names return 400"""
+        response = get("/api/profile", params={"user_id": TEST_USER, "fields": "wand_length"})
+        assert response.status_code == 400
+        print(f"✓ Unknown field rejected")
+
+
+class TestHistory:
+    """Test daily wager rollups"""
+    
+    def test_history_counts_settlements(self):
+        """Settled wagers show up in today's rollup"""
+        before = get("/api/history", params={"user_id": TEST_USER, "days": 7}).json()
+        assert len(before["days"]) == 7
+        
+        post("/api/wager/complete", json={
+            "user_id": TEST_USER,
+            "task_id": "history_task",
+            "stake": 10,
+            "bounty": 30,
+            "won": True,
+            "minutes_focused": 5
+        })
+        after = get("/api/history", params={"user_id": TEST_USER, "days": 7}).json()
+        today_before, today_after = before["days"][-1], after["days"][-1]
+        assert today_after["wins"] == today_before["wins"] + 1
+        assert today_after["bounty"] == today_before["bounty"] + 30
+        assert today_after["minutes_focused"] == today_before["minutes_focused"] + 5
+        print(f"✓ Rollup updated: {today_after}")
+
+
+class TestLeaderboard:
+    """Test ranked leaderboards"""
+    
+    def test_top_is_sorted(self):
+        """Top entries come back highest first with sequential ranks"""
+        response = get("/api/leaderboard/total_earned", params={"limit": 5})
+        assert response.status_code == 200
+        entries = response.json()["entries"]
+        scores = [e["total_earned"] for e in entries]
+        assert scores == sorted(scores, reverse=True)
+        assert [e["rank"] for e in entries] == list(range(1, len(entries) + 1))
+        print(f"✓ Leaderboard top {len(entries)} sorted")
+    
+    def test_rank_tracks_wins(self):
+        """Winning a wager is reflected in quests_completed rank"""
+        post("/api/wager/complete", json={
+            "user_id": TEST_USER,
+            "task_id": "leaderboard_task",
+            "stake": 5,
+            "bounty": 15,
+            "won": True
+        })
+        balance = get("/api/balance", params={"user_id": TEST_USER}).json()
+        response = get("/api/leaderboard/quests_completed/rank", params={"user_id": TEST_USER})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["quests_completed"] == balance["quests_completed"]
+        assert 1 <= data["rank"] <= data["total"]
+        print(f"✓ Rank {data['rank']} of {data['total']}")
+    
+    def test_unknown_metric(self):
+        """Unknown metric returns 404"""
+        response = get("/api/leaderboard/wand_length")
+        assert response.status_code == 404
+        print(f"✓ Unknown metric rejected")
+
+
+class TestBatch:
+    """Test multiplexed /api/batch endpoint"""
+    
+    def test_batch_returns_results_in_order(self):
+        """Reads and writes in one request come back in order"""
+        response = post("/api/batch", json={"operations": [
+            {"id": "a", "op": "balance", "args": {"user_id": TEST_USER}},
+            {"id": "b", "op": "wager.start", "args": {"user_id": TEST_USER, "task_id": "batch_task", "stake": 3}},
+            {"id": "c", "op": "balance", "args": {"user_id": TEST_USER}},
+            {"id": "d", "op": "stats", "args": {"user_id": TEST_USER}},
+        ]})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["id"] for r in results] == ["a", "b", "c", "d"]
+        assert all(r["status"] == 200 for r in results)
+        # The second balance read is ordered after the wager on the same user
+        assert results[2]["body"]["balance"] == results[0]["body"]["balance"] - 3
+        print(f"✓ Batch of {len(results)} operations")
+    
+    def test_batch_reports_per_operation_errors(self):
+        """A failing operation doesn't fail the whole batch"""
+        response = post("/api/batch", json={"operations": [
+            {"op": "no_such_op"},
+            {"op": "balance", "args": {"user_id": TEST_USER}},
+        ]})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["status"] == 400
+        assert results[1]["status"] == 200
+        print(f"✓ Per-operation errors reported")
+
+    def test_batch_coerces_and_validates_args(self):
+        """Args are checked like query strings: numeric strings coerce, junk is a 422"""
+        response = post("/api/batch", json={"operations": [
+            {"op": "leaderboard", "args": {"metric": "total_earned", "limit": "2"}},
+            {"op": "leaderboard", "args": {"metric": "total_earned", "limit": "lots"}},
+            {"op": "balance", "args": {"user_id": TEST_USER, "no_such_arg": 1}},
+        ]})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["status"] == 200
+        assert len(results[0]["body"]["entries"]) <= 2
+        assert results[1]["status"] == 422
+        assert results[2]["status"] == 422
+        print(f"✓ Batch args validated per operation")
+
+
+class TestConditionalGet:
+    """Test ETags and If-None-Match on balance and stats"""
+    
+    def test_unchanged_balance_returns_304(self):
+        """A matching ETag is answered with 304 and no body"""
+        first = get("/api/balance", params={"user_id": TEST_USER})
+        tag = first.headers.get("ETag")
+        assert tag
+        
+        again = get("/api/balance", params={"user_id": TEST_USER}, headers={"If-None-Match": tag})
+        assert again.status_code == 304
+        assert again.headers.get("ETag") == tag
+        assert not again.content
+        print(f"✓ Balance not modified: {tag}")
+    
+    def test_write_changes_etag(self):
+        """A wager invalidates the balance ETag"""
+        tag = get("/api/balance", params={"user_id": TEST_USER}).headers["ETag"]
+        post("/api/wager/start", json={"user_id": TEST_USER, "task_id": "etag_task", "stake": 1})
+        
+        response = get("/api/balance", params={"user_id": TEST_USER}, headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != tag
+        print(f"✓ Balance ETag moved: {tag} → {response.headers['ETag']}")
+    
+    def test_stats_etag_tracks_version(self):
+        """Stats ETag follows the stats version"""
+        first = get("/api/stats", params={"user_id": TEST_USER})
+        tag = first.headers["ETag"]
+        assert get("/api/stats", params={"user_id": TEST_USER}, headers={"If-None-Match": tag}).status_code == 304
+        
+        patch = requests.patch(f"{BASE_URL}/api/stats", params={"user_id": TEST_USER}, json={"inc": {"xp": 1}})
+        assert patch.status_code == 200
+        response = get("/api/stats", params={"user_id": TEST_USER}, headers={"If-None-Match": tag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] == f'W/"s{response.json()["version"]}"'
+        print(f"✓ Stats ETag follows version {response.json()['version']}")
 
 
 class TestHealthEndpoint:
@@ -254,6 +778,22 @@ class TestHealthEndpoint:
         data = response.json()
         assert data["status"] == "ok"
         print(f"✓ Health check passed")
+    
+    def test_liveness(self):
+        """Liveness probe returns OK"""
+        response = get("/live")
+        assert response.status_code == 200
+        print(f"✓ Liveness probe passed")
+    
+    def test_readiness_reports_dependencies(self):
+        """Readiness probe is ready and lists each dependency check"""
+        response = get("/ready")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["checks"]["mongo"]["ok"]
+        assert "ai" in data["checks"]
+        print(f"✓ Ready: {', '.join(name for name, c in data['checks'].items() if c['ok'])}")
 
 
 class TestEdgeCases:
@@ -295,9 +835,18 @@ def run_all_tests():
     test_classes = [
         TestHealthEndpoint,  # Run first to verify API
         TestWagerMechanics,
+        TestIdempotency,
         TestAIBreakdown,
+        TestQuestLogs,
         TestAIScheduler,
+        TestScheduleReplan,
+        TestCalendar,
         TestStatsAndRPG,
+        TestProfile,
+        TestLeaderboard,
+        TestHistory,
+        TestBatch,
+        TestConditionalGet,
         TestEdgeCases
     ]
     
@@ -30,33 +30,35 @@ and a conclusion. Use at least 3 credible sources.
 
 breakdown_resp = requests.post(
     f"{BASE_URL}/api/breakdown",
-    json={"assignment_text": assignment, "user_id": "e2e_test_user"}
+    json={"assignment": assignment, "taskCount": 3, "user_id": "e2e_test_user"}
 )
 
 if breakdown_resp.status_code != 200:
     print(f"   ✗ FAIL: {breakdown_resp.status_code} - {breakdown_resp.text}")
     exit(1)
 
-quest_log = breakdown_resp.json()["quest_log"]
-tasks = quest_log["tasks"]
+tasks = breakdown_resp.json()["tasks"]
+# /api/breakdown prices each task; the wager below uses the first task's terms
+if not all("stake" in t and "bounty" in t for t in tasks):
+    print(f"   ✗ FAIL: tasks missing stake/bounty - {tasks}")
+    exit(1)
+stake, bounty = tasks[0]["stake"], tasks[0]["bounty"]
 print(f"   ✓ AI generated {len(tasks)} micro-tasks")
-print(f"   Sample task: '{tasks[0]['title']}'")
-print(f"   Stake: {tasks[0]['required_stake']} Mana, Bounty: {tasks[0]['reward_bounty']} Mana")
+print(f"   Sample task: '{tasks[0]['title']}' ({tasks[0]['estimatedTime']})")
+print(f"   Stake: {stake} Mana, Bounty: {bounty} Mana")
 print("")
 
 # Test 3: User accepts a wager (stakes Mana on completing a task)
 print("3. Accepting wager on first task...")
 task = tasks[0]
+duration_minutes = int(task["estimatedTime"].split()[0])
 
 wager_resp = requests.post(
     f"{BASE_URL}/api/wager/start",
     json={
         "user_id": "e2e_test_user",
         "task_id": task["id"],
-        "task_title": task["title"],
-        "stake": task["required_stake"],
-        "bounty": task["reward_bounty"],
-        "duration_seconds": task["duration_minutes"] * 60
+        "stake": stake
     }
 )
 
@@ -65,9 +67,9 @@ if wager_resp.status_code != 200:
     exit(1)
 
 wager_data = wager_resp.json()
-print(f"   ✓ Wager started: {task['required_stake']} Mana staked")
+print(f"   ✓ Wager started: {stake} Mana staked")
 print(f"   Balance after stake: {wager_data['new_balance']} Mana")
-print(f"   Timer: {task['duration_minutes']} minutes")
+print(f"   Timer: {duration_minutes} minutes")
 print("")
 
 # Test 4: User completes the task and wins the wager
@@ -77,9 +79,11 @@ completion_resp = requests.post(
     json={
         "user_id": "e2e_test_user",
         "task_id": task["id"],
-        "bounty": task["reward_bounty"],
-        "stake": task["required_stake"],
-        "won": True
+        "bounty": bounty,
+        "stake": stake,
+        "won": True,
+        "minutes_focused": duration_minutes,
+        "duration_minutes": duration_minutes
     }
 )
 
@@ -89,15 +93,15 @@ if completion_resp.status_code != 200:
 
 completion_data = completion_resp.json()
 print(f"   ✓ Task completed! Bounty + stake returned")
-print(f"   Earned: {task['reward_bounty']} + {task['required_stake']} = {task['reward_bounty'] + task['required_stake']} Mana")
+print(f"   Earned: {bounty} + {stake} = {bounty + stake} Mana")
 print(f"   New balance: {completion_data['new_balance']} Mana")
+print(f"   Level {completion_data['stats']['level']}, {completion_data['stats']['xp']} XP")
 print("")
 
 # Test 5: Verify balance increased correctly
 print("5. Verifying balance update...")
 final_balance_resp = requests.get(f"{BASE_URL}/api/balance?user_id=e2e_test_user")
 final_balance = final_balance_resp.json()["balance"]
-expected_gain = task['reward_bounty'] + task['required_stake'] - task['required_stake']  # Net gain is just bounty
 
 if final_balance > initial_balance:
     print(f"   ✓ Balance increased: {initial_balance} → {final_balance} (+{final_balance - initial_balance} Mana)")
@@ -113,10 +117,7 @@ lose_wager_resp = requests.post(
     json={
         "user_id": "e2e_test_user",
         "task_id": "fail_task",
-        "task_title": "This one will fail",
-        "stake": 10,
-        "bounty": 30,
-        "duration_seconds": 300
+        "stake": 10
     }
 )
 
@@ -0,0 +1,373 @@
+"""
+ChronoCharm - Tracing
+OpenTelemetry-shaped spans for requests, ledger/AI operations and Mongo commands
+
+Enable with TRACING_ENABLED=1. Spans nest through a ContextVar:
+    SERVER  "POST /api/wager/start"        (TracingMiddleware)
+    INTERNAL "mongo.deduct_stake"          (every metrics.track'ed call)
+    CLIENT  "mongo find users"             (pymongo command listener, one per round trip)
+
+TRACE_EXPORTERS is a comma-separated list of "memory" (recent spans kept
+for /api/admin/traces, bounded by TRACE_MEMORY_SPANS) and "jsonl" (one
+span per line appended to TRACE_FILE by a writer thread). Whole traces are
+sampled at the root with TRACE_SAMPLE_RATE, and an incoming W3C
+traceparent header joins the caller's trace.
+"""
+
+import contextlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Optional
+
+from log import get_logger
+from metrics import add_operation_hook
+
+try:
+    from pymongo import monitoring
+except ImportError:  # Only the Mongo command listener needs it
+    monitoring = None
+
+logger = get_logger("tracing")
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "").lower() in ("1", "true", "yes")
+TRACE_EXPORTERS = tuple(e.strip() for e in os.getenv("TRACE_EXPORTERS", "memory").split(",") if e.strip())
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_MEMORY_SPANS = int(os.getenv("TRACE_MEMORY_SPANS", "10000"))
+
+SERVICE_NAME = "chronocharm"
+
+# "not sampled" is remembered for the whole trace so children skip cheaply
+_UNSAMPLED = object()
+_current: ContextVar = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation, with the fields of an OpenTelemetry span"""
+
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "status_message")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_span_id: Optional[str],
+                 attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = "UNSET"
+        self.status_message: Optional[str] = None
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        if self.status == "UNSET":
+            self.status = "OK"
+        tracer.export(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        """OTLP/JSON field names; attributes stay a flat mapping"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}", "message": self.status_message or ""},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class MemoryExporter:
+    """Most recent spans, bounded"""
+
+    def __init__(self, capacity: int = TRACE_MEMORY_SPANS):
+        self.spans: deque = deque(maxlen=capacity)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def traces(self) -> "OrderedDict[str, list[Span]]":
+        """Spans grouped by trace, oldest trace first"""
+        grouped: OrderedDict = OrderedDict()
+        for span in list(self.spans):
+            grouped.setdefault(span.trace_id, []).append(span)
+        return grouped
+
+
+class JsonlExporter:
+    """Appends one JSON span per line from a writer thread, off the event loop"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+
+    def _run(self) -> None:
+        with open(self.path, "a") as f:
+            while True:
+                record = self._queue.get()
+                f.write(json.dumps(record, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.exporters: list = []
+        self.memory: Optional[MemoryExporter] = None
+
+    def configure(self, exporters: tuple = TRACE_EXPORTERS) -> None:
+        """Create exporters and hook tracked operations (idempotent)"""
+        if self.exporters:
+            return
+        for name in exporters:
+            if name == "memory":
+                self.memory = MemoryExporter()
+                self.exporters.append(self.memory)
+            elif name == "jsonl":
+                self.exporters.append(JsonlExporter())
+            else:
+                logger.warning("unknown_trace_exporter", extra={"exporter": name})
+        add_operation_hook(operation_span)
+        logger.info("tracing_enabled", extra={"exporters": list(exporters), "trace_sample_rate": self.sample_rate})
+
+    def export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def start_span(self, name: str, kind: str = "INTERNAL", attributes: Optional[dict] = None,
+                   parent: Optional[tuple] = None) -> Optional[Span]:
+        """
+        New span under the current one (or under `parent`, a (trace_id,
+        span_id, sampled) tuple from traceparent). Returns None when the
+        trace isn't sampled; does not make the span current.
+        """
+        current = _current.get()
+        if current is _UNSAMPLED:
+            return None
+        if isinstance(current, Span):
+            return Span(name, kind, current.trace_id, current.span_id, attributes)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            return Span(name, kind, trace_id, parent_id, attributes) if sampled else None
+        if random.random() >= self.sample_rate:
+            return None
+        return Span(name, kind, f"{random.getrandbits(128):032x}", None, attributes)
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = "INTERNAL", attributes: Optional[dict] = None,
+             parent: Optional[tuple] = None):
+        """Run a block inside a new current span (None if unsampled)"""
+        span = self.start_span(name, kind, attributes, parent)
+        token = _current.set(span if span is not None else _UNSAMPLED)
+        try:
+            yield span
+        except BaseException as e:
+            if span is not None:
+                span.set_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            if span is not None:
+                span.end()
+
+
+tracer = Tracer()
+
+
+def current_span() -> Optional[Span]:
+    span = _current.get()
+    return span if isinstance(span, Span) else None
+
+
+def operation_span(component: str, operation: str):
+    """metrics.track hook: a span around every tracked ledger/AI call"""
+    if _current.get() is None:
+        # Outside any request (startup, CLI tools): don't start new traces
+        return contextlib.nullcontext()
+    return tracer.span(f"{component}.{operation}", attributes={"component": component})
+
+
+# === W3C trace context ===
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """(trace_id, parent_span_id, sampled) from a traceparent header, or None"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3][:2], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if set(parts[1]) == {"0"} or set(parts[2]) == {"0"}:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def format_traceparent(span: Span) -> str:
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+# === Analysis ===
+
+def summarize(spans: list[Span]) -> dict:
+    """Round-trip counts and critical path of one trace"""
+    by_parent: dict = {}
+    ids = {span.span_id for span in spans}
+    for span in spans:
+        by_parent.setdefault(span.parent_span_id, []).append(span)
+    roots = [span for span in spans if span.parent_span_id not in ids]
+    root = max(roots, key=lambda s: s.duration_ms)
+
+    # Critical path: from the root, repeatedly follow the child that finished last
+    path = [root]
+    while by_parent.get(path[-1].span_id):
+        path.append(max(by_parent[path[-1].span_id], key=lambda s: s.end_ns or 0))
+
+    return {
+        "trace_id": root.trace_id,
+        "name": root.name,
+        "start_ns": root.start_ns,
+        "duration_ms": round(root.duration_ms, 2),
+        "status": root.status,
+        "spans": len(spans),
+        "mongo_round_trips": sum(1 for s in spans if s.attributes.get("db.system") == "mongodb"),
+        "llm_calls": sum(1 for s in spans if s.attributes.get("component") == "llm"),
+        "critical_path": [{"name": s.name, "duration_ms": round(s.duration_ms, 2)} for s in path],
+    }
+
+
+# === Instrumentation ===
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening the SERVER span of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+        tracer.configure()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        with tracer.span(f"{scope['method']} {scope['path']}", "SERVER", {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        }, parent=parent) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.attributes["http.status_code"] = message["status"]
+                    if message["status"] >= 500:
+                        span.status = "ERROR"
+                    message = dict(message, headers=[
+                        *message.get("headers", []),
+                        (b"traceparent", format_traceparent(span).encode()),
+                    ])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    # Name by route template so spans group like the metrics do
+                    span.name = f"{scope['method']} {route}"
+                    span.attributes["http.route"] = route
+
+
+if monitoring is not None:
+    class MongoCommandTracer(monitoring.CommandListener):
+        """
+        CLIENT span per Mongo command, i.e. per round trip
+
+        Motor runs commands on executor threads with the caller's context
+        copied, so the current span is the ledger operation that issued it.
+        """
+
+        def __init__(self):
+            self._inflight: dict = {}
+            self._lock = threading.Lock()
+
+        @staticmethod
+        def _key(event) -> tuple:
+            return event.request_id, event.connection_id, event.operation_id
+
+        def started(self, event) -> None:
+            if current_span() is None:
+                return  # Startup, background tasks and unsampled requests
+            target = event.command.get(event.command_name)
+            attributes = {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "net.peer": f"{event.connection_id[0]}:{event.connection_id[1]}",
+            }
+            if isinstance(target, str):
+                attributes["db.mongodb.collection"] = target
+            span = tracer.start_span(
+                f"mongo {event.command_name} {target}" if isinstance(target, str) else f"mongo {event.command_name}",
+                "CLIENT", attributes
+            )
+            if span is not None:
+                with self._lock:
+                    self._inflight[self._key(event)] = span
+
+        def _finish(self, event, error: Optional[str] = None) -> None:
+            with self._lock:
+                span = self._inflight.pop(self._key(event), None)
+            if span is None:
+                return
+            span.attributes["db.duration_us"] = event.duration_micros
+            if error:
+                span.status = "ERROR"
+                span.status_message = error
+            span.end()
+
+        def succeeded(self, event) -> None:
+            self._finish(event)
+
+        def failed(self, event) -> None:
+            self._finish(event, str(event.failure))
+
+
+def mongo_listeners() -> list:
+    """Command listeners to pass to each Mongo client (none unless tracing)"""
+    if not TRACING_ENABLED or monitoring is None:
+        return []
+    tracer.configure()
+    return [MongoCommandTracer()]
@@ -0,0 +1,230 @@
+"""
+ChronoCharm - Ledger Export/Import
+Streams collections to and from NDJSON in constant memory
+
+CLI usage (from backend/):
+    python transfer.py export users > users.ndjson
+    python transfer.py import users users.ndjson --mode upsert
+"""
+
+import argparse
+import asyncio
+import sys
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+from bson import json_util
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from database import Database
+from versions import VERSION_FIELDS, versions
+from log import get_logger
+
+logger = get_logger("transfer")
+
+EXPORTABLE_COLLECTIONS = ("users", "stats", "daily_rollups", "schedules", "calendars", "quest_logs")
+IMPORT_MODES = ("insert", "upsert")
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+
+def check_collection(name: str) -> str:
+    """Validate a collection name against the exportable set"""
+    if name not in EXPORTABLE_COLLECTIONS:
+        raise ValueError(f"Unknown collection '{name}'. Choose from: {', '.join(EXPORTABLE_COLLECTIONS)}")
+    return name
+
+
+async def export_ndjson(collection: str, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """
+    Yield a collection as NDJSON, one chunk per cursor batch
+
+    Each shard is walked in _id order through a batched cursor, so memory
+    stays bounded by batch_size regardless of collection size. Extended JSON
+    keeps ObjectIds and dates round-trippable through import_ndjson.
+    """
+    check_collection(collection)
+    lines = []
+    for db in Database.all_dbs():
+        cursor = db[collection].find({}).sort("_id", 1).batch_size(batch_size)
+        async for doc in cursor:
+            lines.append(json_util.dumps(doc, json_options=JSON_OPTIONS))
+            if len(lines) >= batch_size:
+                yield ("\n".join(lines) + "\n").encode()
+                lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Re-split an arbitrary byte stream into lines"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            yield line
+    if pending:
+        yield pending
+
+
+async def _aiter(lines: Iterable[bytes]) -> AsyncIterator[bytes]:
+    for line in lines:
+        yield line
+
+
+def _group_by_shard(batch: dict) -> dict:
+    """Merge per-user document lists into one list per shard, keyed by a representative user_id"""
+    grouped = {}
+    shard_owner = {}
+    for user_id, docs in batch.items():
+        shard = id(Database.get_db(user_id))
+        representative = shard_owner.setdefault(shard, user_id)
+        grouped.setdefault(representative, []).extend(docs)
+    return grouped
+
+
+def _write_op(doc: dict, mode: str):
+    if mode == "upsert" and "_id" in doc:
+        return ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+    return InsertOne(doc)
+
+
+async def _advance_versions(users, docs: list) -> None:
+    """
+    Move imported users' version counters past the stored ones
+
+    ETags and every worker's version map are keyed on these counters, which
+    only ever grow; an import that rewound or kept them would go on
+    answering 304 for the document it replaced.
+    """
+    user_ids = [doc["user_id"] for doc in docs if "user_id" in doc]
+    projection = {"_id": 0, "user_id": 1, **{field: 1 for field in VERSION_FIELDS.values()}}
+    stored = {user["user_id"]: user async for user in users.find({"user_id": {"$in": user_ids}}, projection)}
+    for doc in docs:
+        current = stored.get(doc.get("user_id"), {})
+        for field in VERSION_FIELDS.values():
+            doc[field] = max(doc.get(field) or 0, current.get(field) or 0) + 1
+
+
+async def import_ndjson(collection: str, lines: AsyncIterable[bytes], mode: str = "upsert",
+                        batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Load NDJSON documents into a collection with unordered bulk writes
+
+    mode="insert" uses InsertOne and counts duplicate keys as skipped;
+    mode="upsert" replaces by _id so re-running an import is idempotent.
+    Imported users get version counters newer than the stored ones, so
+    no worker answers a conditional GET with the replaced document's ETag.
+    Documents are routed to their user's shard. Parsing of the next batch
+    overlaps with the previous batch's writes, and at most two batches are
+    held in memory at once.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode '{mode}'. Choose from: {', '.join(IMPORT_MODES)}")
+    check_collection(collection)
+    totals = {"read": 0, "written": 0, "skipped": 0, "batches": 0}
+
+    async def write_shard(coll, docs: list) -> None:
+        if collection == "users":
+            await _advance_versions(coll, docs)
+        skipped = set()
+        try:
+            result = await coll.bulk_write([_write_op(doc, mode) for doc in docs], ordered=False)
+            totals["written"] += result.inserted_count + result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            details = e.details
+            totals["written"] += details.get("nInserted", 0) + details.get("nUpserted", 0) + details.get("nModified", 0)
+            duplicates = [err for err in details.get("writeErrors", []) if err.get("code") == 11000]
+            if len(duplicates) != len(details.get("writeErrors", [])):
+                raise
+            totals["skipped"] += len(duplicates)
+            skipped = {err["index"] for err in duplicates}
+        if collection == "users":
+            # This worker's map at once; other workers via change streams or VERSION_MAP_TTL
+            for index, doc in enumerate(docs):
+                if index not in skipped:
+                    versions.record(doc)
+
+    async def write(batch: dict) -> None:
+        await asyncio.gather(*(
+            write_shard(Database.get_db(user_id)[collection], docs)
+            for user_id, docs in _group_by_shard(batch).items()
+        ))
+        totals["batches"] += 1
+
+    in_flight = None
+    docs = {}
+    pending = 0
+    try:
+        async for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            doc = json_util.loads(line, json_options=JSON_OPTIONS)
+            totals["read"] += 1
+            docs.setdefault(doc.get("user_id"), []).append(doc)
+            pending += 1
+            if pending >= batch_size:
+                if in_flight:
+                    await in_flight
+                in_flight = asyncio.ensure_future(write(docs))
+                docs, pending = {}, 0
+    finally:
+        # A bad line must not leave the previous batch writing after we return
+        if in_flight:
+            await in_flight
+    if docs:
+        await write(docs)
+
+    logger.info("import_finished", extra={"collection": collection, **totals})
+    return totals
+
+
+async def _main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Export/import ChronoCharm collections as NDJSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Write a collection to NDJSON")
+    export.add_argument("collection", choices=EXPORTABLE_COLLECTIONS)
+    export.add_argument("--out", help="Output file (default: stdout)")
+    export.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+
+    load = sub.add_parser("import", help="Load NDJSON into a collection")
+    load.add_argument("collection", choices=EXPORTABLE_COLLECTIONS)
+    load.add_argument("path", help="NDJSON file ('-' for stdin)")
+    load.add_argument("--mode", choices=IMPORT_MODES, default="upsert")
+    load.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    args = parser.parse_args(argv)
+    await _run(args)
+    return 0
+
+
+async def _run(args: argparse.Namespace) -> None:
+    await Database.connect()
+    try:
+        if args.command == "export":
+            out = open(args.out, "wb") if args.out else sys.stdout.buffer
+            try:
+                async for chunk in export_ndjson(args.collection, args.batch_size):
+                    out.write(chunk)
+            finally:
+                if args.out:
+                    out.close()
+        else:
+            source = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+            try:
+                await import_ndjson(args.collection, _aiter(source), args.mode, args.batch_size)
+            finally:
+                if args.path != "-":
+                    source.close()
+    finally:
+        await Database.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
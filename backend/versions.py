@@ -0,0 +1,78 @@
+"""
+ChronoCharm - Ledger Version Map
+In-memory per-user version counters backing ETags on balance and stats
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from events import USE_CHANGE_STREAMS
+from metrics import cache_lookup
+
+# Seconds a locally recorded version stays trusted for conditional GETs, so
+# with several workers and no change streams a write made on another worker
+# is answered with a stale 304 for at most this long. 0 = forever, safe only
+# for a single worker; with EVENTS_CHANGE_STREAMS every worker's map is kept
+# current and the TTL is ignored.
+VERSION_MAP_TTL = float(os.getenv("VERSION_MAP_TTL", "5"))
+
+VERSION_FIELDS = {"balance": "balance_version", "stats": "stats_version"}
+
+
+def etag(kind: str, version: int) -> str:
+    return f'W/"{kind[0]}{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or tag in (t.strip() for t in if_none_match.split(","))
+
+
+class VersionMap:
+    """
+    Latest known balance/stats version per user, bounded LRU
+
+    Fed from every ledger write (and from change streams when enabled), so
+    an If-None-Match that matches the recorded version can be answered with
+    304 without reading Mongo.
+    """
+
+    CAPACITY = 100_000
+
+    def __init__(self, ttl: float = VERSION_MAP_TTL, capacity: int = CAPACITY):
+        self.ttl = 0 if USE_CHANGE_STREAMS else ttl
+        self.capacity = capacity
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+    def record(self, user: Optional[dict]) -> None:
+        """Remember whichever version counters a (possibly partial) user document carries"""
+        if not user or "user_id" not in user:
+            return
+        known = {kind: user[field] for kind, field in VERSION_FIELDS.items() if field in user}
+        if not known:
+            return
+        entry = self._entries.setdefault(user["user_id"], {})
+        # Counters only ever $inc, so a slow read finishing after a newer
+        # write must not roll the recorded version back
+        for kind, version in known.items():
+            if version >= entry.get(kind, -1):
+                entry[kind] = version
+        entry["at"] = time.monotonic()
+        self._entries.move_to_end(user["user_id"])
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id: str, kind: str) -> Optional[int]:
+        """Trusted version for a user, or None if unknown or stale"""
+        entry = self._entries.get(user_id)
+        version = entry.get(kind) if entry else None
+        if version is not None and self.ttl and time.monotonic() - entry["at"] > self.ttl:
+            version = None
+        cache_lookup("version_map", version is not None)
+        return version
+
+
+versions = VersionMap()
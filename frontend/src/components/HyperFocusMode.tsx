@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { Task } from '../data/mockData';
 import { WaxSeal } from './WaxSeal';
 import { Confetti } from './Confetti';
-import { useStats } from '../contexts/StatsContext';
+import { useStats, toDayKey } from '../contexts/StatsContext';
 import { voiceService } from '../services/elevenlabs';
 import axios from 'axios';
 
@@ -20,7 +20,7 @@ export const HyperFocusMode: React.FC<HyperFocusModeProps> = ({ task, onComplete
   const [hasSpokenEncouragement, setHasSpokenEncouragement] = useState(false);
   const [hasSpokenWarning, setHasSpokenWarning] = useState(false);
   const hasSpokenStartRef = useRef(false);
-  const { addXP, completeTaskForDay } = useStats();
+  const { addXP, applyServerStats, completeTaskForDay } = useStats();
 
   const totalTime = (task.estimatedMinutes || 5) * 60;
   const stake = task.stake || 20;
@@ -95,29 +95,27 @@ export const HyperFocusMode: React.FC<HyperFocusModeProps> = ({ task, onComplete
     setShowWaxSeal(true);
     setShowConfetti(true);
 
-    // Award XP
-    addXP(bounty);
-    
-    // Update daily streak and Endurance
-    completeTaskForDay();
-
-    // Record win on backend
+    // Record win on backend; XP, streak and level-ups are applied server-side
+    const timeUsed = totalTime - timeLeft;
     try {
-      await axios.post('http://127.0.0.1:8004/api/wager/complete', {
+      const response = await axios.post('http://127.0.0.1:8004/api/wager/complete', {
         task_id: task.id,
         bounty,
         stake,
         won: true,
+        minutes_focused: Math.round(timeUsed / 60),
+        duration_minutes: Math.round(totalTime / 60),
+        day: toDayKey(new Date()),
       });
+      applyServerStats(response.data.stats);
     } catch (error) {
       console.error('Failed to record win:', error);
-    }
-
-    // Increase Focus stat if completed quickly
-    const timeUsed = totalTime - timeLeft;
-    if (timeUsed < totalTime * 0.8) {
-      // Completed in less than 80% of time - bonus!
-      addXP(10);
+      // Offline fallback: progress locally
+      addXP(bounty);
+      completeTaskForDay();
+      if (timeUsed < totalTime * 0.8) {
+        addXP(10);
+      }
     }
 
     setTimeout(() => {
@@ -23,12 +23,12 @@ export const ActiveBoard: React.FC = () => {
   const [editText, setEditText] = useState('');
 
   const { demoMode } = useDemo();
-  const { addXP } = useStats();
+  const { addXP, balance, refreshStats } = useStats();
 
-  // Load Mana balance
+  // Mana balance arrives with the stats in StatsContext's single profile request
   useEffect(() => {
-    loadBalance();
-  }, []);
+    if (balance !== null) setManaBalance(balance);
+  }, [balance]);
 
   // Auto-fill demo assignment in Fast mode
   useEffect(() => {
@@ -64,15 +64,6 @@ export const ActiveBoard: React.FC = () => {
     checkPendingBreakdown();
   }, []);
 
-  const loadBalance = async () => {
-    try {
-      const response = await axios.get('http://127.0.0.1:8004/api/balance');
-      setManaBalance(response.data.balance);
-    } catch (error) {
-      console.error('Failed to load balance:', error);
-    }
-  };
-
   const handleBreakdown = async () => {
     if (!assignment || assignment.trim() === '') {
       alert('Please enter an assignment!');
@@ -191,7 +182,7 @@ const mockData = {
       }
     }
     setActiveTask(null);
-    loadBalance(); // Refresh from backend
+    refreshStats(); // Refresh balance and stats from backend
   };
 
   const handleEditTask = (taskId: string, currentTitle: string) => {
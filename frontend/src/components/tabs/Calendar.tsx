@@ -1,7 +1,6 @@
 import React, { useState } from 'react';
 import { WaxSeal } from '../WaxSeal';
 import { Confetti } from '../Confetti';
-import { useStats } from '../../contexts/StatsContext';
 import { useDemo } from '../../contexts/DemoContext';
 import { HyperFocusMode } from '../HyperFocusMode';
 import axios from 'axios';
@@ -51,7 +50,6 @@ export const Calendar: React.FC = () => {
     stake: 10,
     bounty: 30,
   });
-  const { addXP, completeTaskForDay } = useStats();
   const { demoMode } = useDemo();
 
   // Sample tasks - now editable
@@ -265,9 +263,7 @@ export const Calendar: React.FC = () => {
         return newSchedule;
       });
 
-      // Award XP and update streak
-      addXP(activeTask.bounty);
-      completeTaskForDay();
+      // XP and streak were settled server-side by HyperFocusMode
 
       // Show celebration
       setShowWaxSeal(true);
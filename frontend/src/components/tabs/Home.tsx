@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import { useStats } from '../../contexts/StatsContext';
+import { useStats, toDayKey } from '../../contexts/StatsContext';
 import { useTheme } from '../../contexts/ThemeContext';
 
 interface HomeProps {
@@ -22,10 +22,10 @@ export const Home: React.FC<HomeProps> = ({ onNavigate }) => {
   const progressPercentage = (stats.xp / stats.xpToNextLevel) * 100;
 
   // Check if streak is in danger
-  const today = new Date().toDateString();
+  const today = toDayKey(new Date());
   const yesterday = new Date();
   yesterday.setDate(yesterday.getDate() - 1);
-  const yesterdayStr = yesterday.toDateString();
+  const yesterdayStr = toDayKey(yesterday);
   const streakInDanger = stats.lastCompletedDate !== today && stats.currentStreak > 0;
 
   return (
@@ -1,5 +1,8 @@
 import React, { createContext, useContext, useState, useEffect, ReactNode } from 'react';
 import axios from 'axios';
+import { api, toDayKey } from '../services/api';
+
+export { toDayKey };
 
 export interface RPGStats {
   endurance: number; // 0-100
@@ -14,9 +17,18 @@ export interface RPGStats {
   lastCompletedDate: string | null;
 }
 
+// Older builds stored toDateString() ("Mon Oct 19 2026"); ISO keys pass through untouched
+const normalizeDayKey = (value: string | null): string | null => {
+  if (!value || /^\d{4}-\d{2}-\d{2}$/.test(value)) return value;
+  const parsed = new Date(value);
+  return isNaN(parsed.getTime()) ? null : toDayKey(parsed);
+};
+
 interface StatsContextType {
   stats: RPGStats;
+  balance: number | null; // Mana, loaded with the stats in one /api/profile request
   addXP: (amount: number) => void;
+  applyServerStats: (stats: RPGStats) => void;
   refreshStats: () => Promise<void>;
   completeTaskForDay: () => void;
   isLoading: boolean;
@@ -58,14 +70,16 @@ export const StatsProvider: React.FC<{ children: ReactNode }> = ({ children }) =
     currentStreak: 0,
     lastCompletedDate: null,
   });
+  const [balance, setBalance] = useState<number | null>(null);
   const [isLoading, setIsLoading] = useState(false);
 
   const refreshStats = async () => {
     setIsLoading(true);
     try {
-      // Try to load from backend
-      const response = await axios.get('http://127.0.0.1:8004/api/stats');
-      setStats(response.data);
+      // Try to load from backend: stats and balance in one round trip
+      const profile = await api.getProfile();
+      setStats(profile.stats as unknown as RPGStats);
+      setBalance(profile.balance?.balance ?? null);
     } catch (error) {
       // Fallback to localStorage if backend is unavailable
       const saved = localStorage.getItem('rpgStats');
@@ -124,10 +138,16 @@ export const StatsProvider: React.FC<{ children: ReactNode }> = ({ children }) =
     });
   };
 
+  // Stats already computed and saved by the backend (e.g. returned from /api/wager/complete)
+  const applyServerStats = (serverStats: RPGStats) => {
+    localStorage.setItem('rpgStats', JSON.stringify(serverStats));
+    setStats(serverStats);
+  };
+
   const completeTaskForDay = () => {
     setStats(prevStats => {
-      const today = new Date().toDateString();
-      const lastCompleted = prevStats.lastCompletedDate;
+      const today = toDayKey(new Date());
+      const lastCompleted = normalizeDayKey(prevStats.lastCompletedDate);
 
       let newStreak = prevStats.currentStreak;
       let newEndurance = prevStats.endurance;
@@ -140,7 +160,7 @@ export const StatsProvider: React.FC<{ children: ReactNode }> = ({ children }) =
       // Check if streak should continue or reset
       const yesterday = new Date();
       yesterday.setDate(yesterday.getDate() - 1);
-      const yesterdayStr = yesterday.toDateString();
+      const yesterdayStr = toDayKey(yesterday);
 
       if (lastCompleted === yesterdayStr) {
         // Streak continues!
@@ -191,10 +211,21 @@ export const StatsProvider: React.FC<{ children: ReactNode }> = ({ children }) =
 
   useEffect(() => {
     refreshStats();
+    // Pushed changes from other tabs and devices; the socket opens with a full profile
+    return api.subscribe((event) => {
+      if (event.type === 'profile') {
+        setStats(event.data.stats as RPGStats);
+        setBalance(event.data.balance?.balance ?? null);
+      } else if (event.type === 'stats') {
+        applyServerStats(event.data as RPGStats);
+      } else if (event.type === 'balance') {
+        setBalance(event.data.balance);
+      }
+    });
   }, []);
 
   return (
-    <StatsContext.Provider value={{ stats, addXP, completeTaskForDay, refreshStats, isLoading }}>
+    <StatsContext.Provider value={{ stats, balance, addXP, applyServerStats, completeTaskForDay, refreshStats, isLoading }}>
       {children}
     </StatsContext.Provider>
   );
@@ -6,6 +6,15 @@
 import axios from 'axios'
 
 const API_BASE = 'http://localhost:8004/api'
+const WS_BASE = 'ws://localhost:8004/ws'
+
+// Local calendar day as YYYY-MM-DD; sent with wager completions so the backend
+// rolls streaks over at the user's midnight, not UTC's
+export const toDayKey = (date: Date): string => {
+  const month = String(date.getMonth() + 1).padStart(2, '0')
+  const day = String(date.getDate()).padStart(2, '0')
+  return `${date.getFullYear()}-${month}-${day}`
+}
 
 export interface MicroTask {
   id: string
@@ -28,6 +37,18 @@ export interface UserBalance {
   quests_completed: number
 }
 
+export interface UserProfile {
+  user_id: string
+  balance?: Partial<Omit<UserBalance, 'user_id'>>
+  stats?: Record<string, unknown>
+}
+
+export interface LiveEvent {
+  type: 'profile' | 'balance' | 'stats' | 'wager' | 'schedule' | 'calendar'
+  user_id: string
+  data: Record<string, any>
+}
+
 export interface BreakdownResponse {
   quest_log: QuestLog
   current_balance: number
@@ -61,6 +82,16 @@ class ChronoCharmAPI {
     return response.data
   }
 
+  /**
+   * Get balance and RPG stats in one request, optionally limited to `fields`
+   */
+  async getProfile(userId: string = 'default', fields?: string[]): Promise<UserProfile> {
+    const response = await axios.get<UserProfile>(`${API_BASE}/profile`, {
+      params: { user_id: userId, fields: fields?.join(',') }
+    })
+    return response.data
+  }
+
   /**
    * Break down an assignment into micro-tasks using AI
    */
@@ -99,11 +130,22 @@ class ChronoCharmAPI {
       bounty: bounty,
       stake: stake,
       won: won,
-      user_id: userId
+      user_id: userId,
+      day: toDayKey(new Date())
     })
     return response.data
   }
 
+  /**
+   * Subscribe to pushed balance, stats, wager, schedule and calendar updates instead of polling.
+   * Returns a function that closes the connection.
+   */
+  subscribe(onEvent: (event: LiveEvent) => void, userId: string = 'default'): () => void {
+    const socket = new WebSocket(`${WS_BASE}?user_id=${encodeURIComponent(userId)}`)
+    socket.onmessage = (message) => onEvent(JSON.parse(message.data))
+    return () => socket.close()
+  }
+
   /**
    * Reset user balance (for testing)
    */